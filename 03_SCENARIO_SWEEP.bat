@@ -0,0 +1,8 @@
+call C:\Users\gbilley\AppData\Local\anaconda3\condabin\activate.bat
+::call conda env create -f environment.yml
+::call conda env update -f environment.yml
+call conda activate soip-workflow-automation
+cd src
+python scenario_sweep.py
+call conda deactivate
+pause
\ No newline at end of file
@@ -0,0 +1,126 @@
+# =============================================================================
+# The purpose of this script is to compare the pandas and DuckDB backends of the transformation
+# stages in stage_backends.py.
+#
+# It builds synthetic tables shaped like the model's (customer fulfillment policy lanes, shipment
+# history, MultiSource List), runs every stage with both backends, checks that the results are
+# the same, and prints the run times. It does not connect to Cosmic Frog or the data warehouse.
+#
+# Run it from the src folder (DuckDB must be installed):
+#     python benchmark_stage_backends.py [number of customers, default 20000]
+# =============================================================================
+
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+
+from stage_backends import STAGES, duckdb
+
+
+def synthetic_lanes(n_customers, depots_per_customer, rng):
+# =============================================================================
+#     Returns customer fulfillment policy lanes (customername, sourcename, depottype, distance)
+#     and an eligible mask, like the inputs of the 020 closest depot ranking.
+# =============================================================================
+    n_depots = max(depots_per_customer, n_customers // 50)
+    depot_types = np.array(['Full Service', 'Sort Only', 'Storage', 'Manufacturing'], dtype=object)
+
+    customers = np.repeat([f'I{i:06d}' for i in range(n_customers)], depots_per_customer)
+    depot_ids = rng.integers(0, n_depots, len(customers))
+    lanes = pd.DataFrame({'customername': customers.astype(object),
+                          'sourcename': np.array([f'D{i:05d}' for i in depot_ids], dtype=object),
+                          'depottype': depot_types[depot_ids % len(depot_types)],
+                          # Rounded distances, so there are ties to break.
+                          'distance': rng.integers(0, 2000, len(customers)).astype(float)})
+    lanes.loc[rng.random(len(lanes)) < 0.01, 'distance'] = np.nan
+
+    eligible = lanes['depottype'].isin(['Full Service', 'Sort Only']) & (rng.random(len(lanes)) < 0.9)
+    return lanes, eligible
+
+
+def synthetic_shipments(n_lanes, carriers_per_lane, rng):
+# =============================================================================
+#     Returns shipment history summed per lane and carrier, like the input of the 060 cost per
+#     load stage.
+# =============================================================================
+    n = n_lanes * carriers_per_lane
+    lane_ids = rng.integers(0, n_lanes, n)
+    scacs = np.array([f'SC{i:02d}' for i in range(30)], dtype=object)
+    carrier_types = np.array(['Contract Carrier', 'CPU', 'Dedicated'], dtype=object)
+
+    scac_ids = rng.integers(0, len(scacs), n)
+    return pd.DataFrame({'movetype': np.array(['Issue', 'Return', 'Transfer'], dtype=object)[lane_ids % 3],
+                         'Lane_ID': np.array([f'{i:05d}-{i*7 % 99991:05d}' for i in lane_ids], dtype=object),
+                         'Depot': '', 'Customer': '',
+                         'SCAC': scacs[scac_ids],
+                         'Carrier_Type': carrier_types[scac_ids % len(carrier_types)],
+                         'Total_Loads': rng.integers(6, 60, n),
+                         'Ttl_LH_Cost': rng.random(n) * 50000})
+
+
+def synthetic_multi_source(lanes, rng):
+# =============================================================================
+#     Returns a MultiSource List (MoveType, OModelID, DModelID) for some of the given lanes,
+#     like the input of the 090 multi-source flags.
+# =============================================================================
+    listed = lanes[rng.random(len(lanes)) < 0.05]
+    return pd.DataFrame({'MoveType': 'Issue',
+                         'OModelID': listed['sourcename'].to_numpy(),
+                         'DModelID': listed['customername'].to_numpy()})
+
+
+def time_stage(function, *args, **kwargs):
+# =============================================================================
+#     Runs function(*args, **kwargs) and returns its result and its run time in seconds.
+# =============================================================================
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark(n_customers=20000, seed=0):
+# =============================================================================
+#     Runs every stage with both backends on synthetic data, checks that the results match, and
+#     returns the run times as a DataFrame (one row per stage).
+# =============================================================================
+    rng = np.random.default_rng(seed)
+    lanes, eligible = synthetic_lanes(n_customers, 20, rng)
+    shipments = synthetic_shipments(n_customers, 5, rng)
+    msl = synthetic_multi_source(lanes, rng)
+
+    stage_args = {'020': ((lanes, 'customername', 'sourcename', 'depottype', eligible), {'k': 3}),
+                  '060': ((shipments,), {}),
+                  '090': ((lanes, 'sourcename', 'customername', msl, 'Issue'), {}),
+                  }
+
+    times = []
+    for stage, (args, kwargs) in stage_args.items():
+        pandas_result, pandas_time = time_stage(STAGES[stage]['pandas'], *args, **kwargs)
+        duckdb_result, duckdb_time = time_stage(STAGES[stage]['duckdb'], *args, **kwargs)
+
+        if stage == '020':
+            np.testing.assert_array_equal(pandas_result, duckdb_result)
+        else:
+            # Only the first row of a repeated lane is used by the update process.
+            keys = list(pandas_result.columns[:2])
+            pd.testing.assert_frame_equal(
+                pandas_result.drop_duplicates(subset=keys).reset_index(drop=True),
+                duckdb_result.drop_duplicates(subset=keys).reset_index(drop=True),
+                check_dtype=False)
+
+        times.append({'stage': stage, 'rows': len(args[0]), 'pandas (s)': pandas_time,
+                      'duckdb (s)': duckdb_time, 'speedup': pandas_time/duckdb_time})
+
+    return pd.DataFrame(times).set_index('stage')
+
+
+if __name__ == '__main__':
+    if duckdb is None:
+        sys.exit('DuckDB is not installed (pip install duckdb).')
+
+    n_customers = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f'Benchmarking stage backends with {n_customers:,} customers...')
+    print(benchmark(n_customers).round(3))
+    print('The pandas and DuckDB results match.')
@@ -0,0 +1,47 @@
+# =============================================================================
+# The purpose of this script is to check that the closest depot identifier (Alteryx workflow 020)
+# skips the depots closed in the Depot Assumptions sheet.
+#
+# It ranks one customer's lanes to three depots (D_1 at 10 miles is closed, D_2 at 20 and D_3 at
+# 30 miles are open) the way the update process does, and exits with an error unless D_2 is the
+# closest depot, D_2 and D_3 are ranked 1 and 2, and D_1 is not ranked. It does not connect to
+# Cosmic Frog or the data warehouse.
+#
+# Run it from the src folder:
+#     python check_depot_ranking.py
+# =============================================================================
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from depot_ranking import rank_nearest_depots
+
+
+def check_depot_ranking(k=2):
+# =============================================================================
+#     Ranks the synthetic lanes and returns a list of the problems found (empty if none).
+# =============================================================================
+    cfp = pd.DataFrame({'customername': 'I_1', 'sourcename': ['D_1', 'D_2', 'D_3'],
+                        'depottype': 'Full Service', 'distance': [10.0, 20.0, 30.0],
+                        'DepotStatus': ['Exclude', 'Include', 'Include']})
+
+    eligible = (cfp['DepotStatus']=='Include') & (cfp['depottype'].isin(['Full Service', 'Sort Only']))
+    depotrank = rank_nearest_depots(cfp, 'customername', 'sourcename', 'depottype', eligible, k=k)
+    closestdepot = np.where(depotrank==1, 'Y', 'N')
+
+    problems = []
+    closest = list(cfp['sourcename'][closestdepot=='Y'])
+    if closest != ['D_2']:
+        problems.append(f'closest depot is {closest}, expected D_2 (D_1 is closed)')
+    if not (np.isnan(depotrank[0]) and list(depotrank[1:]) == [1, 2]):
+        problems.append(f'depot ranks are {list(depotrank)}, expected [nan, 1, 2]')
+    return problems
+
+
+if __name__ == '__main__':
+    problems = check_depot_ranking()
+    if problems:
+        sys.exit('Closest depot identifier: ' + '; '.join(problems))
+    print('The closest depot identifier skips the closed depots.')
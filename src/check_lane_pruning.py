@@ -0,0 +1,117 @@
+# =============================================================================
+# The purpose of this script is to check that lane pruning (lane_pruning.py) never drops a
+# MultiSource List lane, whatever its direction, and keeps the nearest eligible depots.
+#
+# It builds a small MultiSource List (one Issue lane, one Return lane) and the customer
+# fulfillment / replenishment policy lanes it refers to, all far outside the pruning radius, prunes
+# them the way the update process does, and exits with an error if a MultiSource lane is dropped.
+# It then checks that the nearest depots kept are the nearest eligible depots (a closer closed
+# depot does not take the place of an open one), and, if scipy is installed, that the KD-tree
+# shortlist keeps the same lanes as ranking every lane, on random lanes.
+# It does not connect to Cosmic Frog or the data warehouse.
+#
+# Run it from the src folder:
+#     python check_lane_pruning.py
+# =============================================================================
+
+import sys
+
+import pandas as pd
+import numpy as np
+
+import lane_pruning
+from lane_pruning import lanes_to_keep, multi_source_lanes
+from location_dimension import build_location_dimension
+
+
+def check_lane_pruning(radius=100):
+# =============================================================================
+#     Prunes the synthetic policy lanes and returns a list of the MultiSource lanes that were
+#     dropped, as (table, origin, destination) tuples (empty if none were).
+# =============================================================================
+    msl = pd.DataFrame({'MoveType': ['Issue', 'Return'],
+                        'OModelID': ['D_1', 'R_1'],
+                        'DModelID': ['I_1', 'D_2']})
+    keep_lanes = multi_source_lanes(msl)
+
+    # Issue lanes run depot -> customer, return lanes return location -> depot.
+    cfp = pd.DataFrame({'sourcename': ['D_1', 'D_2'], 'customername': ['I_1', 'I_1'],
+                        'depottype': 'Full Service', 'distance': [900.0, 950.0]})
+    rps = pd.DataFrame({'sourcename': ['R_1', 'R_1'], 'facilityname': ['D_2', 'D_1'],
+                        'ddepottype': 'Full Service', 'distance': [900.0, 950.0]})
+    candidate = [True, True]
+
+    dropped = []
+    keep = lanes_to_keep(cfp, 'customername', 'sourcename', 'depottype', candidate, radius,
+                         keep_lanes=keep_lanes)
+    if not keep[0]:
+        dropped.append(('customerfulfillmentpolicies', 'D_1', 'I_1'))
+    keep = lanes_to_keep(rps, 'sourcename', 'facilityname', 'ddepottype', candidate, radius,
+                         keep_lanes=keep_lanes)
+    if not keep[0]:
+        dropped.append(('replenishmentpolicies', 'R_1', 'D_2'))
+    return dropped
+
+
+def check_eligible_nearest_depots():
+# =============================================================================
+#     Prunes the lanes of a customer to its nearest depot, where its nearest depot (D_1) is closed.
+#     Returns True if only the lane of the nearest open depot (D_2) is kept.
+# =============================================================================
+    cfp = pd.DataFrame({'sourcename': ['D_1', 'D_2', 'D_3'], 'customername': 'I_1',
+                        'depottype': 'Full Service', 'distance': [100.0, 200.0, 300.0]})
+    candidate = [True, True, True]
+    eligible = [False, True, True]
+
+    keep = lanes_to_keep(cfp, 'customername', 'sourcename', 'depottype', candidate, k=1,
+                         eligible=eligible)
+    return keep.tolist() == [False, True, False]
+
+
+def check_kdtree_shortlist(n_customers=300, n_depots=60, k=5, seed=0):
+# =============================================================================
+#     Prunes random all-to-all lanes (some repeated, some with no distance) to the k nearest
+#     eligible depots, with and without the KD-tree shortlist. Returns True if both keep the same
+#     lanes.
+# =============================================================================
+    rng = np.random.default_rng(seed)
+    customers = pd.DataFrame({'customername': [f'I_{i}' for i in range(n_customers)],
+                              'latitude': rng.uniform(25, 49, n_customers),
+                              'longitude': rng.uniform(-124, -67, n_customers)})
+    facilities = pd.DataFrame({'facilityname': [f'D_{i}' for i in range(n_depots)],
+                               'latitude': rng.uniform(25, 49, n_depots),
+                               'longitude': rng.uniform(-124, -67, n_depots)})
+    loc_dim = build_location_dimension(customers, facilities)
+
+    lanes = pd.MultiIndex.from_product([customers['customername'], facilities['facilityname']])
+    cfp = pd.DataFrame({'customername': lanes.get_level_values(0), 'sourcename': lanes.get_level_values(1),
+                        'depottype': rng.choice(['Full Service', 'Sort Only'], len(lanes)),
+                        'distance': rng.uniform(10, 3000, len(lanes))})
+    cfp = pd.concat([cfp, cfp.sample(frac=0.2, random_state=seed)], ignore_index=True)
+    cfp.loc[rng.random(len(cfp)) < 0.01, 'distance'] = np.nan
+    candidate = rng.random(len(cfp)) < 0.9
+    eligible = rng.random(len(cfp)) < 0.8
+
+    args = (cfp, 'customername', 'sourcename', 'depottype', candidate)
+    shortlisted = lanes_to_keep(*args, k=k, eligible=eligible, loc_dim=loc_dim)
+    ranked = lanes_to_keep(*args, k=k, eligible=eligible)
+    return (shortlisted == ranked).all()
+
+
+if __name__ == '__main__':
+    dropped = check_lane_pruning()
+    if dropped:
+        sys.exit('Lane pruning dropped MultiSource List lanes: ' +
+                 ', '.join(f'{o} -> {d} ({table})' for table, o, d in dropped))
+    print('Lane pruning keeps the MultiSource List Issue and Return lanes.')
+
+    if not check_eligible_nearest_depots():
+        sys.exit('Lane pruning did not keep the nearest eligible depot.')
+    print('Lane pruning keeps the nearest eligible depots.')
+
+    if lane_pruning.cKDTree is None:
+        print('scipy is not installed: the KD-tree shortlist is not used, so it is not checked.')
+    elif not check_kdtree_shortlist():
+        sys.exit('The KD-tree shortlist keeps different lanes than ranking every lane.')
+    else:
+        print('The KD-tree shortlist keeps the same lanes as ranking every lane.')
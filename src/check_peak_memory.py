@@ -0,0 +1,103 @@
+# =============================================================================
+# The purpose of this script is to check that the model update stays within its memory bound: the
+# peak memory of the run must be at most MAX_PEAK_MEMORY_MULTIPLE (in user_inputs.py) times the size
+# of the tables it pulled (see memory_usage.py).
+#
+# It runs the whole transformation of soip_model_update_process.py, in this process, as a scenario
+# run with no parameter changes, on a pulled data file (the 'Pulled Data.pkl' file in the data
+# folder by default, see PULLED_DATA_FILENAME in user_inputs.py, or any file saved the same way).
+# With '--synthetic', it runs on a synthetic pulled data file made by synthetic_pulled_data.py
+# instead, so no real data is needed. It also does that if no pulled data file is given and there
+# is no 'Pulled Data.pkl' in the data folder.
+#
+# Nothing is uploaded and no connection is made: the scenario's tables (and the synthetic data) are
+# saved to a temporary folder, which is deleted afterwards, and scenario runs do not change the
+# files in the data folder. It exits with an error (a nonzero exit status) if the peak memory is
+# above the limit. '--max-multiple' replaces MAX_PEAK_MEMORY_MULTIPLE for this check.
+#
+# Run it from the src folder:
+#     python check_peak_memory.py [pulled data file] [--max-multiple <multiple>]
+#     python check_peak_memory.py --synthetic [number of customers] [--max-multiple <multiple>]
+#
+# To check the real data, make a 'Pulled Data.pkl' with:
+#     python soip_model_update_process.py --pull-only "../data/Pulled Data.pkl"
+# =============================================================================
+
+import os
+import sys
+import runpy
+import pickle
+import tempfile
+import subprocess
+
+# Add project root to PATH to allow for relative imports.
+ROOT = os.path.abspath(os.path.join('..'))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+import scenario_sweep
+import user_inputs
+from user_inputs import PULLED_DATA_FILENAME
+
+# Number of customers of the synthetic pulled data (about 50 MB of pulled tables). The memory bound
+# is a multiple of the size of the pulled tables, so a much smaller model would mostly measure the
+# memory the run uses on top of them (Python objects, imports).
+SYNTHETIC_CUSTOMERS = 1000
+
+
+def run_update(pulled_data_path, folder):
+# =============================================================================
+#     Runs soip_model_update_process.py on the pulled data, as a scenario run whose tables are saved
+#     to folder. Returns True if its peak memory is within the limit.
+# =============================================================================
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'soip_model_update_process.py')
+    scenario = {'name': 'Peak memory check', 'output_db_name': None, 'parameters': {}}
+
+    scenario_path = os.path.join(folder, 'scenario.pkl')
+    with open(scenario_path, 'wb') as f:
+        pickle.dump(scenario, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    scenario_sweep.OUTPUT_FOLDER = folder
+    argv = sys.argv
+    sys.argv = [script, '--scenario', pulled_data_path, scenario_path]
+    try:
+        results = runpy.run_path(script)
+    finally:
+        sys.argv = argv
+    return results['peak_memory_ok']
+
+
+def make_synthetic_pulled_data(path, n_customers):
+# =============================================================================
+#     Saves a synthetic pulled data file for n_customers customers. It is made in a separate
+#     process, so the memory used to make it does not count in this process' peak memory.
+# =============================================================================
+    print(f'Making synthetic pulled data for {n_customers:,} customers...')
+    subprocess.run([sys.executable, 'synthetic_pulled_data.py', path, str(n_customers)], check=True)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--max-multiple' in args:
+        i = args.index('--max-multiple')
+        user_inputs.MAX_PEAK_MEMORY_MULTIPLE = float(args[i+1])
+        del args[i:i+2]
+
+    default_path = os.path.join('..', 'data', PULLED_DATA_FILENAME)
+    synthetic = (args[:1] == ['--synthetic']) or (not args and not os.path.exists(default_path))
+    if not synthetic:
+        pulled_data_path = args[0] if args else default_path
+        if not os.path.exists(pulled_data_path):
+            sys.exit(f'{pulled_data_path} does not exist. Make it with: '
+                     f'python soip_model_update_process.py --pull-only "{pulled_data_path}"')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if synthetic:
+            pulled_data_path = os.path.join(tmp, 'Synthetic Pulled Data.pkl')
+            make_synthetic_pulled_data(pulled_data_path, int(args[1]) if len(args) > 1 else SYNTHETIC_CUSTOMERS)
+        peak_memory_ok = run_update(pulled_data_path, tmp)
+
+    if not peak_memory_ok:
+        sys.exit(f'The peak memory of the update is above the limit of {user_inputs.MAX_PEAK_MEMORY_MULTIPLE}x '
+                 'the pulled tables (MAX_PEAK_MEMORY_MULTIPLE in user_inputs.py).')
+    print('The peak memory of the update is within the limit.')
@@ -0,0 +1,1201 @@
+# =============================================================================
+# The purpose of this script is to upload the updated tables to one or more Cosmic Frog models.
+#
+# Each table is replaced in the output model: its rows are deleted, then the new rows are loaded
+# with Postgres' COPY ... FROM STDIN WITH CSV, which is much faster than inserts. The CSV is made by
+# pandas' to_csv in chunks of COPY_CHUNK_ROWS rows, by a separate thread, while the previous chunk
+# is sent, so the time to make it mostly overlaps with the upload, and only a few chunks are held
+# in memory at a time instead of the table's whole CSV.
+#
+# In staged mode, every table is first loaded into an unlogged staging table and its row count is
+# checked. The staging tables are then swapped in (TRUNCATE and INSERT ... SELECT, on the server)
+# in one transaction per model, so a failed upload never leaves a model with empty or half-loaded
+# tables. The swap is not atomic across models: the models are swapped one after the other, so if
+# the swap fails in one model, the models before it already have the new tables.
+#
+# Uploads can be verified without downloading the tables again: a checksum of the table sent (its
+# row count and the sum of a hash of each whole row) is computed from the DataFrame and compared,
+# right after the COPY and before it is committed, with the same checksum computed by Postgres on
+# the table. The values are hashed a column at a time, and each row's hash is made from the hashes
+# of its values, so values that ended up in the wrong rows do not match either. A count and a sum
+# of the hashes per column are compared too, to name the columns that differ. A table that does not
+# match is left as it was, and the upload fails.
+#
+# Tables are uploaded over several connections at the same time (UPLOAD_WORKERS in user_inputs.py),
+# largest first, since the time is mostly spent waiting on the network rather than on the server.
+# A table's CSV (COPY payload) is made once, and then sent to every output model, so sibling models
+# (e.g. a "-final" model and a what-if copy) get the same update for little more than the cost of
+# one.
+#
+# When only a few columns of a table changed (e.g. a scalar parameter such as NewPalletCost),
+# update_columns_in_cosmic_frog only sends the primary keys and those columns, to a temporary table,
+# and updates the table's columns from it by primary key.
+#
+# In delta mode (upload_changes_to_cosmic_frog), each table is compared, by primary key and a hash
+# of each row, with what the model already holds (the fingerprints of the previous upload to it,
+# or of the pulled input model if it has not been uploaded to yet). Only new and changed rows are
+# sent (to a temporary table, then UPDATE ... FROM and INSERT), removed rows are deleted by key,
+# and unchanged tables are skipped without connecting to the model, so the upload time follows the
+# size of the change. The checksum of each table in the model (see checksum_sql) is recorded with
+# its fingerprints, and a delta is only applied if the table still has that checksum; a table that
+# was changed since (e.g. edited by hand, or uploaded again by another run) is replaced in full.
+# The checksum after an upload is computed from the DataFrame (see expected_model_checksum), not
+# read from the model again.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+import sqlalchemy as sal
+import warnings
+import os
+import pickle
+import time
+import threading
+import queue
+import hashlib
+from decimal import Decimal, ROUND_HALF_UP
+from io import StringIO
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from optilogic import pioneer
+
+# Models that are not in Cosmic Frog, e.g. the local Postgres database of benchmark_uploads.py
+# (model name -> SQLAlchemy connection URL).
+LOCAL_MODELS = {}
+
+# Rows per CSV chunk of a COPY payload, and the number of chunks that can be made ahead of the one
+# being sent.
+COPY_CHUNK_ROWS = 50000
+COPY_QUEUE_CHUNKS = 2
+
+# Name prefix of the staging tables of a staged upload.
+STAGING_PREFIX = 'soip_staging_'
+
+# File that keeps the definitions of the secondary indexes dropped for an upload to a model until
+# they are rebuilt, in the index folder (see replace_data_in_cosmic_frog).
+DROPPED_INDEXES_FILENAME = 'Dropped Indexes - {db_name}.csv'
+
+# Secondary indexes of a list of tables (see secondary_indexes).
+SECONDARY_INDEXES_SQL = """
+    select n.nspname, i.relname, t.relname, pg_get_indexdef(ix.indexrelid)
+    from pg_index ix
+    join pg_class i on i.oid = ix.indexrelid
+    join pg_class t on t.oid = ix.indrelid
+    join pg_namespace n on n.oid = t.relnamespace
+    where t.relname = any(%s) and n.nspname = any(current_schemas(false))
+      and not ix.indisprimary and not ix.indisunique
+      and not exists (select 1 from pg_constraint c where c.conindid = ix.indexrelid)
+    """
+
+# Postgres type OIDs of the columns whose values are compared as float8 in upload checksums (see
+# column_hashes): numbers, and dates and timestamps (as seconds since 1970). Other columns are
+# compared as text.
+CHECKSUM_NUMBER_TYPES = {20, 21, 23, 700, 701, 1700}  # int8, int2, int4, float4, float8, numeric
+CHECKSUM_TIME_TYPES = {1082, 1114, 1184}              # date, timestamp, timestamptz
+CHECKSUM_BOOL_TYPE = 16
+CHECKSUM_CHAR_TYPE = 1042                             # char(n), compared without its trailing blanks
+
+# Primary key columns of each Cosmic Frog table (also used by the validation script).
+primary_keys = {'customerfulfillmentpolicies':['customername', 'productname', 'sourcename'],
+                'customers':['customername'],
+                'facilities':['facilityname'],
+                'groups':['groupname', 'grouptype', 'membername'],
+                'inventoryconstraints':['facilityname','facilitynamegroupbehavior','productname',
+                                        'productnamegroupbehavior','periodname',
+                                        'periodnamegroupbehavior','constrainttype',
+                                        'constraintvalueuom', #'constraintvalue',
+                                        'consideredinventory'],
+                'inventorypolicies':['facilityname', 'productname'],
+                'periods':['periodname'],   # NOTE: The model update code doesn't change the Periods table. This is for testing.
+                'productionconstraints':['facilityname','facilitynamegroupbehavior','productname',
+                                         'productnamegroupbehavior','periodname',
+                                         'periodnamegroupbehavior','bomname','bomnamegroupbehavior',
+                                         'processname','processnamegroupbehavior','constrainttype',
+                                         'constraintvalueuom', #'constraintvalue',
+                                         ],
+                'productionpolicies':['facilityname', 'productname', 'bomname', 'processname'],
+                'replenishmentpolicies':['facilityname', 'productname', 'sourcename'],
+                'transportationpolicies':['originname', 'destinationname', 'productname', 'modename'],
+                'warehousingpolicies':['facilityname', 'productname'],
+                   }
+
+
+def output_engine(USER_NAME, APP_KEY, db_name, pool_size=None):
+# =============================================================================
+#     Returns a SQLAlchemy engine connected to a Cosmic Frog model (or to a model in LOCAL_MODELS).
+#     If pool_size is given, the engine opens at most pool_size connections at a time.
+# =============================================================================
+    if db_name in LOCAL_MODELS:
+        connection_string = LOCAL_MODELS[db_name]
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")     # Ignore the Cosmic Frog API warning.
+
+            api = pioneer.Api(auth_legacy=False, un=USER_NAME, appkey=APP_KEY)
+            connection_str = api.sql_connection_info(db_name)
+            connection_string = connection_str['connectionStrings']['url']
+
+    if pool_size is None:
+        return sal.create_engine(connection_string)
+    return sal.create_engine(connection_string, pool_size=pool_size, max_overflow=0)
+
+
+def copy_columns(table):
+# =============================================================================
+#     Returns the columns of table as arrays of Python values, as pandas passes them to a to_sql
+#     insert method: missing values (NaN, None, NaT, pd.NA) are None, dates are datetimes.
+# =============================================================================
+    columns = []
+    for _, col in table.items():
+        if col.dtype.kind == 'M':
+            values = col.dt.to_pydatetime()
+        else:
+            values = col.to_numpy(dtype=object, copy=True)
+        values[pd.isna(values)] = None
+        columns.append(values)
+    return columns
+
+
+def csv_columns(table):
+# =============================================================================
+#     Returns table with the columns that pandas' to_csv writes differently from csv.writer (on the
+#     values from copy_columns) converted: dates are written as str(datetime), with the time even
+#     at midnight, and float32 columns as float64 values.
+# =============================================================================
+    converted = {}
+    for name, col in table.items():
+        if col.dtype.kind == 'M':
+            values = pd.Series(col.dt.to_pydatetime(), index=col.index, dtype=object)
+            converted[name] = values.map(str).where(col.notna(), None)
+        elif col.dtype.kind == 'f' and col.dtype.itemsize < 8:
+            converted[name] = col.astype(np.float64)
+    return table.assign(**converted) if converted else table
+
+
+def csv_chunks(table, chunk_rows=COPY_CHUNK_ROWS):
+# =============================================================================
+#     Yields the CSV text (COPY payload) of table, chunk_rows rows at a time. Each chunk is written
+#     column by column by pandas' to_csv, and is the same text as csv.writer writes for the rows of
+#     copy_columns(table): missing values are empty, floats are written as repr(float) and lines
+#     end with '\r\n'.
+# =============================================================================
+    table = csv_columns(table)
+    for start in range(0, len(table), chunk_rows):
+        yield table.iloc[start:start + chunk_rows].to_csv(header=False, index=False, lineterminator='\r\n')
+
+
+def copy_payload(table):
+# =============================================================================
+#     Returns the COPY statement columns and the CSV text (COPY payload) of table.
+# =============================================================================
+    columns = ', '.join('"{}"'.format(k) for k in table.columns)
+    return columns, ''.join(csv_chunks(table))
+
+
+def stream_chunks(chunks):
+# =============================================================================
+#     Returns a file-like object for copy_expert that reads the CSV text in chunks (an iterable,
+#     e.g. csv_chunks(table)), and a dictionary with the number of bytes made so far ('bytes').
+#
+#     The chunks are made by a separate thread, up to COPY_QUEUE_CHUNKS chunks ahead of the reader,
+#     so the next chunk is made while the previous one is being sent. Errors while making the
+#     chunks are raised by the reader.
+# =============================================================================
+    chunk_queue = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    stop = threading.Event()
+    stats = {'bytes': 0}
+
+    def put(item):
+        # Give up if the reader stopped (e.g. the COPY failed), so the thread does not wait forever.
+        while not stop.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def make_chunks():
+        try:
+            for chunk in chunks:
+                stats['bytes'] += len(chunk.encode())
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=make_chunks, daemon=True).start()
+
+    # The chunk being read, and how much of it has been read.
+    current = {'chunk': '', 'position': 0, 'done': False}
+
+    def read(size=-1):
+        parts, n = [], 0
+        while not current['done'] and (size is None or size < 0 or n < size):
+            if current['position'] >= len(current['chunk']):
+                item = chunk_queue.get()
+                if isinstance(item, Exception):
+                    stop.set()
+                    raise item
+                if item is None:
+                    current['done'] = True
+                    stop.set()
+                    break
+                current['chunk'], current['position'] = item, 0
+
+            end = None if size is None or size < 0 else current['position'] + size - n
+            part = current['chunk'][current['position']:end]
+            current['position'] += len(part)
+            parts.append(part)
+            n += len(part)
+        return ''.join(parts)
+
+    def close():
+        stop.set()
+
+    return SimpleNamespace(read=read, close=close), stats
+
+
+def checksum_columns(cur, table_name, columns):
+# =============================================================================
+#     Returns the name, Postgres type OID and numeric scale (None if it is not fixed) of each of the
+#     COPY statement columns of a table, for its upload checksum.
+# =============================================================================
+    cur.execute(f'select {columns} from {table_name} limit 0')
+    return [(col.name, col.type_code,
+             col.scale if col.type_code == 1700 and col.scale is not None and col.scale <= 1000 else None)
+            for col in cur.description]
+
+
+def int64_sum(hashes):
+# =============================================================================
+#     Returns the sum of hashes (an array of signed 64-bit integers), as Postgres adds them up
+#     (without overflow).
+# =============================================================================
+    hashes = np.asarray(hashes, dtype=np.int64)
+    return int((hashes >> 32).sum()) * 2**32 + int((hashes & 0xFFFFFFFF).sum())
+
+
+def md5_hash(text):
+# =============================================================================
+#     Returns the first 8 bytes of the md5 of a text as a signed 64-bit integer, as Postgres reads
+#     ('x' || left(md5(text), 16))::bit(64)::bigint.
+# =============================================================================
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], 'big', signed=True)
+
+
+def column_hashes(values, type_code, scale, nullable=True):
+# =============================================================================
+#     Returns the hash of each value of a column of a table (a Series, as csv_columns makes it), as
+#     a signed 64-bit integer array, and a boolean array of the values Postgres stores as NULL
+#     (whose hash is 0). The hashes are the same as column_hash_sql computes from the values
+#     Postgres stored:
+#         - numbers, dates and timestamps are hashed as their float8 bits (so they do not depend on
+#           how they were written), without a loop over the rows,
+#         - other values as the first 8 bytes of the md5 of their text (booleans as 'true' /
+#           'false'), computed once per distinct value.
+#     Missing values and empty strings are NULL, unless nullable is False (a one-column table,
+#     whose empty fields are quoted).
+#
+#     A column with values that cannot be read as its type is hashed as text (it will not match).
+# =============================================================================
+    def typed(numbers):
+        # The numbers as Postgres stores them in the column, as float8.
+        if type_code == 700:
+            numbers = np.asarray(numbers, dtype=np.float32)
+        numbers = np.asarray(numbers, dtype=np.float64)
+        if type_code not in (700, 701):
+            numbers = numbers + 0.0   # Only float columns keep the sign of zero.
+        return numbers
+
+    # Numeric columns are hashed as they are, without looking at each value.
+    if type_code in CHECKSUM_NUMBER_TYPES and values.dtype.kind in 'iuf' and scale is None:
+        numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        null = np.isnan(numbers)
+        hashes = np.ascontiguousarray(typed(np.where(null, 0.0, numbers))).view(np.int64)
+        return np.where(null, 0, hashes), null
+
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        # Mixed values that are equal (e.g. 1, 1.0 and True) are written differently.
+        values = values.where(values.isna(), values.astype(str))
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    texts = [str(v) for v in np.asarray(uniques, dtype=object)]
+    if not nullable:
+        # Missing values are written as quoted empty strings.
+        codes = np.where(codes < 0, len(texts), codes)
+        texts.append('')
+    present = np.array([not nullable or t != '' for t in texts], dtype=bool)
+    present_texts = [t for t, p in zip(texts, present) if p]
+
+    numbers = None
+    if type_code in CHECKSUM_NUMBER_TYPES:
+        try:
+            if scale is not None:
+                numbers = [float(Decimal(t).quantize(Decimal(1).scaleb(-scale), ROUND_HALF_UP))
+                           for t in present_texts]
+            else:
+                numbers = [float(t) for t in present_texts]
+            numbers = typed(numbers)
+        except (ValueError, ArithmeticError):
+            numbers = None
+
+    elif type_code in CHECKSUM_TIME_TYPES:
+        times = pd.to_datetime(pd.Series(present_texts, dtype=object), format='ISO8601', errors='coerce')
+        if times.dt.tz is not None:
+            times = times.dt.tz_localize(None)
+        if type_code == 1082:
+            times = times.dt.normalize()
+        if not times.isna().any():
+            numbers = times.to_numpy().astype('datetime64[us]').astype(np.int64) / 1e6
+
+    elif type_code == CHECKSUM_BOOL_TYPE:
+        true_values = {'t', 'tr', 'tru', 'true', 'y', 'ye', 'yes', 'on', '1'}
+        texts = ['true' if t.strip().lower() in true_values else 'false' for t in texts]
+
+    elif type_code == CHECKSUM_CHAR_TYPE:
+        texts = [t.rstrip(' ') for t in texts]
+
+    # Hash of each distinct value (0 for NULL), then of each row.
+    value_hashes = np.zeros(len(texts), dtype=np.int64)
+    if numbers is not None:
+        value_hashes[present] = np.ascontiguousarray(numbers, dtype=np.float64).view(np.int64)
+    else:
+        value_hashes[present] = [md5_hash(t) for t in present_texts]
+
+    null = codes < 0
+    null[~null] = ~present[codes[~null]]
+    if len(value_hashes) == 0:
+        return np.zeros(len(codes), dtype=np.int64), null   # Only NULL values.
+    return np.where(null, 0, value_hashes[np.maximum(codes, 0)]), null
+
+
+def row_hash_sum(hashes, nulls):
+# =============================================================================
+#     Returns the sum of the hash of each whole row of a table, given the hashes and NULL masks of
+#     its columns (see column_hashes), as row_hash_sql computes it: the first 8 bytes of the md5 of
+#     the row's value hashes, as 16 hex digits each (empty for NULL), joined with commas.
+# =============================================================================
+    if not hashes:
+        return 0
+    parts = []
+    for column, null in zip(hashes, nulls):
+        hex_digits = pd.Series(column.view(np.uint64)).map('{:016x}'.format)
+        parts.append(hex_digits.where(~null, ''))
+    rows = parts[0].str.cat(parts[1:], sep=',') if len(parts) > 1 else parts[0]
+    return sum(md5_hash(row) for row in rows)
+
+
+def table_checksum(table, checked_columns):
+# =============================================================================
+#     Returns the upload checksum of a table (a DataFrame, as it is sent in the COPY payload): its
+#     row count, the sum of the hash of each whole row (see row_hash_sum), and, per column, the
+#     number of values that are not NULL and the sum of their hashes (see column_hashes). The
+#     column sums only show which column differs; values moved between rows are found by the
+#     row hashes.
+# =============================================================================
+    table = csv_columns(table)
+    nullable = len(table.columns) > 1
+    hashes, nulls = [], []
+    for (_, type_code, scale), (_, values) in zip(checked_columns, table.items()):
+        column, null = column_hashes(values, type_code, scale, nullable)
+        hashes.append(column)
+        nulls.append(null)
+
+    columns = [(int((~null).sum()), int64_sum(column)) for column, null in zip(hashes, nulls)]
+    return len(table), row_hash_sum(hashes, nulls), columns
+
+
+def column_hash_sql(name, type_code):
+# =============================================================================
+#     Returns the SQL expression of the hash of each value of a column (see column_hashes), as 16
+#     hex digits (NULL for NULL values).
+# =============================================================================
+    column = '"{}"'.format(name)
+    if type_code in CHECKSUM_NUMBER_TYPES:
+        return f"encode(float8send({column}::float8), 'hex')"
+    if type_code in CHECKSUM_TIME_TYPES:
+        return f"encode(float8send(extract(epoch from {column}::timestamp)::float8), 'hex')"
+    return f'left(md5({column}::text), 16)'
+
+
+def checksum_sql(table_name, checked_columns):
+# =============================================================================
+#     Returns the query of the upload checksum of a table in Postgres (see table_checksum): its row
+#     count, the sum of the hash of each whole row, then the number of values that are not NULL and
+#     the sum of their hashes, per column.
+# =============================================================================
+    value_hashes = [column_hash_sql(name, type_code) for name, type_code, _ in checked_columns]
+    row = "concat_ws(',', {})".format(', '.join(f"coalesce({h}, '')" for h in value_hashes))
+    sums = [f"coalesce(sum(('x' || left(md5({row}), 16))::bit(64)::bigint), 0)"]
+    for (name, _, _), h in zip(checked_columns, value_hashes):
+        column = '"{}"'.format(name)
+        sums.append(f"count({column}), coalesce(sum(('x' || {h})::bit(64)::bigint), 0)")
+    return f"select count(*), {', '.join(sums)} from {table_name}"
+
+
+def check_checksum(cur, table_name, checked_columns, checksum, label=None):
+# =============================================================================
+#     Computes the upload checksum of a table in Postgres and compares it with the checksum of the
+#     table sent (see table_checksum). Raises a ValueError if they do not match, naming the columns
+#     whose values differ, if any.
+# =============================================================================
+    cur.execute(checksum_sql(table_name, checked_columns))
+    result = cur.fetchone()
+    rows, row_sum = result[0], int(result[1])
+    columns = [(result[i], int(result[i+1])) for i in range(2, len(result), 2)]
+    sent_rows, sent_row_sum, sent_columns = checksum
+    if rows != sent_rows:
+        detail = f'{rows:,} rows, {sent_rows:,} sent'
+    elif row_sum == sent_row_sum:
+        return
+    else:
+        different = [name for (name, _, _), stored, sent in zip(checked_columns, columns, sent_columns)
+                     if stored != sent]
+        if different:
+            detail = 'different values in ' + ', '.join(different)
+        else:
+            detail = 'the same values, but in different rows'
+    raise ValueError(f'The upload of {label or table_name} does not match what was sent ({detail}).')
+
+
+def model_checksum_columns(cur, table_name, column_names):
+# =============================================================================
+#     Returns the checksum columns (see checksum_columns) of a table's model checksum: column_names,
+#     in name order.
+# =============================================================================
+    columns = ', '.join('"{}"'.format(c) for c in sorted(column_names))
+    return checksum_columns(cur, table_name, columns)
+
+
+def model_checksum(cur, table_name, column_names, checked_columns=None):
+# =============================================================================
+#     Returns the checksum of a table in a Cosmic Frog model (see checksum_sql), over column_names
+#     in name order, so it does not depend on the order of the DataFrame's columns. Two checksums
+#     are equal if the table holds the same rows. checked_columns are the table's
+#     model_checksum_columns, if they were already read.
+# =============================================================================
+    if checked_columns is None:
+        checked_columns = model_checksum_columns(cur, table_name, column_names)
+    cur.execute(checksum_sql(table_name, checked_columns))
+    return tuple(int(value) for value in cur.fetchone())
+
+
+def expected_model_checksum(table, checked_columns):
+# =============================================================================
+#     Returns the checksum model_checksum reads from a model table that holds the rows of table (a
+#     DataFrame), computed from the DataFrame (see table_checksum). checked_columns are the model
+#     table's model_checksum_columns.
+# =============================================================================
+    rows, row_sum, columns = table_checksum(table[[name for name, _, _ in checked_columns]], checked_columns)
+    return (rows, row_sum) + tuple(value for column in columns for value in column)
+
+
+def model_checksums(USER_NAME, APP_KEY, db_name, tables):
+# =============================================================================
+#     Returns the checksum (see model_checksum) of each table in a Cosmic Frog model, over the
+#     columns of the DataFrames in tables (table name -> DataFrame, or its column names).
+# =============================================================================
+    engine = output_engine(USER_NAME, APP_KEY, db_name)
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            checksums = {table_name: model_checksum(cur, table_name,
+                                                    [c for c in getattr(table, 'columns', table) if c != 'index'])
+                         for table_name, table in tables.items()}
+        dbapi_conn.rollback()
+    finally:
+        dbapi_conn.close()
+        engine.dispose()
+    return checksums
+
+
+def replace_table(engine, table_name, columns, chunks, checked_table=None, label=None):
+# =============================================================================
+#     Deletes all rows of a table in a Cosmic Frog model, then loads the COPY payload (an iterable of
+#     CSV text chunks, see csv_chunks) into it, sending each chunk while the next one is made. Both
+#     are done in one transaction, so the table is left as it was if the upload fails.
+#
+#     If checked_table (the DataFrame the payload was made from) is given, its checksum is compared
+#     with the table's checksum in Postgres before the transaction is committed (see
+#     check_checksum), and a ValueError is raised (and the table left as it was) if they do not
+#     match. label names the upload in the error. Returns the number of bytes sent.
+# =============================================================================
+    dbapi_conn = engine.raw_connection()
+    reader = None
+    try:
+        with dbapi_conn.cursor() as cur:
+            reader, stats = stream_chunks(chunks)
+            cur.execute(f'delete from {table_name}')
+            sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(table_name, columns)
+            # Read up to 1 MB at a time, so the sending thread rarely waits for the chunk thread.
+            cur.copy_expert(sql=sql, file=reader, size=2**20)
+            if checked_table is not None:
+                checked_columns = checksum_columns(cur, table_name, columns)
+                check_checksum(cur, table_name, checked_columns,
+                               table_checksum(checked_table, checked_columns), label)
+        dbapi_conn.commit()
+    finally:
+        if reader is not None:
+            reader.close()
+        dbapi_conn.close()
+    return stats['bytes']
+
+
+def stage_table(engine, table_name, columns, chunks, expected_rows, checked_table=None, label=None):
+# =============================================================================
+#     Loads the COPY payload of a table (see replace_table) into a new unlogged staging table in a
+#     Cosmic Frog model, and checks that it has expected_rows rows (and, if checked_table is given,
+#     that its checksum matches checked_table's). The table itself is not changed (see
+#     swap_staged_tables). Returns the number of bytes sent.
+# =============================================================================
+    staging_name = STAGING_PREFIX + table_name
+    dbapi_conn = engine.raw_connection()
+    reader = None
+    try:
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f'drop table if exists {staging_name}')
+            cur.execute(f'create unlogged table {staging_name} as select {columns} from {table_name} limit 0')
+            reader, stats = stream_chunks(chunks)
+            sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(staging_name, columns)
+            cur.copy_expert(sql=sql, file=reader, size=2**20)
+            cur.execute(f'select count(*) from {staging_name}')
+            staged_rows = cur.fetchone()[0]
+            if checked_table is not None and staged_rows == expected_rows:
+                checked_columns = checksum_columns(cur, staging_name, columns)
+                check_checksum(cur, staging_name, checked_columns,
+                               table_checksum(checked_table, checked_columns), label or table_name)
+        dbapi_conn.commit()
+    finally:
+        if reader is not None:
+            reader.close()
+        dbapi_conn.close()
+
+    if staged_rows != expected_rows:
+        raise ValueError(f'{staged_rows:,} rows were staged for {table_name}, expected {expected_rows:,}.')
+    return stats['bytes']
+
+
+def swap_staged_tables(engine, staged_columns, rebuild_indexes=False, pending_indexes=()):
+# =============================================================================
+#     Replaces the rows of the tables in a Cosmic Frog model with the rows of their staging tables
+#     (see stage_table), all in one transaction, and drops the staging tables. staged_columns holds
+#     the COPY statement columns of each staged table (table name -> columns).
+#
+#     If rebuild_indexes is True, the tables' secondary indexes are dropped before the rows are
+#     inserted and rebuilt after, in the same transaction, so a failed swap leaves them as they
+#     were. The indexes in pending_indexes (see read_dropped_indexes) are also rebuilt. Returns the
+#     number of indexes rebuilt.
+# =============================================================================
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            indexes = fetch_secondary_indexes(cur, staged_columns) if rebuild_indexes else []
+            for _, index_name, _ in indexes:
+                cur.execute(f'drop index {index_name}')
+            for table_name, columns in staged_columns.items():
+                staging_name = STAGING_PREFIX + table_name
+                cur.execute(f'truncate {table_name}')
+                cur.execute(f'insert into {table_name} ({columns}) select {columns} from {staging_name}')
+                cur.execute(f'drop table {staging_name}')
+            for _, _, definition in indexes + list(pending_indexes):
+                cur.execute(if_not_exists(definition))
+        dbapi_conn.commit()
+    finally:
+        dbapi_conn.close()
+    return len(indexes) + len(pending_indexes)
+
+
+def drop_staged_tables(engine, table_names):
+# =============================================================================
+#     Drops the staging tables of a Cosmic Frog model (after a failed staged upload).
+# =============================================================================
+    with engine.connect() as conn:
+        for table_name in table_names:
+            conn.execute(sal.text(f'drop table if exists {STAGING_PREFIX + table_name}'))
+        conn.commit()
+
+
+def fetch_secondary_indexes(cur, table_names):
+# =============================================================================
+#     Returns the secondary indexes of the tables in a Cosmic Frog model (see secondary_indexes),
+#     read with the cursor cur.
+# =============================================================================
+    cur.execute(SECONDARY_INDEXES_SQL, (list(table_names),))
+    return [(table_name, f'"{schema}"."{index_name}"', definition)
+            for schema, index_name, table_name, definition in cur.fetchall()]
+
+
+def secondary_indexes(engine, table_names):
+# =============================================================================
+#     Returns the secondary indexes of the tables in a Cosmic Frog model: the indexes that are not
+#     primary keys, unique, or used by a constraint, as a list of (table name, index name, CREATE
+#     INDEX statement). The index name includes its schema.
+# =============================================================================
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            return fetch_secondary_indexes(cur, table_names)
+    finally:
+        dbapi_conn.close()
+
+
+def if_not_exists(definition):
+# =============================================================================
+#     Returns a CREATE INDEX statement (as made by pg_get_indexdef) that does nothing if the index
+#     already exists, so indexes can be rebuilt again after a rebuild that did not finish.
+# =============================================================================
+    return definition.replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1)
+
+
+def dropped_indexes_path(index_folder, db_name):
+# =============================================================================
+#     Returns the path of the file that keeps the indexes dropped in a model, or None if there is no
+#     index folder.
+# =============================================================================
+    if index_folder is None:
+        return None
+    return os.path.join(index_folder, DROPPED_INDEXES_FILENAME.format(db_name=db_name))
+
+
+def read_dropped_indexes(path):
+# =============================================================================
+#     Reads the indexes that an upload dropped and did not rebuild (e.g. because it was stopped), as
+#     a list of (table name, index name, CREATE INDEX statement). Returns an empty list if there are
+#     none.
+# =============================================================================
+    if path is None or not os.path.exists(path):
+        return []
+    dropped = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return list(dropped[['table_name', 'index_name', 'definition']].itertuples(index=False, name=None))
+
+
+def save_dropped_indexes(indexes, path):
+# =============================================================================
+#     Saves the indexes about to be dropped in a model, so they can be rebuilt by the next upload if
+#     this one does not rebuild them. With no indexes, the file is removed instead.
+# =============================================================================
+    if path is None:
+        return
+    if not indexes:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    pd.DataFrame(indexes, columns=['table_name', 'index_name', 'definition']).to_csv(path, index=False)
+
+
+def run_statement(engine, sql):
+# =============================================================================
+#     Runs one SQL statement (e.g. CREATE INDEX or ANALYZE) in a Cosmic Frog model, and commits it.
+# =============================================================================
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            cur.execute(sql)
+        dbapi_conn.commit()
+    finally:
+        dbapi_conn.close()
+
+
+def replace_data_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAME, data_to_upload, n_workers=1,
+                                staged=False, rebuild_indexes=False, verify=False, index_folder=None):
+# =============================================================================
+#     Replaces the tables in data_to_upload (table name -> DataFrame) in the Cosmic Frog model
+#     OUTPUT_DB_NAME, or in every model if OUTPUT_DB_NAME is a list of model names.
+#
+#     Up to n_workers tables are uploaded at the same time (each over its own connection), largest
+#     tables first. The time and throughput of each table are printed as it finishes.
+#
+#     If staged is True, the tables are first loaded into staging tables and their row counts
+#     checked, then swapped in all at once, in one transaction per model. If any table fails to
+#     stage, no model is changed. The models are swapped one after the other, so if the swap fails
+#     in one model, that model and the ones after it are not changed, but the ones before it are.
+#
+#     If rebuild_indexes is True, the tables' secondary indexes (see secondary_indexes) are dropped
+#     before the load and rebuilt after it (also if it fails), up to n_workers at a time. Their
+#     definitions are first saved in a file per model in index_folder (see save_dropped_indexes),
+#     which is removed once they are rebuilt. If the upload is stopped before that, the next upload
+#     to the model rebuilds them from the file. If staged is True, the indexes are instead dropped
+#     and rebuilt in the swap's transaction (see swap_staged_tables), so nothing is saved.
+#
+#     The loaded tables are then analyzed, so the planner has statistics for the new rows, and the
+#     time spent in each phase is printed.
+#
+#     If verify is True, each upload's checksum is compared with the table's before it is committed
+#     (see replace_table), and the upload fails on the first table that does not match.
+# =============================================================================
+    # Note: This syntax is compatible with SQLAlchemy 2.0.
+    db_names = [OUTPUT_DB_NAME] if isinstance(OUTPUT_DB_NAME, str) else list(OUTPUT_DB_NAME)
+    n_workers = max(n_workers or 1, 1)
+    print(f"Connecting to Cosmic Frog to upload data to: {', '.join(db_names)}")
+    engines = {db_name: output_engine(USER_NAME, APP_KEY, db_name, pool_size=n_workers)
+               for db_name in db_names}
+
+    for table in data_to_upload.values():
+        if 'index' in table.columns:
+            del table['index']
+
+    # One upload per table and model, largest tables first, so the longest uploads do not start last.
+    table_names = sorted(data_to_upload, key=lambda name: data_to_upload[name].size, reverse=True)
+    uploads = [(table_name, db_name) for table_name in table_names for db_name in db_names]
+
+    # With one output model, each table's CSV is made while it is sent. With several, it is made
+    # once, by the first of the table's uploads to start, and kept until it has been sent to every
+    # model.
+    payloads = {}
+    remaining = {table_name: len(db_names) for table_name in table_names}
+    locks = {table_name: threading.Lock() for table_name in table_names}
+    print_lock = threading.Lock()
+
+    def upload_table(upload):
+        table_name, db_name = upload
+        table = data_to_upload[table_name]
+        columns = ', '.join('"{}"'.format(k) for k in table.columns)
+        if len(db_names) == 1:
+            chunks = csv_chunks(table)
+        else:
+            with locks[table_name]:
+                if table_name not in payloads:
+                    payloads[table_name] = list(csv_chunks(table))
+                chunks = payloads[table_name]
+
+        t0 = time.time()
+        label = f'{table_name} to {db_name}'
+        try:
+            if staged:
+                n_bytes = stage_table(engines[db_name], table_name, columns, chunks, len(table),
+                                      table if verify else None, label)
+            else:
+                n_bytes = replace_table(engines[db_name], table_name, columns, chunks,
+                                        table if verify else None, label)
+        except ValueError as e:
+            with print_lock:
+                print(f'\t{e}')
+            raise
+        seconds = max(time.time() - t0, 1e-6)
+
+        with locks[table_name]:
+            remaining[table_name] -= 1
+            if remaining[table_name] == 0:
+                payloads.pop(table_name, None)
+
+        rows, mb = len(table), n_bytes / 2**20
+        model = f' ({db_name})' if len(db_names) > 1 else ''
+        with print_lock:
+            print(f'\t{table_name}{model}: {rows:,} rows, {mb:,.1f} MB in {seconds:,.1f} s '
+                  f'({rows/seconds:,.0f} rows/s, {mb/seconds:,.1f} MB/s)' + (', checksum matches' if verify else ''))
+
+    phase_seconds = {}
+
+    # Indexes that a previous upload dropped and did not rebuild. They are rebuilt with the others.
+    index_paths = {db_name: dropped_indexes_path(index_folder, db_name) for db_name in db_names}
+    indexes = {db_name: read_dropped_indexes(path) for db_name, path in index_paths.items()}
+    n_pending = sum(map(len, indexes.values()))
+    if n_pending:
+        print(f'{n_pending} indexes dropped by a previous upload were not rebuilt. They are rebuilt after this one.')
+
+    # Drop the secondary indexes for the load (they are rebuilt below, even if the load fails). Their
+    # definitions are saved first, in case the upload is stopped before they are rebuilt.
+    if rebuild_indexes and not staged:
+        t0 = time.time()
+        n_dropped = 0
+        for db_name, engine in engines.items():
+            dropped = secondary_indexes(engine, table_names)
+            indexes[db_name] = indexes[db_name] + dropped
+            save_dropped_indexes(indexes[db_name], index_paths[db_name])
+            for _, index_name, _ in dropped:
+                run_statement(engine, f'drop index {index_name}')
+            n_dropped += len(dropped)
+        phase_seconds['drop indexes'] = time.time() - t0
+        print(f'Dropped {n_dropped} secondary indexes for the load.')
+
+    try:
+        print(f"{'Staging' if staged else 'Uploading'} {len(table_names)} tables, {n_workers} at a time...")
+        t0 = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                list(pool.map(upload_table, uploads))
+        except Exception:
+            if staged:
+                print('\tStaging failed. The tables in Cosmic Frog were not changed.')
+                for engine in engines.values():
+                    drop_staged_tables(engine, table_names)
+            raise
+        phase_seconds['load'] = time.time() - t0
+        print(f'\tDone in {phase_seconds["load"]:,.1f} s.')
+
+        if staged:
+            print('Swapping the staged tables into place...')
+            staged_columns = {table_name: ', '.join('"{}"'.format(k) for k in table.columns)
+                              for table_name, table in data_to_upload.items()}
+            t0 = time.time()
+            swapped = []
+            try:
+                for db_name, engine in engines.items():
+                    n_rebuilt = swap_staged_tables(engine, staged_columns, rebuild_indexes, indexes[db_name])
+                    swapped.append(db_name)
+                    indexes[db_name] = []
+                    save_dropped_indexes([], index_paths[db_name])
+                    print(f'\t{db_name}: done' + (f', {n_rebuilt} indexes rebuilt.' if n_rebuilt else '.'))
+            except Exception:
+                not_swapped = [name for name in db_names if name not in swapped]
+                print(f"\tSwapping failed in {db_name}. The tables in {', '.join(not_swapped)} were not changed.")
+                if swapped:
+                    print(f"\tThe tables in {', '.join(swapped)} were already swapped and have the new data.")
+                for engine in engines.values():
+                    drop_staged_tables(engine, table_names)
+                raise
+            phase_seconds['swap'] = time.time() - t0
+
+    finally:
+        rebuilds = [(engines[db_name], if_not_exists(definition)) for db_name, db_indexes in indexes.items()
+                    for _, _, definition in db_indexes]
+        if rebuilds:
+            print(f'Rebuilding {len(rebuilds)} indexes, {n_workers} at a time...')
+            t0 = time.time()
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                list(pool.map(lambda rebuild: run_statement(*rebuild), rebuilds))
+            phase_seconds['rebuild indexes'] = time.time() - t0
+            for db_name, db_indexes in indexes.items():
+                if db_indexes:
+                    save_dropped_indexes([], index_paths[db_name])
+
+    # Update the planner statistics of the loaded tables.
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        list(pool.map(lambda upload: run_statement(engines[upload[1]], f'analyze {upload[0]}'), uploads))
+    phase_seconds['analyze'] = time.time() - t0
+
+    print('Upload time by phase: ' + ', '.join(f'{phase} {seconds:,.1f} s'
+                                               for phase, seconds in phase_seconds.items()))
+
+    for engine in engines.values():
+        engine.dispose()
+
+
+def update_columns(engine, table_name, keys, columns, payload):
+# =============================================================================
+#     Updates columns of a table in a Cosmic Frog model from the COPY payload of its primary keys
+#     and those columns, in one transaction. Returns the number of rows updated (-1 if unknown), and
+#     the number of rows in the model's table.
+# =============================================================================
+    temp_name = f'tmp_{table_name}'
+    all_columns = ', '.join('"{}"'.format(k) for k in keys + columns)
+    key_match = ' and '.join('t."{0}" = s."{0}"'.format(k) for k in keys)
+    assignments = ', '.join('"{0}" = s."{0}"'.format(c) for c in columns)
+
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f'create temp table {temp_name} on commit drop as '
+                        f'select {all_columns} from {table_name} limit 0')
+            cur.copy_expert(sql=f'COPY {temp_name} ({all_columns}) FROM STDIN WITH CSV',
+                            file=StringIO(payload))
+            cur.execute(f'update {table_name} t set {assignments} from {temp_name} s where {key_match}')
+            updated = cur.rowcount
+            cur.execute(f'select count(*) from {table_name}')
+            model_rows = cur.fetchone()[0]
+        dbapi_conn.commit()
+    finally:
+        dbapi_conn.close()
+    return updated, model_rows
+
+
+def update_columns_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAME, data_to_upload, columns_to_update):
+# =============================================================================
+#     Updates only some columns (columns_to_update: table name -> list of columns) of the tables in
+#     data_to_upload, matching the rows by primary key, in the Cosmic Frog model OUTPUT_DB_NAME (or
+#     every model in a list).
+#
+#     Tables whose primary keys are empty or not unique, whose rows are not all in the model, or
+#     whose row count in the model is not the same (the model has rows the table does not), are
+#     replaced in full instead.
+# =============================================================================
+    db_names = [OUTPUT_DB_NAME] if isinstance(OUTPUT_DB_NAME, str) else list(OUTPUT_DB_NAME)
+    print(f"Connecting to Cosmic Frog to update columns in: {', '.join(db_names)}")
+    engines = {db_name: output_engine(USER_NAME, APP_KEY, db_name) for db_name in db_names}
+
+    with ThreadPoolExecutor(max_workers=len(engines)) as pool:
+        for table_name, columns in columns_to_update.items():
+            table = data_to_upload[table_name]
+            if 'index' in table.columns:
+                del table['index']
+            keys = primary_keys[table_name]
+            columns = [c for c in columns if c in table.columns]
+            if not columns:
+                continue
+
+            if table[keys].isna().any().any() or table.duplicated(subset=keys).any():
+                print(f'\t{table_name} has empty or duplicated primary keys. Replacing it instead.')
+                column_list, payload = copy_payload(table)
+                uploads = [pool.submit(replace_table, engine, table_name, column_list, [payload])
+                           for engine in engines.values()]
+                for upload in uploads:
+                    upload.result()
+                continue
+
+            print(f"Updating {', '.join(columns)} in table: {table_name}...")
+            _, payload = copy_payload(table[keys + columns])
+            uploads = {db_name: pool.submit(update_columns, engine, table_name, keys, columns, payload)
+                       for db_name, engine in engines.items()}
+
+            # Rows that are not in the model were not updated, and rows that are only in the model
+            # were not set; replace the table in that model.
+            column_list, full_payload = None, None
+            for db_name, upload in uploads.items():
+                updated, model_rows = upload.result()
+                if updated not in (-1, len(table)) or model_rows != len(table):
+                    print(f'\t{updated:,} of {len(table):,} rows found in {db_name}, which has {model_rows:,} '
+                          f'rows. Replacing the table instead.')
+                    if full_payload is None:
+                        column_list, full_payload = copy_payload(table)
+                    replace_table(engines[db_name], table_name, column_list, [full_payload])
+            print('\tDone.')
+
+    for engine in engines.values():
+        engine.dispose()
+
+
+def row_fingerprints(table, keys):
+# =============================================================================
+#     Returns the fingerprint of each row of table: its primary key values (as text) and a hash of
+#     the whole row, as it is sent in the COPY payload. Returns None if a primary key column is
+#     missing, empty or not unique (the table is then always replaced in full).
+# =============================================================================
+    if not set(keys) <= set(table.columns) or table[keys].isna().any().any() \
+            or table.duplicated(subset=keys).any():
+        return None
+
+    text = pd.DataFrame({name: values.astype(str) for name, values in zip(table.columns, copy_columns(table))})
+    # Hash the columns in name order, so the same rows with their columns moved (e.g. the keys
+    # moved to the front by set_index / reset_index) have the same fingerprints.
+    text = text[sorted(text.columns, key=str)]
+    fingerprints = text[keys].copy()
+    fingerprints['rowhash'] = pd.util.hash_pandas_object(text, index=False).to_numpy()
+    return fingerprints
+
+
+def upload_record(fingerprints, checksums=None):
+# =============================================================================
+#     Returns the record of what a model holds of a table, the baseline of its next delta upload:
+#     the table's row fingerprints (see row_fingerprints), and its checksum in each model (model
+#     name -> checksum, see model_checksum). A model without a checksum gets the table in full.
+# =============================================================================
+    return {'fingerprints': fingerprints, 'checksums': dict(checksums or {})}
+
+
+def table_delta(baseline, fingerprints):
+# =============================================================================
+#     Compares the row fingerprints of a table with the baseline fingerprints (what the model
+#     holds). Returns the positions of the new and changed rows in the table, and the primary keys
+#     of the rows to delete.
+# =============================================================================
+    keys = [c for c in fingerprints.columns if c != 'rowhash']
+    merged = fingerprints.reset_index(drop=True).reset_index(names='position').merge(
+        baseline, how='outer', on=keys, suffixes=('', '_old'), indicator=True)
+
+    changed = (merged['_merge'] == 'left_only') | \
+              ((merged['_merge'] == 'both') & (merged['rowhash'] != merged['rowhash_old']))
+    positions = merged.loc[changed, 'position'].astype(int).to_numpy()
+    deleted = merged.loc[merged['_merge'] == 'right_only', keys]
+    return np.sort(positions), deleted
+
+
+def apply_delta(engine, table_name, keys, table, upsert_payload, delete_payload, expected_checksum,
+                verify=False):
+# =============================================================================
+#     Applies a table delta to a Cosmic Frog model in one transaction: the rows in upsert_payload
+#     (all columns) are updated by primary key, or inserted if they are new, and the rows whose
+#     primary keys are in delete_payload are deleted. table is the whole table after the delta, as
+#     a DataFrame.
+#
+#     Nothing is changed, and None is returned, if the table's checksum (see model_checksum) is not
+#     expected_checksum (the model does not hold what the delta was computed against). Otherwise
+#     the table's checksum after the delta is returned, computed from table (see
+#     expected_model_checksum).
+#
+#     If verify is True, the table's upload checksum after the delta is compared with table's
+#     before the transaction is committed, and a ValueError is raised (and nothing changed) if they
+#     do not match.
+# =============================================================================
+    columns = list(table.columns)
+    all_columns = ', '.join('"{}"'.format(c) for c in columns)
+    key_columns = ', '.join('"{}"'.format(k) for k in keys)
+    key_match = ' and '.join('t."{0}" = s."{0}"'.format(k) for k in keys)
+    assignments = ', '.join('"{0}" = s."{0}"'.format(c) for c in columns if c not in keys)
+
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            # Keep other sessions from changing the table between the check and the delta.
+            cur.execute(f'lock table {table_name} in share row exclusive mode')
+            model_columns = model_checksum_columns(cur, table_name, columns)
+            if model_checksum(cur, table_name, columns, model_columns) != expected_checksum:
+                dbapi_conn.rollback()
+                return None
+
+            if upsert_payload:
+                cur.execute(f'create temp table tmp_{table_name} on commit drop as '
+                            f'select {all_columns} from {table_name} limit 0')
+                cur.copy_expert(sql=f'COPY tmp_{table_name} ({all_columns}) FROM STDIN WITH CSV',
+                                file=StringIO(upsert_payload))
+                if assignments:
+                    cur.execute(f'update {table_name} t set {assignments} from tmp_{table_name} s '
+                                f'where {key_match}')
+                cur.execute(f'insert into {table_name} ({all_columns}) select {all_columns} '
+                            f'from tmp_{table_name} s where not exists '
+                            f'(select 1 from {table_name} t where {key_match})')
+
+            if delete_payload:
+                cur.execute(f'create temp table tmp_{table_name}_deleted on commit drop as '
+                            f'select {key_columns} from {table_name} limit 0')
+                cur.copy_expert(sql=f'COPY tmp_{table_name}_deleted ({key_columns}) FROM STDIN WITH CSV',
+                                file=StringIO(delete_payload))
+                cur.execute(f'delete from {table_name} t using tmp_{table_name}_deleted s where {key_match}')
+
+            if verify:
+                checked_columns = checksum_columns(cur, table_name, all_columns)
+                check_checksum(cur, table_name, checked_columns,
+                               table_checksum(table, checked_columns))
+        dbapi_conn.commit()
+    finally:
+        dbapi_conn.close()
+    return expected_model_checksum(table, model_columns)
+
+
+def read_model_checksum_columns(engine, table_name, column_names):
+# =============================================================================
+#     Returns the checksum columns of a table's model checksum (see model_checksum_columns). Only
+#     the column types are read, not the table.
+# =============================================================================
+    dbapi_conn = engine.raw_connection()
+    try:
+        with dbapi_conn.cursor() as cur:
+            checked_columns = model_checksum_columns(cur, table_name, column_names)
+        dbapi_conn.rollback()
+    finally:
+        dbapi_conn.close()
+    return checked_columns
+
+
+def upload_changes_to_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAME, data_to_upload, baselines, verify=False):
+# =============================================================================
+#     Uploads only the changed rows of the tables in data_to_upload to the Cosmic Frog model
+#     OUTPUT_DB_NAME (or every model in a list). baselines holds, for each model, the record (see
+#     upload_record) of the tables the model holds now (model name -> table name -> record). Tables
+#     with no baseline, or whose checksum in the model is not the one in their baseline (e.g. the
+#     table was edited by hand since), are replaced in full. Tables with no changed rows are not
+#     checked: the model is not connected to for them, and they keep their baseline checksum, so a
+#     table edited by hand is only replaced once the update changes it too.
+#
+#     If verify is True, each table's checksum in the model after the upload is compared with the
+#     checksum of the whole table before it is committed (see apply_delta and replace_table). A
+#     delta that does not match is not applied, and the table is replaced instead.
+#
+#     Returns the records of the uploaded tables (table name -> record, see upload_record), which
+#     are the baselines of the next upload.
+# =============================================================================
+    db_names = [OUTPUT_DB_NAME] if isinstance(OUTPUT_DB_NAME, str) else list(OUTPUT_DB_NAME)
+    print(f"Connecting to Cosmic Frog to upload changes to: {', '.join(db_names)}")
+    engines = {db_name: output_engine(USER_NAME, APP_KEY, db_name) for db_name in db_names}
+
+    uploaded = {}
+    with ThreadPoolExecutor(max_workers=len(engines)) as pool:
+        for table_name, table in data_to_upload.items():
+            if 'index' in table.columns:
+                del table['index']
+            keys = primary_keys[table_name]
+            fingerprints = row_fingerprints(table, keys)
+            checksums = {}
+            local_checksums = {}
+            checksum_lock = threading.Lock()
+
+            def replaced_checksum(db_name):
+                # The table's checksum in a model after it is replaced, computed once per column
+                # types (sibling models usually have the same).
+                checked_columns = read_model_checksum_columns(engines[db_name], table_name, table.columns)
+                with checksum_lock:
+                    key = tuple(checked_columns)
+                    if key not in local_checksums:
+                        local_checksums[key] = expected_model_checksum(table, checked_columns)
+                    return local_checksums[key]
+
+            def upload_table(db_name):
+                note = ''
+                baseline = baselines.get(db_name, {}).get(table_name)
+                if not isinstance(baseline, dict):
+                    baseline = upload_record(None)    # No baseline, or one saved before checksums were kept.
+                old_fingerprints = baseline['fingerprints']
+                expected_checksum = baseline['checksums'].get(db_name)
+                if fingerprints is not None and old_fingerprints is not None and expected_checksum is not None \
+                        and list(old_fingerprints.columns) == list(fingerprints.columns):
+                    positions, deleted = table_delta(old_fingerprints, fingerprints)
+                    if len(positions) == 0 and len(deleted) == 0:
+                        checksums[db_name] = expected_checksum
+                        return f'{db_name}: unchanged'
+
+                    _, upsert_payload = copy_payload(table.iloc[positions])
+                    _, delete_payload = copy_payload(deleted)
+                    try:
+                        checksum = apply_delta(engines[db_name], table_name, keys, table,
+                                               upsert_payload if len(positions) else '',
+                                               delete_payload if len(deleted) else '', expected_checksum,
+                                               verify)
+                        if checksum is not None:
+                            checksums[db_name] = checksum
+                            return f'{db_name}: {len(positions):,} rows new or changed, {len(deleted):,} deleted'
+                        note = ' (the model was changed since the previous upload)'
+                    except ValueError:
+                        note = ' (the delta did not match its checksum)'
+
+                columns, payload = copy_payload(table)
+                replace_table(engines[db_name], table_name, columns, [payload], table if verify else None,
+                              f'{table_name} to {db_name}')
+                checksums[db_name] = replaced_checksum(db_name)
+                return f'{db_name}: replaced ({len(table):,} rows)' + note
+
+            print(f'Uploading changes to table: {table_name}...')
+            for result in pool.map(upload_table, db_names):
+                print(f'\t{result}')
+            uploaded[table_name] = upload_record(fingerprints, checksums)
+
+    for engine in engines.values():
+        engine.dispose()
+    return uploaded
+
+
+def read_upload_fingerprints(path):
+# =============================================================================
+#     Reads the fingerprints of the tables last uploaded to each model (model name -> table name ->
+#     fingerprints). Returns an empty dictionary if there are none.
+# =============================================================================
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_upload_fingerprints(upload_fingerprints, path):
+# =============================================================================
+#     Saves the fingerprints of the tables last uploaded to each model. The file is written next
+#     to path first, then moved over it, so it is never left half-written.
+# =============================================================================
+    with open(path + '.new', 'wb') as f:
+        pickle.dump(upload_fingerprints, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.new', path)
+
+
+def record_upload(upload_fingerprints, db_names, uploaded):
+# =============================================================================
+#     Updates the record of what each model holds (model name -> table name -> record, see
+#     upload_record) after an upload to db_names. uploaded holds the records of the uploaded tables,
+#     or is None if the upload was not fingerprinted: the models are then dropped from the record, so
+#     their next delta upload replaces every table.
+# =============================================================================
+    db_names = [db_names] if isinstance(db_names, str) else list(db_names)
+    for db_name in db_names:
+        if uploaded is None:
+            upload_fingerprints.pop(db_name, None)
+        else:
+            upload_fingerprints[db_name] = {**upload_fingerprints.get(db_name, {}), **uploaded}
+    return upload_fingerprints
@@ -0,0 +1,87 @@
+# =============================================================================
+# The purpose of this script is to rank, for every customer (or return location), its k nearest
+# eligible depots on the customer fulfillment (or replenishment) policy lanes.
+#
+# Depots are ordered by distance, then depot type, then depot name, which is the same order the
+# closest depot identifier in workflow 020 uses. Instead of sorting every lane, the k nearest
+# depots are selected in k passes over the eligible lanes: each pass takes the per-customer minimum
+# of the lanes not ranked yet, as a row reduction over the customer x depot lane matrix (see
+# lane_matrix.py). This is a linear pass per rank, so it is much cheaper than a full sort when k
+# is small.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+from lane_matrix import build_lane_matrix, to_csr_order, row_broadcast, row_reduce
+
+
+def sorted_codes(values, rows):
+# =============================================================================
+#     Returns integer codes of values[rows] that sort in the same order as the values (-1 for
+#     empty values), and the number of distinct codes.
+#
+#     Categorical columns with sorted categories (see table_encoding.py) already have such codes,
+#     so only other columns are factorized.
+# =============================================================================
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.is_monotonic_increasing:
+        return values.cat.codes.to_numpy(np.int64)[rows], len(values.cat.categories)
+
+    codes, uniques = pd.factorize(values.to_numpy(object)[rows], sort=True)
+    return codes.astype(np.int64), len(uniques)
+
+
+def rank_nearest_depots(df, group_col, depot_col, depottype_col, eligible, k=1):
+# =============================================================================
+#     Ranks the k nearest eligible depots of every group (customer or return location) in df.
+#
+#     df must have group_col, depot_col, depottype_col and 'distance' columns. eligible is a
+#     boolean mask over the rows of df (e.g. Include status and Full Service / Sort Only depots).
+#
+#     Returns a numpy float array with the rank (1 = closest) of each row, and NaN for rows that
+#     are not eligible or not in the k nearest. If a (group, depot) lane is repeated, only the
+#     first row is ranked.
+# =============================================================================
+    group_codes, groups = pd.factorize(df[group_col])
+    eligible = np.asarray(eligible, dtype=bool) & (group_codes >= 0)
+
+    rows = np.flatnonzero(eligible)
+    g = group_codes[rows]
+
+    # Depot type and depot name break distance ties. Both are converted to integer codes in the
+    # same order as the strings, so one integer key replaces both sort columns.
+    type_codes, _ = sorted_codes(df[depottype_col], rows)
+    depot_codes, n_depots = sorted_codes(df[depot_col], rows)
+    tie = type_codes * (n_depots + 1) + depot_codes
+
+    # Only rank the first row of a repeated lane.
+    first = ~pd.DataFrame({'g': g, 'd': depot_codes}).duplicated().to_numpy()
+    rows, g, tie = rows[first], g[first], tie[first]
+
+    dist = df['distance'].astype(float).to_numpy()[rows]
+    dist = np.where(np.isnan(dist), np.inf, dist)
+
+    # Hold the lanes as a group x depot lane matrix, so the per-group minimums are row reductions.
+    lanes = build_lane_matrix(g, depot_codes[first], n_rows=len(groups))
+    dist, tie = to_csr_order(lanes, dist), to_csr_order(lanes, tie)
+
+    ranks = np.full(len(df), np.nan)
+    remaining = np.ones(len(dist), dtype=bool)
+    for rank in range(1, k+1):
+        if not remaining.any():
+            break
+
+        # Nearest remaining lanes of each group.
+        rem_dist = np.where(remaining, dist, np.inf)
+        nearest = remaining & (rem_dist == row_broadcast(lanes, row_reduce(lanes, rem_dist)))
+
+        # Break distance ties on depot type, then depot name.
+        max_tie = np.iinfo(np.int64).max
+        near_tie = np.where(nearest, tie, max_tie)
+        chosen = nearest & (near_tie == row_broadcast(lanes, row_reduce(lanes, near_tie, empty=max_tie)))
+
+        ranks[rows[lanes['lanes'][chosen]]] = rank
+        remaining &= ~chosen
+
+    return ranks
+
@@ -137,6 +137,8 @@ def pull_data_from_excel():
 #     that happen when storing data in Excel. Specifically:
 #         1) Make sure there are no rows with duplicated primary keys.
 #         2) Ensure one-to-one relationships between location attributes (codes, names, etc.)
+#
+#     Sheets marked 'optional' are skipped (without an error) if the Excel file does not have them.
 # =============================================================================
     
     excel_info = {
@@ -181,6 +183,16 @@ def pull_data_from_excel():
                                                              'Last 90 Days # Loads', 'Trans Comments (Y/N)'],
                                           'allowed_vals' : None
                                           },
+        
+        # Optional. If this tab is not in the workbook, the default transfer rules are used.
+        'Transfer Rules':{'filename' : SOIP_OPT_ASSUMPTIONS_FILENAME,
+                          'start_row' : 0,
+                          'key_cols' : ['Origin Depot Type'],
+                          'loc_attributes' : None,
+                          'nonempty_cols' : ['Origin Depot Type'],
+                          'allowed_vals' : None,
+                          'optional' : True
+                          },
                   
         'Depot Assignments':{'filename' : SOIP_DEPOT_ASSIGNMENTS_FILENAME,
                              'start_row' : 0,
@@ -234,6 +246,13 @@ def pull_data_from_excel():
         allowed_vals = info['allowed_vals']
         
         try:
+            # Skip optional sheets that are not in the Excel file.
+            if info.get('optional', False):
+                with pd.ExcelFile(os.path.join('..', 'data', filename)) as xl:
+                    if sheetname not in xl.sheet_names:
+                        print(f"\tOptional '{sheetname}' tab not found in '{filename}'. Skipping.")
+                        continue
+            
             # 1. Read the data.
             df = pd.read_excel(os.path.join('..', 'data', filename), 
                                                  sheet_name = sheetname,
@@ -0,0 +1,88 @@
+# =============================================================================
+# The purpose of this script is to aggregate a forecast table (customerdemand, or the returns rows
+# of productionconstraints) once, so that every workflow that needs a per-location total or average
+# can read it from the same precomputed arrays.
+#
+# A forecast cube is a dictionary with:
+#     'names'   : pandas Index of location names (customername or facilityname), one per row.
+#     'periods' : numpy array of period numbers, parsed once from the last two characters of
+#                 periodname (e.g. 'P07' -> 7), one per column. Sorted ascending.
+#     'sums'    : 2-D numpy array (names x periods) with the sum of the forecast values.
+#     'counts'  : 2-D numpy array (names x periods) with the number of non-null forecast rows.
+#
+# Keeping the row counts next to the sums lets forecast_mean() return the same result as
+# DataFrame.groupby().mean() over the original rows.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+
+def parse_period_numbers(periodnames):
+# =============================================================================
+#     Converts period names to their period number, i.e. the last two characters as an integer.
+# =============================================================================
+    return periodnames.str[-2:].astype(int).to_numpy()
+
+
+def build_forecast_cube(df, name_col, value_col):
+# =============================================================================
+#     Builds a forecast cube from df, grouping value_col by name_col and period number.
+#     Rows without a name are dropped (as DataFrame.groupby() does).
+# =============================================================================
+    name_codes, names = pd.factorize(df[name_col])
+    period_numbers = parse_period_numbers(df['periodname'])
+    periods, period_codes = np.unique(period_numbers, return_inverse=True)
+
+    values = df[value_col].astype(float).to_numpy()
+    has_value = ~np.isnan(values)
+    keep = name_codes >= 0
+
+    # Flatten (name, period) to one cell index so both matrices are a single bincount.
+    cells = name_codes[keep] * len(periods) + period_codes[keep]
+    size = len(names) * len(periods)
+    sums = np.bincount(cells, weights=np.where(has_value, values, 0)[keep], minlength=size)
+    counts = np.bincount(cells, weights=has_value[keep], minlength=size)
+
+    cube = {'names': pd.Index(names, name=name_col),
+            'periods': periods,
+            'sums': sums.reshape(len(names), len(periods)),
+            'counts': counts.reshape(len(names), len(periods))}
+    return cube
+
+
+def period_window(cube, first_period=None, last_period=None):
+# =============================================================================
+#     Returns a boolean mask over the period axis of the cube, for periods between first_period
+#     and last_period (inclusive). None means no limit on that side.
+# =============================================================================
+    window = np.ones(len(cube['periods']), dtype=bool)
+    if first_period is not None:
+        window &= cube['periods'] >= first_period
+    if last_period is not None:
+        window &= cube['periods'] <= last_period
+    return window
+
+
+def forecast_sum(cube, first_period=None, last_period=None):
+# =============================================================================
+#     Returns the total forecast per location over the period window, as a Series indexed by
+#     location name. Locations with no forecast in the window get 0.
+# =============================================================================
+    window = period_window(cube, first_period, last_period)
+    return pd.Series(cube['sums'][:, window].sum(axis=1), index=cube['names'])
+
+
+def forecast_mean(cube, first_period=None, last_period=None):
+# =============================================================================
+#     Returns the average forecast row per location over the period window, as a Series indexed
+#     by location name. Locations with no forecast rows in the window get NaN.
+# =============================================================================
+    window = period_window(cube, first_period, last_period)
+    sums = cube['sums'][:, window].sum(axis=1)
+    counts = cube['counts'][:, window].sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+
+    return pd.Series(means, index=cube['names'])
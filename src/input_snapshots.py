@@ -0,0 +1,312 @@
+# =============================================================================
+# The purpose of this script is to find what changed in the inputs since the previous run, and
+# which Cosmic Frog tables those changes can affect (the input change report).
+#
+# After each run with UPLOAD_CHANGED_TABLES_ONLY or SCALAR_FAST_PATH, a snapshot of the inputs is
+# saved in the data folder. The snapshot holds one 64-bit hash per row of every input (Excel sheets,
+# data warehouse extracts and Cosmic Frog input tables; only the Excel sheets and user inputs for
+# SCALAR_FAST_PATH alone) rather than the data itself, so it stays small. On the next run, the new inputs are
+# hashed the same way and compared with the snapshot, which gives the number of added and removed
+# rows per input.
+#
+# Besides the pulled inputs, the snapshot holds the lane distance cache as it was read, and the lane
+# statistics window that the costs per load are computed from (both are kept in the data folder
+# between runs, so they are inputs too).
+#
+# The change report lists, for each changed input, the Cosmic Frog tables that read it
+# (INPUT_DEPENDENCIES, from the workflows in soip_model_update_process.py). Every table is still
+# recomputed in full: changed input rows are not traced to the table rows they affect. A changed
+# row can change rows with other keys (e.g. a depot's status in Depot Assumptions changes which
+# depots are ranked nearest to, and which candidate lanes are kept for, every customer around it),
+# so a row mask taken from the input's keys would miss rows. Only the upload is done per row, with
+# UPLOAD_MODE = 'delta' (see cosmic_frog_upload.py).
+#
+# With UPLOAD_CHANGED_TABLES_ONLY, the snapshot also holds one hash per computed Cosmic Frog table.
+# Only the tables whose hash differs from the previous run's are uploaded, so the tables to upload
+# do not depend on INPUT_DEPENDENCIES being complete. The other tables in the output model are left
+# as they were after the previous run.
+#
+# The scalar parameters in user_inputs.py (SCALAR_PARAMETER_COLUMNS) are each snapshotted on their
+# own, and the other user inputs as one 'user inputs' input. When only scalar parameters changed,
+# only the columns they are used for can change (see scalar_fast_path.py).
+#
+# The scalar fast path does not pull the Cosmic Frog input model, so with SCALAR_FAST_PATH the
+# snapshot also holds a checksum of each of its tables (see model_checksums in
+# cosmic_frog_upload.py), over the columns that were pulled. The fast path is only taken if the
+# input model's tables still have those checksums.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+import os
+import pickle
+import hashlib
+
+# Every Cosmic Frog table that the update process uploads.
+OUTPUT_TABLES = ['customerfulfillmentpolicies', 'customers', 'facilities', 'groups',
+                 'inventoryconstraints', 'inventorypolicies', 'periods', 'productionconstraints',
+                 'productionpolicies', 'replenishmentpolicies', 'transportationpolicies',
+                 'warehousingpolicies']
+
+# Inputs (Excel sheets and data warehouse extracts) and the tables they are used to update.
+# Inputs that are not listed here (e.g. the Cosmic Frog input tables and the user inputs) are
+# treated as affecting every table.
+INPUT_DEPENDENCIES = {
+    # Excel sheets.
+    'Depot Assumptions'              : ['customerfulfillmentpolicies', 'facilities',
+                                        'inventoryconstraints', 'inventorypolicies',
+                                        'productionconstraints', 'productionpolicies',
+                                        'replenishmentpolicies', 'warehousingpolicies'],
+    'Depot Assignments'              : ['customerfulfillmentpolicies', 'replenishmentpolicies'],
+    'Renter Assumptions'             : ['customerfulfillmentpolicies'],
+    'MultiSource List'               : ['customerfulfillmentpolicies', 'replenishmentpolicies',
+                                        'groups'],
+    'RenterDistSort Preferred Depot' : ['customerfulfillmentpolicies', 'replenishmentpolicies'],
+    'Transfer Rules'                 : ['replenishmentpolicies'],
+    'SCAC Types'                     : ['transportationpolicies', 'customerfulfillmentpolicies',
+                                        'replenishmentpolicies'],
+    'Trans RFQ Rates'                : ['transportationpolicies', 'customerfulfillmentpolicies',
+                                        'replenishmentpolicies'],
+    # Data warehouse extracts.
+    'tbl_tab_Location'                 : ['customers', 'facilities'],
+    'nbr_of_depots'                    : ['customerfulfillmentpolicies', 'replenishmentpolicies'],
+    'transport_rates_hist_load_counts' : ['transportationpolicies', 'customerfulfillmentpolicies',
+                                          'replenishmentpolicies'],
+    'transport_rates_hist_costs'       : ['transportationpolicies', 'customerfulfillmentpolicies',
+                                          'replenishmentpolicies'],
+    'transport_load_size'              : ['customers', 'facilities', 'transportationpolicies'],
+    # Files kept in the data folder between runs.
+    'lane distance cache'              : ['customerfulfillmentpolicies', 'replenishmentpolicies'],
+    'lane statistics window'           : ['transportationpolicies', 'customerfulfillmentpolicies',
+                                          'replenishmentpolicies'],
+    }
+
+# Scalar parameters in user_inputs.py, and the columns of each table they are used for.
+SCALAR_PARAMETER_COLUMNS = {
+    'NewPalletCost'           : {'customerfulfillmentpolicies': ['unitcost']},
+    'Fuel_Surcharge'          : {'transportationpolicies': ['unitcost']},
+    'Duty_Rate_US_to_Canada'  : {'transportationpolicies': ['dutyrate']},
+    'Duty_Rate_Canada_to_US'  : {'transportationpolicies': ['dutyrate']},
+    'Avg_Load_Size_Issues'    : {'customers': ['avgloadsz'],
+                                 'transportationpolicies': ['averageshipmentsize']},
+    'Avg_Load_Size_Returns'   : {'facilities': ['avgloadsz'],
+                                 'transportationpolicies': ['averageshipmentsize']},
+    'Avg_Load_Size_Transfers' : {'facilities': ['avgloadsz'],
+                                 'transportationpolicies': ['averageshipmentsize']},
+    }
+INPUT_DEPENDENCIES.update({name: list(columns) for name, columns in SCALAR_PARAMETER_COLUMNS.items()})
+
+# User inputs that only change how the update runs, not its results. They are left out of the
+# 'user inputs' snapshot.
+RUN_SETTINGS = ['UPLOAD_CHANGED_TABLES_ONLY', 'SCALAR_FAST_PATH', 'SCENARIO_WORKERS', 'STAGE_BACKENDS',
+                'MAX_PEAK_MEMORY_MULTIPLE', 'UPLOAD_MODE', 'UPLOAD_FINGERPRINTS_FILENAME',
+                'UPLOAD_WORKERS', 'REBUILD_INDEXES', 'VERIFY_UPLOADS', 'SCALAR_FAST_PATH_FILENAME',
+                'PULLED_DATA_FILENAME']
+
+
+def row_hashes(df):
+# =============================================================================
+#     Returns one 64-bit hash per row of df (over its values, not its index), sorted.
+# =============================================================================
+    df = df.reset_index(drop=True)
+    # Hash the columns in name order, so a reordered sheet does not count as changed.
+    df = df[sorted(df.columns, key=str)]
+    return np.sort(pd.util.hash_pandas_object(df, index=False).to_numpy(np.uint64))
+
+
+def table_hash(df):
+# =============================================================================
+#     Returns one hash of the whole table df: its column names and its row hashes. Like the row
+#     hashes, it does not depend on the order of the rows or columns.
+# =============================================================================
+    digest = hashlib.sha256(repr(sorted(map(str, df.columns))).encode())
+    digest.update(row_hashes(df).tobytes())
+    return digest.hexdigest()
+
+
+def value_hash(value):
+# =============================================================================
+#     Returns a hash of a Python value (number, string, list, etc.), as a one-element row hash
+#     array.
+# =============================================================================
+    digest = hashlib.sha256(repr(value).encode()).digest()
+    return np.array([int.from_bytes(digest[:8], 'little')], dtype=np.uint64)
+
+
+def user_input_hashes(settings):
+# =============================================================================
+#     Returns the row hashes of the user inputs (settings is a dictionary of user input name ->
+#     value, e.g. vars(user_inputs)): one input per scalar parameter, and one 'user inputs' input
+#     for all of the other user inputs (except RUN_SETTINGS).
+# =============================================================================
+    others = sorted((name, value) for name, value in settings.items()
+                    if not name.startswith('_') and name not in SCALAR_PARAMETER_COLUMNS
+                    and name not in RUN_SETTINGS)
+
+    hashes = {'user inputs': value_hash(others)}
+    hashes.update({name: value_hash(settings[name]) for name in SCALAR_PARAMETER_COLUMNS})
+    return hashes
+
+
+def take_snapshot(inputs, output_db_name):
+# =============================================================================
+#     Returns the snapshot of the inputs: a dictionary with the output model name, and the row
+#     hashes of every input (inputs is a dictionary of input name -> DataFrame or row hashes).
+# =============================================================================
+    hashes = {name: (values if isinstance(values, np.ndarray) else row_hashes(values))
+              for name, values in inputs.items()}
+    return {'output_db_name': output_db_name, 'hashes': hashes}
+
+
+def add_to_snapshot(snapshot, name, values):
+# =============================================================================
+#     Adds an input that is only read after the snapshot is taken (e.g. the lane distance cache)
+#     to the snapshot. values is a DataFrame or its row hashes.
+# =============================================================================
+    snapshot['hashes'][name] = values if isinstance(values, np.ndarray) else row_hashes(values)
+
+
+def read_snapshot(path):
+# =============================================================================
+#     Reads the previous run's snapshot. Returns None if there is none.
+# =============================================================================
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_snapshot(snapshot, path):
+# =============================================================================
+#     Saves the snapshot for the next run. If snapshot is None (none was taken), the previous run's
+#     snapshot is removed instead, as the output model no longer holds the tables it describes.
+# =============================================================================
+    if snapshot is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def compare_snapshots(previous, current):
+# =============================================================================
+#     Compares the current snapshot with the previous one.
+#
+#     Returns the change summary, a DataFrame with one row per input: the number of rows before
+#     and now, the rows added and removed, and the tables the input is used to update.
+# =============================================================================
+    summary = []
+    for name, new in current['hashes'].items():
+        old = previous['hashes'].get(name) if previous is not None else None
+        if old is None:
+            added, removed = len(new), 0
+        else:
+            # Multiset difference of the sorted row hashes.
+            old_ids, old_counts = np.unique(old, return_counts=True)
+            new_ids, new_counts = np.unique(new, return_counts=True)
+            counts = pd.concat([pd.Series(old_counts, index=old_ids, name='old'),
+                                pd.Series(new_counts, index=new_ids, name='new')], axis=1).fillna(0)
+            added = int((counts['new'] - counts['old']).clip(lower=0).sum())
+            removed = int((counts['old'] - counts['new']).clip(lower=0).sum())
+
+        summary.append({'input': name,
+                        'rows before': len(old) if old is not None else None,
+                        'rows now': len(new),
+                        'rows added': added,
+                        'rows removed': removed,
+                        'changed': old is None or added > 0 or removed > 0,
+                        'affects': ', '.join(INPUT_DEPENDENCIES.get(name, ['all tables']))})
+
+    return pd.DataFrame(summary)
+
+
+def only_scalars_changed(previous, current, output_db_name):
+# =============================================================================
+#     Returns True if the inputs in current (a dictionary of input name -> row hashes, e.g. the
+#     Excel sheets and user inputs) are the same as in the previous snapshot, except for the scalar
+#     parameters, and the previous snapshot was for the same output model(s).
+# =============================================================================
+    if previous is None or previous['output_db_name'] != output_db_name:
+        return False
+
+    for name, hashes in current.items():
+        if name in SCALAR_PARAMETER_COLUMNS:
+            continue
+        old = previous['hashes'].get(name)
+        if old is None or not np.array_equal(old, hashes):
+            return False
+    return True
+
+
+def fast_path_snapshot(previous, inputs, tables):
+# =============================================================================
+#     Returns the snapshot of a scalar fast path run: the previous snapshot, with the row hashes of
+#     inputs (the Excel sheets and user inputs; the input model is checked with its checksums) and
+#     the hashes of the tables it updated (tables is a dictionary of table name -> DataFrame).
+# =============================================================================
+    snapshot = {**previous, 'hashes': {**previous['hashes'], **inputs}}
+    if 'tables' in previous:
+        snapshot['tables'] = {**previous['tables'],
+                              **{name: table_hash(df) for name, df in tables.items()}}
+    return snapshot
+
+
+def record_input_model(snapshot, columns, checksums):
+# =============================================================================
+#     Records the checksums of the input model's tables in the snapshot, with the columns they are
+#     computed over (columns and checksums are dictionaries of table name -> column names and
+#     table name -> checksum).
+# =============================================================================
+    snapshot['input_model'] = {**snapshot.get('input_model', {}),
+                               **{name: (list(columns[name]), checksum) for name, checksum in checksums.items()}}
+
+
+def input_model_columns(snapshot, table_names=None):
+# =============================================================================
+#     Returns the columns that the snapshot's input model checksums are computed over (table name
+#     -> column names), for all its tables or only those in table_names.
+# =============================================================================
+    recorded = snapshot.get('input_model', {}) if snapshot is not None else {}
+    return {name: columns for name, (columns, _) in recorded.items()
+            if table_names is None or name in table_names}
+
+
+def input_model_unchanged(previous, checksums):
+# =============================================================================
+#     Returns True if the input model's tables have the checksums recorded in the previous snapshot
+#     (checksums is a dictionary of table name -> checksum, for the tables of input_model_columns).
+# =============================================================================
+    recorded = previous.get('input_model', {}) if previous is not None else {}
+    return bool(recorded) and checksums == {name: checksum for name, (_, checksum) in recorded.items()}
+
+
+def scalar_columns_to_update(summary):
+# =============================================================================
+#     Returns the columns to update per table (table name -> list of columns) for the scalar
+#     parameters that changed, given the change summary.
+# =============================================================================
+    columns = {}
+    for name in summary.loc[summary['changed'], 'input']:
+        for table_name, cols in SCALAR_PARAMETER_COLUMNS.get(name, {}).items():
+            columns.setdefault(table_name, [])
+            columns[table_name] += [c for c in cols if c not in columns[table_name]]
+    return columns
+
+
+def tables_to_update(previous, current, tables):
+# =============================================================================
+#     Adds the hash of each computed Cosmic Frog table (tables is a dictionary of table name ->
+#     DataFrame) to the current snapshot, and returns the names of the tables whose hash differs
+#     from the previous snapshot's.
+#
+#     All tables are uploaded if there is no previous snapshot, if it was for another output model
+#     (which then does not hold the previous run's tables), or if it has no table hashes (e.g. it
+#     was taken with SCALAR_FAST_PATH only).
+# =============================================================================
+    current['tables'] = {name: table_hash(df) for name, df in tables.items()}
+
+    if (previous is None or previous['output_db_name'] != current['output_db_name']
+            or 'tables' not in previous):
+        return list(tables)
+    return [name for name in tables if previous['tables'].get(name) != current['tables'][name]]
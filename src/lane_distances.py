@@ -0,0 +1,118 @@
+# =============================================================================
+# The purpose of this script is to fill in the distance of policy lanes that have no distance in
+# Cosmic Frog, for Lane Attributes (Alteryx workflow 020).
+#
+# Without a distance, a lane would count as 0 miles: it would be in the LT0050 mileage band and
+# could be picked as a closest depot. Instead, the great-circle (haversine) distance between the
+# origin's and destination's latitude / longitude is computed for all of those lanes at once, as
+# numpy arrays, and multiplied by a road circuity factor (road miles per straight-line mile).
+#
+# The great-circle distances are kept in a lane distance cache (a CSV file in the data folder), so
+# each lane is only computed once. A cached distance is reused as long as the lane's origin and
+# destination coordinates have not changed. The circuity factor is applied after the cache, so it
+# can be changed without rebuilding the cache.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+import os
+
+from location_dimension import location_keys, take
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Coordinates are rounded to this many decimals (about 0.1 m) before they are compared with the
+# cache, so values read back from the CSV file match.
+COORDINATE_DECIMALS = 6
+
+DISTANCE_CACHE_COLUMNS = ['originname', 'destinationname', 'olatitude', 'olongitude',
+                          'dlatitude', 'dlongitude', 'greatcirclemiles']
+
+
+def haversine_miles(olat, olon, dlat, dlon):
+# =============================================================================
+#     Returns the great-circle distance in miles between origin and destination coordinates (in
+#     degrees), element-wise over numpy arrays. Missing coordinates give NaN.
+# =============================================================================
+    olat, olon, dlat, dlon = (np.radians(np.asarray(x, dtype=float)) for x in (olat, olon, dlat, dlon))
+
+    a = np.sin((dlat-olat)/2)**2 + np.cos(olat)*np.cos(dlat)*np.sin((dlon-olon)/2)**2
+    return 2*EARTH_RADIUS_MILES*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def location_coordinates(loc_dim, modelids, roles=None):
+# =============================================================================
+#     Returns the latitude and longitude of each model ID from the location dimension, as float
+#     arrays rounded to COORDINATE_DECIMALS. Model IDs without coordinates get NaN.
+# =============================================================================
+    keys = location_keys(loc_dim, modelids, roles)
+    atts = loc_dim['attributes']
+
+    lat = pd.to_numeric(pd.Series(take(atts['latitude'], keys)), errors='coerce').to_numpy(float)
+    lon = pd.to_numeric(pd.Series(take(atts['longitude'], keys)), errors='coerce').to_numpy(float)
+    return np.round(lat, COORDINATE_DECIMALS), np.round(lon, COORDINATE_DECIMALS)
+
+
+def read_distance_cache(path):
+# =============================================================================
+#     Reads the lane distance cache. Returns an empty cache if the file does not exist yet.
+# =============================================================================
+    dtypes = {col: float for col in DISTANCE_CACHE_COLUMNS}
+    dtypes.update({'originname': object, 'destinationname': object})
+
+    if not os.path.exists(path):
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+    return pd.read_csv(path, dtype=dtypes)
+
+
+def save_distance_cache(cache, path):
+# =============================================================================
+#     Saves the lane distance cache.
+# =============================================================================
+    cache.to_csv(path, index=False)
+
+
+def fill_missing_distances(distance, originnames, destinationnames, loc_dim, cache,
+                           circuity_factor=1.0):
+# =============================================================================
+#     Fills the empty distances of the lanes originnames -> destinationnames with their
+#     great-circle distance times circuity_factor.
+#
+#     Great-circle distances are taken from cache (see DISTANCE_CACHE_COLUMNS) when the lane and
+#     its coordinates are in it, and computed otherwise. Lanes without coordinates keep an empty
+#     distance.
+#
+#     Returns the filled distances (numpy float array) and the updated cache.
+# =============================================================================
+    distance = np.array(distance, dtype=float)
+    missing = np.isnan(distance)
+    if not missing.any():
+        return distance, cache
+
+    lanes = pd.DataFrame({'originname': np.asarray(originnames, dtype=object)[missing],
+                          'destinationname': np.asarray(destinationnames, dtype=object)[missing]})
+    lanes['olatitude'], lanes['olongitude'] = location_coordinates(loc_dim, lanes['originname'])
+    lanes['dlatitude'], lanes['dlongitude'] = location_coordinates(loc_dim, lanes['destinationname'])
+
+    # Only compute the lanes that are not cached with the same coordinates.
+    key_cols = DISTANCE_CACHE_COLUMNS[:-1]
+    lanes = lanes.merge(cache[DISTANCE_CACHE_COLUMNS].drop_duplicates(subset=key_cols),
+                        how='left', on=key_cols)
+    lanes['greatcirclemiles'] = lanes['greatcirclemiles'].astype(float)
+
+    new = lanes['greatcirclemiles'].isna().to_numpy()
+    lanes.loc[new, 'greatcirclemiles'] = haversine_miles(lanes.loc[new, 'olatitude'],
+                                                         lanes.loc[new, 'olongitude'],
+                                                         lanes.loc[new, 'dlatitude'],
+                                                         lanes.loc[new, 'dlongitude'])
+
+    # Add the new lanes to the cache, replacing the lanes whose coordinates changed.
+    new_lanes = lanes.loc[new & lanes['greatcirclemiles'].notna().to_numpy(), DISTANCE_CACHE_COLUMNS]
+    new_lanes = new_lanes.drop_duplicates(subset=['originname', 'destinationname'])
+    if not new_lanes.empty:
+        stale = pd.MultiIndex.from_frame(cache[['originname', 'destinationname']]).isin(
+            pd.MultiIndex.from_frame(new_lanes[['originname', 'destinationname']]))
+        cache = pd.concat([cache[~stale], new_lanes], ignore_index=True)
+
+    distance[missing] = lanes['greatcirclemiles'].to_numpy(float) * circuity_factor
+    return distance, cache
@@ -0,0 +1,79 @@
+# =============================================================================
+# The purpose of this script is to join lanes on integer keys instead of string pairs.
+#
+# A lane (origin, destination) is packed into one int64 key: the origin's integer ID in the high
+# 32 bits and the destination's integer ID in the low 32 bits. The IDs are either location codes
+# parsed once into a code vocabulary (e.g. the '01234-05678' RFQ lane names), or the surrogate
+# keys of the location dimension (location_dimension.py) for lanes between model IDs.
+#
+# Lanes are then matched with one integer hash lookup (match_keys) instead of merging on
+# (oloccode, dloccode) or (originname, destinationname) string columns.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+# Location codes are the first / last 5 characters of a lane name ('01234-05678').
+LOC_CODE_LENGTH = 5
+
+
+def split_lane_names(lane_names):
+# =============================================================================
+#     Splits lane names ('01234-05678') into their origin and destination location codes.
+# =============================================================================
+    lane_names = pd.Series(lane_names)
+    return lane_names.str[0:LOC_CODE_LENGTH].to_numpy(object), \
+        lane_names.str[-LOC_CODE_LENGTH:].to_numpy(object)
+
+
+def code_vocabulary(*code_arrays):
+# =============================================================================
+#     Returns a pandas Index of the distinct location codes in all of the given arrays. The
+#     position of a code in this index is its integer ID.
+# =============================================================================
+    codes = pd.Index(np.concatenate([np.asarray(c, dtype=object) for c in code_arrays]))
+    return codes[codes.notna()].unique()
+
+
+def code_ids(vocabulary, codes):
+# =============================================================================
+#     Returns the integer ID of each location code (its position in vocabulary). Codes that are
+#     not in the vocabulary, or are empty, get -1.
+# =============================================================================
+    return vocabulary.get_indexer(np.asarray(codes, dtype=object)).astype(np.int64)
+
+
+def pack_lane_keys(origin_ids, destination_ids):
+# =============================================================================
+#     Packs origin and destination integer IDs into one int64 lane key. Lanes with a missing
+#     origin or destination (ID of -1) get -1.
+# =============================================================================
+    origin_ids = np.asarray(origin_ids, dtype=np.int64)
+    destination_ids = np.asarray(destination_ids, dtype=np.int64)
+
+    keys = (origin_ids << 32) | destination_ids
+    keys[(origin_ids < 0) | (destination_ids < 0)] = -1
+    return keys
+
+
+def unpack_lane_keys(keys):
+# =============================================================================
+#     Returns the origin and destination integer IDs of packed lane keys.
+# =============================================================================
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def match_keys(keys, source_keys):
+# =============================================================================
+#     Returns, for each key, the position of the first row of source_keys with the same key, or
+#     -1 if there is none. Missing keys (-1) never match.
+# =============================================================================
+    keys = np.asarray(keys, dtype=np.int64)
+    source_keys = pd.Index(np.asarray(source_keys, dtype=np.int64))
+    first = np.flatnonzero(~source_keys.duplicated() & (source_keys >= 0))
+    if len(first) == 0:
+        return np.full(len(keys), -1)
+
+    positions = source_keys[first].get_indexer(keys)
+    return np.where(positions >= 0, first[positions], -1)
@@ -0,0 +1,86 @@
+# =============================================================================
+# The purpose of this script is to hold policy lanes as a sparse customer x depot lane matrix, for
+# Lane Attributes (Alteryx workflow 020).
+#
+# The matrix is stored in compressed sparse row (CSR) form with numpy arrays: the lanes are sorted
+# by row (customer or return location) once, 'indptr' gives where each row starts and ends, and
+# 'indices' gives the column (depot) of each lane. With this layout:
+#     - per-row values (e.g. a customer's forecast) are broadcast to its lanes by repeating them
+#       over the row's segment (row_broadcast),
+#     - per-row reductions (e.g. a customer's nearest depot) are one numpy reduceat over the
+#       segments (row_reduce),
+# so both cost one pass over the lanes, with no merges or group-bys.
+#
+# Lane values passed to and returned from row_broadcast / row_reduce are in CSR order. Use
+# to_csr_order / from_csr_order to convert from / to the order of the lanes in the policy table.
+# =============================================================================
+
+import numpy as np
+
+
+def build_lane_matrix(row_ids, col_ids, n_rows=None):
+# =============================================================================
+#     Builds the lane matrix from the row ID (e.g. customer surrogate key) and column ID (e.g.
+#     depot surrogate key) of each lane. Lanes with a row ID of -1 are left out.
+#
+#     Returns a dictionary with:
+#         'indptr'  : row i has the lanes indptr[i]:indptr[i+1] (in CSR order).
+#         'indices' : column ID of each lane, in CSR order.
+#         'lanes'   : position of each lane (in CSR order) in the original lanes.
+#         'n_rows'  : number of rows.
+#         'n_lanes' : number of original lanes (including the lanes left out).
+# =============================================================================
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    col_ids = np.asarray(col_ids, dtype=np.int64)
+    if n_rows is None:
+        n_rows = int(row_ids.max()) + 1 if len(row_ids) else 0
+
+    lanes = np.flatnonzero(row_ids >= 0)
+    lanes = lanes[np.argsort(row_ids[lanes], kind='stable')]
+
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_ids[lanes], minlength=n_rows), out=indptr[1:])
+
+    return {'indptr': indptr, 'indices': col_ids[lanes], 'lanes': lanes, 'n_rows': n_rows,
+            'n_lanes': len(row_ids)}
+
+
+def to_csr_order(matrix, values):
+# =============================================================================
+#     Reorders per-lane values from the original lane order to CSR order.
+# =============================================================================
+    return np.asarray(values)[matrix['lanes']]
+
+
+def from_csr_order(matrix, values, fill=np.nan):
+# =============================================================================
+#     Reorders per-lane values from CSR order to the original lane order. Lanes that are not in
+#     the matrix get fill.
+# =============================================================================
+    values = np.asarray(values)
+    out = np.full(matrix['n_lanes'], fill, dtype=np.result_type(values.dtype, np.asarray(fill).dtype))
+    out[matrix['lanes']] = values
+    return out
+
+
+def row_broadcast(matrix, row_values):
+# =============================================================================
+#     Broadcasts one value per row to every lane of the row (in CSR order).
+# =============================================================================
+    return np.repeat(np.asarray(row_values), np.diff(matrix['indptr']))
+
+
+def row_reduce(matrix, values, ufunc=np.minimum, empty=np.inf):
+# =============================================================================
+#     Reduces lane values (in CSR order) per row with a numpy ufunc (e.g. np.minimum, np.add).
+#     Returns one value per row, and empty for rows with no lanes.
+# =============================================================================
+    values = np.asarray(values)
+    starts, ends = matrix['indptr'][:-1], matrix['indptr'][1:]
+    nonempty = starts < ends
+
+    out = np.full(matrix['n_rows'], empty, dtype=np.result_type(values.dtype, np.asarray(empty).dtype))
+    if nonempty.any():
+        # Empty rows are skipped, so each segment runs up to the start of the next non-empty row.
+        out[nonempty] = ufunc.reduceat(values, starts[nonempty])
+    return out
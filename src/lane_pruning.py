@@ -0,0 +1,155 @@
+# =============================================================================
+# The purpose of this script is to drop the all-to-all candidate lanes that are too far away to
+# matter, so the customer fulfillment and replenishment policy tables (and the model Cosmic Frog
+# solves) get smaller.
+#
+# The candidate lanes are the 'NewAllToAll_Issues' / 'NewAllToAll_Returns' lanes that are not in
+# the SOIP plan. A candidate lane is kept if it is:
+#     - within a radius (in miles) of its customer / return location, or
+#     - one of the k nearest eligible depots of its customer / return location (by the closest
+#       depot ranking in depot_ranking.py, among the depots the 020 closest depot ranking can
+#       choose), or
+#     - in a list of lanes to always keep (e.g. MultiSource List and RenterDistSort lanes).
+# All other lanes (baseline SOIP lanes, transfers, etc.) are always kept.
+#
+# The lanes are pruned on the lane distances that are already in the policy tables (with missing
+# distances filled in by lane_distances.py).
+#
+# If scipy is installed, a KD-tree on the depot coordinates (location dimension latitude and
+# longitude) finds a few nearby depots of each customer / return location. Their lane distances
+# bound the distance of its k nearest depots, so only the lanes within that bound are ranked. The
+# result is the same as ranking every lane, which is what is done without scipy.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+from depot_ranking import rank_nearest_depots
+from location_dimension import location_keys
+from lane_distances import location_coordinates
+from lane_keys import pack_lane_keys, match_keys
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def lane_mask(origins, destinations, lanes):
+# =============================================================================
+#     Returns a boolean mask of the (origin, destination) pairs that are in lanes, a list of
+#     (origin, destination) tuples or a DataFrame with two columns (origin, destination).
+# =============================================================================
+    lanes = pd.DataFrame(lanes)
+    if lanes.empty:
+        return np.zeros(len(origins), dtype=bool)
+
+    pairs = pd.MultiIndex.from_arrays([np.asarray(origins, dtype=object),
+                                       np.asarray(destinations, dtype=object)])
+    keep = pd.MultiIndex.from_arrays([lanes.iloc[:,0].to_numpy(object),
+                                      lanes.iloc[:,1].to_numpy(object)])
+    return pairs.isin(keep)
+
+
+def multi_source_lanes(msl):
+# =============================================================================
+#     Returns the MultiSource List lanes as a DataFrame of (depot, location) pairs, the orientation
+#     lanes_to_keep checks. Issue lanes are stored as (depot, customer) and Return lanes as
+#     (return location, depot), so the Return lanes are flipped.
+# =============================================================================
+    issue = (msl['MoveType']=='Issue').to_numpy()
+    return pd.DataFrame({'depot': np.where(issue, msl['OModelID'], msl['DModelID']),
+                         'location': np.where(issue, msl['DModelID'], msl['OModelID'])}).dropna()
+
+
+def unit_vectors(lat, lon):
+# =============================================================================
+#     Returns the 3D unit vectors of latitude / longitude coordinates (in degrees). The straight
+#     (chord) distance between two unit vectors grows with their great-circle distance, so the
+#     nearest vectors in a KD-tree are the nearest locations on the globe.
+# =============================================================================
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+
+
+def nearest_depot_shortlist(df, group_col, depot_col, distance, ranked, k, loc_dim):
+# =============================================================================
+#     Returns a boolean mask of the ranked rows of df that can be one of the k nearest depots of
+#     their group, by distance (a numpy array, one lane distance per row).
+#
+#     For each group, the KD-tree gives its 2k nearest depots by coordinates. The k-th smallest
+#     lane distance to those depots is at least the distance of the group's k-th nearest depot,
+#     so the lanes further away than that cannot be in its k nearest. Groups with fewer than k
+#     ranked lanes to those depots (or without coordinates) keep all of their lanes.
+# =============================================================================
+    group = location_keys(loc_dim, df[group_col])
+    depot = location_keys(loc_dim, df[depot_col])
+    lane_keys = np.where(ranked, pack_lane_keys(group, depot), -1)
+
+    lat, lon = location_coordinates(loc_dim, loc_dim['modelid'])
+    located = ~np.isnan(lat) & ~np.isnan(lon)
+
+    depots = np.unique(depot[ranked & (depot >= 0)])
+    depots = depots[located[depots]]
+    groups = np.unique(group[ranked & (group >= 0)])
+    groups = groups[located[groups]]
+
+    bound = np.full(len(loc_dim['modelid']), np.inf)
+    n_nearest = min(len(depots), 2*k)
+    if n_nearest >= k and len(groups) > 0:
+        tree = cKDTree(unit_vectors(lat[depots], lon[depots]))
+        _, nearest = tree.query(unit_vectors(lat[groups], lon[groups]), k=n_nearest)
+        nearest = depots[np.asarray(nearest).reshape(len(groups), n_nearest)]
+
+        # Distance of the first ranked row of each (group, nearby depot) lane, as ranked by
+        # rank_nearest_depots(), or inf if the lane is not ranked.
+        pair_keys = pack_lane_keys(np.repeat(groups, n_nearest), nearest.ravel())
+        hits = pd.Index(pair_keys).get_indexer(lane_keys)
+        found = np.flatnonzero(hits >= 0)
+        pair_rows = np.full(len(pair_keys), len(df))
+        np.minimum.at(pair_rows, hits[found], found)
+        lane_distance = np.append(distance, np.inf)[pair_rows].reshape(len(groups), n_nearest)
+        bound[groups] = np.sort(lane_distance, axis=1)[:, k-1]
+
+    # Keep every row of the lanes within the bound, so rank_nearest_depots() still ranks the first
+    # row of each lane.
+    group_bound = np.where(group >= 0, bound[group], np.inf)
+    near_lanes = pd.Index(np.unique(lane_keys[ranked & ~(distance > group_bound)]))
+    return ranked & ((near_lanes.get_indexer(lane_keys) >= 0) | (lane_keys < 0))
+
+
+def lanes_to_keep(df, group_col, depot_col, depottype_col, candidate, radius=None, k=None,
+                  keep_lanes=(), eligible=None, loc_dim=None):
+# =============================================================================
+#     Returns a boolean mask of the rows of df (policy lanes) to keep.
+#
+#     candidate is a boolean mask of the lanes that can be pruned. Candidate lanes are kept if
+#     their 'distance' is at most radius miles, or if they are one of the k nearest eligible
+#     candidate depots (depot_col) of their group (group_col), or if their (depot, group) pair is
+#     in keep_lanes (whatever the direction of the lane, e.g. (facilityname, sourcename) for return
+#     lanes). If radius and k are both None, every lane is kept.
+#
+#     eligible is a boolean mask of the lanes the 020 closest depot ranking can choose (all lanes if
+#     None). Missing distances count as 0 in the ranking, like in the 020 ranking, so the k nearest
+#     depots kept include the depots 020 ranks (if k is at least NEAREST_DEPOT_COUNT). With
+#     loc_dim and scipy, only the lanes on the KD-tree shortlist (nearest_depot_shortlist) are
+#     ranked.
+# =============================================================================
+    candidate = np.asarray(candidate, dtype=bool)
+    if radius is None and k is None:
+        return np.ones(len(df), dtype=bool)
+
+    keep = ~candidate
+    if radius is not None:
+        keep |= (df['distance'].astype(float) <= radius).to_numpy()
+    if k is not None:
+        ranked = candidate if eligible is None else candidate & np.asarray(eligible, dtype=bool)
+        distance = df['distance'].astype(float).fillna(0).to_numpy()
+        if cKDTree is not None and loc_dim is not None:
+            ranked = nearest_depot_shortlist(df, group_col, depot_col, distance, ranked, k, loc_dim)
+        ranks = rank_nearest_depots(df[[group_col, depot_col, depottype_col]].assign(distance=distance),
+                                    group_col, depot_col, depottype_col, ranked, k=k)
+        keep |= ~np.isnan(ranks)
+
+    keep |= lane_mask(df[depot_col], df[group_col], keep_lanes)
+    return keep
@@ -0,0 +1,112 @@
+# =============================================================================
+# The purpose of this script is to keep a persistent store of monthly lane cost statistics for
+# Transportation Rates Historical (Alteryx workflow 060).
+#
+# The store has one row per month and (movetype, Lane_ID, Depot, Customer, SCAC, Carrier_Type),
+# with the sum of Total_Loads and Ttl_LH_Cost of the shipments delivered (RL_T_Date_To) in that
+# month. It is saved as a CSV file in the data folder between runs.
+#
+# Each run only pulls the shipments from the data warehouse that are not in the store yet (from the
+# start of the latest stored month, since that month may have been incomplete), replaces those
+# months in the store, and then sums any trailing window of months from the store. Reading a
+# window costs one row per lane and month instead of one row per shipment, so longer or weighted
+# look-back windows need no extra data warehouse queries.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+import os
+
+LANE_STATS_KEYS = ['movetype', 'Lane_ID', 'Depot', 'Customer', 'SCAC', 'Carrier_Type']
+LANE_STATS_VALUES = ['Total_Loads', 'Ttl_LH_Cost']
+
+
+def month_number(dates):
+# =============================================================================
+#     Converts dates to a month number (year*12 + month), so month differences are subtractions.
+# =============================================================================
+    dates = pd.to_datetime(pd.Series(dates))
+    return (dates.dt.year*12 + dates.dt.month - 1).to_numpy()
+
+
+def month_start(month):
+# =============================================================================
+#     Returns the first day of a month number, as a Timestamp.
+# =============================================================================
+    return pd.Timestamp(year=int(month)//12, month=int(month)%12 + 1, day=1)
+
+
+def read_lane_stats(path):
+# =============================================================================
+#     Reads the lane statistics store. Returns an empty store if the file does not exist yet.
+# =============================================================================
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['month'] + LANE_STATS_KEYS + LANE_STATS_VALUES)
+
+    # Keep location codes as text (e.g. '01234'), and '' Depot / Customer values (transfers) as ''.
+    dtypes = {col: str for col in LANE_STATS_KEYS}
+    return pd.read_csv(path, dtype=dtypes, keep_default_na=False)
+
+
+def save_lane_stats(lane_stats, path):
+# =============================================================================
+#     Saves the lane statistics store.
+# =============================================================================
+    lane_stats.to_csv(path, index=False)
+
+
+def incremental_start_date(lane_stats, months_back, today=None):
+# =============================================================================
+#     Returns the first shipment date to pull from the data warehouse.
+#
+#     This is the start of the latest month in the store. If the store is empty, or does not go
+#     back far enough for a window of months_back months before the current month, it is the start
+#     of the window instead.
+# =============================================================================
+    current_month = month_number([today if today is not None else pd.Timestamp.today()])[0]
+    window_start = current_month - months_back
+
+    if lane_stats.empty or lane_stats['month'].min() > window_start:
+        return month_start(window_start)
+    return month_start(lane_stats['month'].max())
+
+
+def update_lane_stats(lane_stats, shipments, start_date):
+# =============================================================================
+#     Adds the shipments pulled since start_date to the store. The months from start_date on are
+#     replaced, since they were pulled again in full. Returns the updated store.
+# =============================================================================
+    shipments = shipments[shipments['RL_T_Date_To'].notna()]
+    shipments = shipments[LANE_STATS_KEYS + LANE_STATS_VALUES].assign(
+        month=month_number(shipments['RL_T_Date_To']))
+
+    new_stats = shipments.groupby(['month'] + LANE_STATS_KEYS)[LANE_STATS_VALUES].sum().reset_index()
+
+    kept = lane_stats[lane_stats['month'] < month_number([start_date])[0]]
+    if kept.empty:
+        return new_stats
+    return pd.concat([kept, new_stats], ignore_index=True)
+
+
+def lane_window(lane_stats, months_back, month_weights=None, today=None):
+# =============================================================================
+#     Sums the lane statistics over the current month and the months_back months before it.
+#
+#     month_weights (optional) is a list with one weight per month, most recent month first, that
+#     the monthly sums are multiplied by (e.g. [1, 1, 0.5, 0.5]).
+#
+#     Returns a DataFrame indexed by LANE_STATS_KEYS with the Total_Loads and Ttl_LH_Cost columns,
+#     like DataFrame.groupby(LANE_STATS_KEYS).sum() over the shipments in the window.
+# =============================================================================
+    current_month = month_number([today if today is not None else pd.Timestamp.today()])[0]
+    age = current_month - lane_stats['month'].to_numpy()
+    window = lane_stats[age <= months_back]
+
+    values = window[LANE_STATS_VALUES]
+    if month_weights is not None:
+        # Months past the end of the list use its last weight.
+        weights = np.asarray(month_weights, dtype=float)
+        month_weight = weights[np.clip(age[age <= months_back], 0, len(weights)-1)]
+        values = values.astype(float).mul(month_weight, axis=0)
+
+    return values.groupby([window[c] for c in LANE_STATS_KEYS]).sum()
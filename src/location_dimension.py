@@ -0,0 +1,179 @@
+# =============================================================================
+# The purpose of this script is to build a location dimension once per run, and share it across
+# every stage of the model update.
+#
+# Every customer and facility in the Cosmic Frog model gets an integer surrogate key (its position
+# in the dimension). The dimension stores, per key:
+#     - the model ID (customername or facilityname),
+#     - the location role: 'Issue' (customers), 'Return' (R_ facilities), 'Depot' (D_ facilities)
+#       or 'Other' (any other facility). Model IDs that are not in the dimension get the role of
+#       their prefix (see ROLE_PREFIXES),
+#     - the location attributes (loccode, country, regions, zone, depottype, status, etc.)
+#
+# Lookups (loccode -> model ID, model ID -> attribute) are done by resolving
+# the surrogate keys once with Index.get_indexer() and then gathering with numpy take, instead of
+# merging the customers and facilities tables again at every stage.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+ROLES = ['Issue', 'Return', 'Depot', 'Other']
+FACILITY_ROLES = ['Return', 'Depot', 'Other']
+
+# Model ID prefixes of the roles. Model IDs with none of these prefixes are 'Other'.
+ROLE_PREFIXES = {'Issue': 'I_', 'Return': 'R_', 'Depot': 'D_'}
+
+# Attributes copied into the dimension when they exist in the customers / facilities tables.
+LOCATION_ATTRIBUTES = ['loccode', 'country', 'georegion', 'pecoregion', 'pecosubregion', 'zone',
+                       'depottype', 'status', 'latitude', 'longitude']
+
+
+def build_location_dimension(customers, facilities, attributes=LOCATION_ATTRIBUTES):
+# =============================================================================
+#     Builds the location dimension from the customers and facilities tables.
+#
+#     Returns a dictionary with:
+#         'modelid'    : pandas Index of model IDs. The position in this index is the surrogate key.
+#         'role'       : numpy array of role codes (positions in ROLES), one per key.
+#         'attributes' : dictionary of attribute name -> numpy array, one value per key.
+#         'loccodes'   : cache of loccode indexes, built on demand by lookup_model_ids().
+# =============================================================================
+    cus = customers.rename(columns={'customername':'modelid'})
+    fac = facilities.rename(columns={'facilityname':'modelid'})
+
+    cus_role = np.full(len(cus), ROLES.index('Issue'), dtype=np.int8)
+    fac_role = prefix_roles(fac['modelid'], FACILITY_ROLES)
+
+    # Model IDs are primary keys in Cosmic Frog. Keep the first row if one is repeated.
+    modelid = np.concatenate([cus['modelid'].to_numpy(object), fac['modelid'].to_numpy(object)])
+    keep = ~pd.Index(modelid).duplicated()
+
+    dim_attributes = {}
+    for att in attributes:
+        cus_values = cus[att].to_numpy(object) if att in cus.columns else np.full(len(cus), np.nan, object)
+        fac_values = fac[att].to_numpy(object) if att in fac.columns else np.full(len(fac), np.nan, object)
+        dim_attributes[att] = np.concatenate([cus_values, fac_values])[keep]
+
+    loc_dim = {'modelid': pd.Index(modelid[keep]),
+               'role': np.concatenate([cus_role, fac_role])[keep],
+               'attributes': dim_attributes,
+               'loccodes': {}}
+    return loc_dim
+
+
+def prefix_roles(modelids, roles=ROLES):
+# =============================================================================
+#     Returns the role code (position in ROLES) of each model ID from its prefix (ROLE_PREFIXES),
+#     among the given roles, as a numpy array. Model IDs with none of their prefixes are 'Other'.
+# =============================================================================
+    modelids = pd.Series(np.asarray(modelids, dtype=object))
+    prefixed = [r for r in roles if r in ROLE_PREFIXES]
+    conditions = [modelids.str.startswith(ROLE_PREFIXES[r]).fillna(False).to_numpy(bool) for r in prefixed]
+    return np.select(conditions, [ROLES.index(r) for r in prefixed],
+                     default=ROLES.index('Other')).astype(np.int8)
+
+
+def has_role(loc_dim, modelids, roles):
+# =============================================================================
+#     Returns a boolean numpy array: True for the model IDs whose role is one of the given roles (a
+#     role name or a list of role names). The role is taken from the dimension, or from the model
+#     ID's prefix (prefix_roles) if it is not in the dimension.
+# =============================================================================
+    roles = [roles] if isinstance(roles, str) else list(roles)
+    keys = location_keys(loc_dim, modelids)
+    role_codes = np.where(keys >= 0, loc_dim['role'][keys], prefix_roles(modelids))
+    return np.isin(role_codes, [ROLES.index(r) for r in roles])
+
+
+def refresh_location_attributes(loc_dim, df, name_col, attributes):
+# =============================================================================
+#     Copies the current values of the given attributes from df (customers or facilities) into the
+#     dimension. Used when a stage has changed an attribute (e.g. depottype or status) that a
+#     later stage reads from the dimension.
+# =============================================================================
+    keys = location_keys(loc_dim, df[name_col])
+    found = keys >= 0
+    for att in attributes:
+        values = loc_dim['attributes'][att].copy()
+        values[keys[found]] = df[att].to_numpy(object)[found]
+        loc_dim['attributes'][att] = values
+
+
+def location_keys(loc_dim, modelids, roles=None):
+# =============================================================================
+#     Returns the surrogate keys of the given model IDs, as a numpy integer array. Model IDs that
+#     are not in the dimension, or whose role is not in roles (if given), get -1.
+# =============================================================================
+    keys = loc_dim['modelid'].get_indexer(np.asarray(modelids, dtype=object))
+    if roles is not None:
+        role_codes = [ROLES.index(r) for r in roles]
+        keys[(keys >= 0) & ~np.isin(loc_dim['role'][keys], role_codes)] = -1
+    return keys
+
+
+def take(values, keys):
+# =============================================================================
+#     Gathers values at the given surrogate keys. Keys of -1 give NaN.
+# =============================================================================
+    found = keys >= 0
+    out = np.full(len(keys), np.nan, dtype=object)
+    out[found] = values[keys[found]]
+    return out
+
+
+def lookup_attribute(loc_dim, modelids, attribute, roles=None):
+# =============================================================================
+#     Returns the attribute value of each model ID, as a numpy array. Model IDs that are not in the
+#     dimension (or not one of the given roles) get NaN, like a left merge would.
+# =============================================================================
+    keys = location_keys(loc_dim, modelids, roles)
+    return take(loc_dim['attributes'][attribute], keys)
+
+
+def lookup_location_keys(loc_dim, loccodes, roles):
+# =============================================================================
+#     Returns the surrogate key of each loccode, among the locations with one of the given roles
+#     (a role name or a list of role names), as a numpy integer array. Loccodes that are not found
+#     get -1.
+# =============================================================================
+    roles = [roles] if isinstance(roles, str) else list(roles)
+
+    # Build (once) an index of the loccodes that belong to these roles.
+    cache_key = tuple(roles)
+    if cache_key not in loc_dim['loccodes']:
+        candidates = np.flatnonzero(np.isin(loc_dim['role'], [ROLES.index(r) for r in roles]))
+        codes = pd.Index(loc_dim['attributes']['loccode'][candidates])
+        first = ~codes.duplicated() & codes.notna()
+        loc_dim['loccodes'][cache_key] = (codes[first], candidates[first])
+
+    codes, candidates = loc_dim['loccodes'][cache_key]
+    positions = codes.get_indexer(np.asarray(loccodes, dtype=object))
+    keys = np.full(len(positions), -1)
+    keys[positions >= 0] = candidates[positions[positions >= 0]]
+    return keys
+
+
+def lookup_model_ids(loc_dim, loccodes, roles):
+# =============================================================================
+#     Returns the model ID of each loccode, among the locations with one of the given roles (a
+#     role name or a list of role names), as a numpy array. Loccodes that are not found get NaN.
+# =============================================================================
+    return take(loc_dim['modelid'].to_numpy(object), lookup_location_keys(loc_dim, loccodes, roles))
+
+
+def dimension_values(loc_dim, values, fill=np.nan):
+# =============================================================================
+#     Spreads a Series indexed by model ID (e.g. a forecast per customer) over the dimension.
+#     Returns a numpy array with one value per surrogate key, and fill for the keys that are not
+#     in values. If a model ID is repeated in values, its first value is used.
+#
+#     The values of any lanes' endpoints are then gathered with the lanes' keys, instead of
+#     merging values onto the lanes.
+# =============================================================================
+    keys = location_keys(loc_dim, values.index)
+    first = (keys >= 0) & ~pd.Index(keys).duplicated()
+
+    out = np.full(len(loc_dim['modelid']), fill, dtype=object)
+    out[keys[first]] = values.to_numpy(object)[first]
+    return out
@@ -0,0 +1,57 @@
+# =============================================================================
+# The purpose of this script is to measure the memory used by the model update process, and to
+# check that its peak stays within a set multiple of the size of the tables it pulled.
+#
+# Memory is measured as the resident set size (RSS) of the Python process. On Windows the peak
+# comes from psutil (peak working set); elsewhere it comes from the standard resource module.
+# =============================================================================
+
+import sys
+
+
+def current_rss_mb():
+# =============================================================================
+#     Returns the current resident memory of this process, in megabytes.
+# =============================================================================
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+# =============================================================================
+#     Returns the peak resident memory of this process so far, in megabytes.
+# =============================================================================
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        if hasattr(info, 'peak_wset'):
+            return info.peak_wset / 2**20
+    except ImportError:
+        pass
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def check_peak_memory(start_mb, raw_table_mb, max_multiple):
+# =============================================================================
+#     Checks that the memory used by the run (peak RSS minus the RSS at start_mb, before any data
+#     was pulled) is at most max_multiple times raw_table_mb, the size of the tables as pulled.
+#
+#     Prints the result, and returns True if the check passes.
+# =============================================================================
+    used_mb = peak_rss_mb() - start_mb
+    limit_mb = max_multiple * raw_table_mb
+
+    print(f'Peak memory used: {used_mb:,.1f} MB ({used_mb/max(raw_table_mb, 1e-9):,.1f}x the '
+          f'{raw_table_mb:,.1f} MB of pulled tables, limit {max_multiple}x).')
+    if used_mb > limit_mb:
+        print(f'\tWARNING: Peak memory is above the {limit_mb:,.1f} MB limit '
+              '(MAX_PEAK_MEMORY_MULTIPLE in user_inputs.py).')
+        return False
+    return True
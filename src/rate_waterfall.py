@@ -0,0 +1,65 @@
+# =============================================================================
+# The purpose of this script is to choose the transportation rate (fixedcost) of every lane from an
+# ordered list of rate sources, as done in Transportation Rates Historical (Alteryx workflow 060).
+#
+# A rate source is a dictionary with:
+#     'name'      : label written to rateused when this source is chosen (e.g. 'HistRate').
+#     'rate'      : the rate of each lane, pre-joined to the lanes (array / Series), or a scalar.
+#     'available' : (optional) boolean mask of the lanes where this source can be used, or True
+#                   for every lane. Defaults to the lanes where 'rate' is not empty.
+#
+# Each lane uses the first available source in the list, so the list order is the rate priority.
+# All sources are resolved together in one vectorized pass (numpy select), and rateused records
+# which source was chosen. A new rate source (e.g. contract tariffs) is added by joining it to the
+# lanes with lane_lookup() (on packed lane keys) and inserting it into the list at its priority.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+from lane_keys import match_keys
+
+
+def lane_lookup(lane_keys, source, source_keys, value_cols, index=None):
+# =============================================================================
+#     Pre-joins a rate source table to the lanes, on packed lane keys (see lane_keys.py).
+#
+#     Returns a DataFrame with value_cols, one row per lane key (with the given index), taken from
+#     the first row of source with the same key. Lanes that are not in source get NaN (like a left
+#     merge, but without repeating lanes when the key is repeated in source).
+# =============================================================================
+    rows = match_keys(lane_keys, source_keys)
+    found = rows >= 0
+
+    out = pd.DataFrame(index=index if index is not None else pd.RangeIndex(len(rows)))
+    for col in value_cols:
+        col_values = np.full(len(rows), np.nan, dtype=object)
+        col_values[found] = source[col].to_numpy(object)[rows[found]]
+        out[col] = col_values
+    return out
+
+
+def resolve_rates(rate_sources, n_lanes):
+# =============================================================================
+#     Chooses, for each of the n_lanes lanes, the rate of the first available source in
+#     rate_sources.
+#
+#     Returns two numpy arrays: the chosen rate (fixedcost) and the name of the chosen source
+#     (rateused). Lanes with no available source get NaN and None.
+# =============================================================================
+    conditions = []
+    rates = []
+    for source in rate_sources:
+        rate = np.broadcast_to(np.asarray(source['rate'], dtype=float), (n_lanes,))
+        available = source.get('available')
+        if available is None:
+            available = ~np.isnan(rate)
+        conditions.append(np.broadcast_to(np.asarray(available, dtype=bool), (n_lanes,)))
+        rates.append(rate)
+
+    names = np.array([source['name'] for source in rate_sources], dtype=object)
+    chosen = np.select(conditions, np.arange(len(rate_sources)), default=-1)
+
+    fixedcost = np.select(conditions, rates, default=np.nan)
+    rateused = np.where(chosen >= 0, names[chosen], None)
+    return fixedcost, rateused
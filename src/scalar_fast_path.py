@@ -0,0 +1,161 @@
+# =============================================================================
+# The purpose of this script is to set the columns that the scalar parameters in user_inputs.py
+# (NewPalletCost, Fuel_Surcharge, Duty_Rate_*, Avg_Load_Size_*) are used for, so that the scalar
+# fast path can set them again without running the other stages of the update.
+#
+# Each scalar update (SCALAR_UPDATES) sets its columns on the lanes or locations of one stage, from
+# input columns that do not depend on the scalar parameters (e.g. a lane's carrier type or average
+# cube). The stage then applies them to a Cosmic Frog table with DataFrame.update() on the table's
+# index columns, like every other stage.
+#
+# A full run with SCALAR_FAST_PATH saves the inputs of each scalar update, and the tables they are
+# applied to, in the data folder. When only scalar parameters change, the fast path sets the columns
+# again on the saved inputs and applies them to the saved tables. No data is pulled, and no other
+# stage is run.
+# =============================================================================
+
+import numpy as np
+import os
+import pickle
+
+from location_dimension import ROLES, FACILITY_ROLES, prefix_roles
+
+
+def npd_unit_cost(cfp, parameters):
+# =============================================================================
+#     NPD Percentage Penalty (Alteryx workflow 030): the unit cost of the Manufacturing lanes.
+# =============================================================================
+    cfp['unitcost'] = (cfp['NPD %']*parameters['NewPalletCost']).fillna(0)
+
+
+def fuel_surcharge_and_duty_rates(tps, parameters):
+# =============================================================================
+#     Transportation Rates Historical (Alteryx workflow 060): the fuel surcharge of the lanes that
+#     are not customer pickup, and the duty rates of the lanes between the US and Canada.
+# =============================================================================
+    cpu = (tps['scaccarriertype']=='CPU').to_numpy()
+    tps['unitcost'] = np.where(cpu, None, parameters['Fuel_Surcharge'])
+
+    us_to_can = (tps['ocountry']=='USA') & (tps['dcountry']=='CAN')
+    can_to_us = (tps['ocountry']=='CAN') & (tps['dcountry']=='USA')
+    tps['dutyrate'] = np.select([us_to_can, can_to_us],
+                                [parameters['Duty_Rate_US_to_Canada'], parameters['Duty_Rate_Canada_to_US']],
+                                default=None)
+
+
+def customer_load_sizes(cus, parameters):
+# =============================================================================
+#     Transportation Load Size (Alteryx workflow 070): the average load size of the customers.
+# =============================================================================
+    cus['avgloadsz'] = cus['Average_Cube'].fillna(parameters['Avg_Load_Size_Issues'])
+
+
+def facility_load_sizes(fac, parameters):
+# =============================================================================
+#     Transportation Load Size (Alteryx workflow 070): the average load size of the return
+#     locations and depots.
+# =============================================================================
+    role = prefix_roles(fac['facilityname'], FACILITY_ROLES)
+    fac.loc[role==ROLES.index('Return'), 'defaultloadsz'] = parameters['Avg_Load_Size_Returns']
+    fac.loc[role==ROLES.index('Depot'), 'defaultloadsz'] = parameters['Avg_Load_Size_Transfers']
+    fac['avgloadsz'] = fac[['Average_Cube', 'defaultloadsz']].bfill(axis=1).iloc[:,0]
+
+
+def lane_load_sizes(tps, parameters):
+# =============================================================================
+#     Transportation Load Size (Alteryx workflow 070): the average shipment size of the issue,
+#     return and transfer lanes.
+# =============================================================================
+    default = np.select([tps['movetype']=='Issue', tps['movetype']=='Return'],
+                        [parameters['Avg_Load_Size_Issues'], parameters['Avg_Load_Size_Returns']],
+                        default=parameters['Avg_Load_Size_Transfers'])
+    cube = tps['Average_Cube'].astype(float)
+    tps['averageshipmentsize'] = cube.where(cube.notna(), default)
+
+
+# Scalar updates, in the order of the stages: the Cosmic Frog table, its index columns for
+# DataFrame.update(), the input columns, the columns set, and the function that sets them.
+SCALAR_UPDATES = {
+    '030'            : {'table': 'customerfulfillmentpolicies',
+                        'index': ['customername', 'depottype'],
+                        'inputs': ['NPD %'],
+                        'columns': ['unitcost'],
+                        'function': npd_unit_cost},
+    '060'            : {'table': 'transportationpolicies',
+                        'index': ['originname', 'destinationname', 'productname'],
+                        'inputs': ['scaccarriertype', 'ocountry', 'dcountry'],
+                        'columns': ['unitcost', 'dutyrate'],
+                        'function': fuel_surcharge_and_duty_rates},
+    '070 customers'  : {'table': 'customers',
+                        'index': ['customername'],
+                        'inputs': ['Average_Cube'],
+                        'columns': ['avgloadsz'],
+                        'function': customer_load_sizes},
+    '070 facilities' : {'table': 'facilities',
+                        'index': ['facilityname'],
+                        'inputs': ['Average_Cube'],
+                        'columns': ['avgloadsz'],
+                        'function': facility_load_sizes},
+    '070 lanes'      : {'table': 'transportationpolicies',
+                        'index': ['originname', 'destinationname', 'productname', 'modename'],
+                        'inputs': ['movetype', 'Average_Cube'],
+                        'columns': ['averageshipmentsize'],
+                        'function': lane_load_sizes},
+    }
+
+# Cosmic Frog tables that the scalar updates are applied to.
+SCALAR_TABLES = list(dict.fromkeys(update['table'] for update in SCALAR_UPDATES.values()))
+
+
+def scalar_update_inputs(stage, df):
+# =============================================================================
+#     Returns the index and input columns of a stage's scalar update, from the DataFrame the stage
+#     sets its columns on, to be saved for the fast path.
+# =============================================================================
+    update = SCALAR_UPDATES[stage]
+    return df[update['index'] + update['inputs']].copy()
+
+
+def apply_scalar_update(tables, stage, inputs, parameters):
+# =============================================================================
+#     Sets the columns of a stage's scalar update on its saved inputs, and applies them to its table
+#     in tables (a dictionary of table name -> DataFrame), like the stage does. The table keeps its
+#     column order.
+# =============================================================================
+    update = SCALAR_UPDATES[stage]
+    df = inputs.copy()
+    update['function'](df, parameters)
+
+    df.set_index(update['index'], inplace=True)
+    df = df[~df.index.duplicated()]
+    columns = tables[update['table']].columns
+    table = tables[update['table']].set_index(update['index'])
+    table.update(df[update['columns']])
+    tables[update['table']] = table.reset_index()[columns]
+
+
+def save_fast_path_data(path, tables, scalar_inputs):
+# =============================================================================
+#     Saves the tables the scalar updates are applied to (as uploaded), and the inputs of each
+#     scalar update (stage -> DataFrame), for the next run's fast path.
+# =============================================================================
+    with open(path, 'wb') as f:
+        pickle.dump(({name: tables[name] for name in SCALAR_TABLES}, scalar_inputs), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_fast_path_data(path):
+# =============================================================================
+#     Loads the data saved by save_fast_path_data. Returns the tables and the scalar update inputs.
+# =============================================================================
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def remove_fast_path_data(path):
+# =============================================================================
+#     Removes the fast path data, after a run that did not save it (it no longer matches the
+#     output model).
+# =============================================================================
+    if os.path.exists(path):
+        os.remove(path)
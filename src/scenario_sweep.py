@@ -0,0 +1,273 @@
+# =============================================================================
+# The purpose of this script is to run the model update for several sets of parameters (scenarios)
+# while only pulling the input data once, e.g. for sensitivity runs on NewPalletCost or
+# Fuel_Surcharge.
+#
+# The scenarios are read from a table in the data folder (SCENARIO_FILENAME in user_inputs.py), with
+# one row per scenario:
+#     - 'Scenario'     : name of the scenario.
+#     - 'Output Model' : Cosmic Frog model to upload the scenario's tables to. If it is empty, the
+#                        tables are saved as CSV files in scenarios/[Date]/[Scenario]/ instead.
+#     - one column per parameter to change (see SCENARIO_PARAMETERS), named as in user_inputs.py.
+#       Empty cells keep the value in user_inputs.py.
+#
+# The sweep runs soip_model_update_process.py:
+#     1. once with '--pull-only', which pulls the Excel, data warehouse and Cosmic Frog data and
+#        saves it to a file,
+#     2. then once per scenario with '--scenario', in up to SCENARIO_WORKERS worker processes at a
+#        time. Each worker reads the pulled data from the file instead of pulling it again.
+# The workers do not share memory: each one loads its own copy of the pulled data, and needs up to
+# MAX_PEAK_MEMORY_MULTIPLE times its size at its peak. If SCENARIO_WORKERS is None, the number of
+# workers is the number of those peaks that fit in the memory available when the sweep starts.
+#
+# Every scenario needs its own output model (or none), different from the input model and from the
+# regular run's output models (OUTPUT_DB_NAME and ADDITIONAL_OUTPUT_DB_NAMES).
+# Scenario runs do not update the files kept in the data folder (lane statistics, lane distances,
+# input snapshot, upload fingerprints), so they do not change the next regular run (with
+# REBUILD_INDEXES, they only keep the dropped indexes of their own output models there). Once every
+# scenario is done, the scenarios' output models are dropped from the upload fingerprints, so the
+# next delta upload to one of them replaces every table.
+#
+# Run this script from the src folder: python scenario_sweep.py
+# =============================================================================
+
+import pandas as pd
+import os
+import sys
+import time
+import pickle
+import subprocess
+import tempfile
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to PATH to allow for relative imports.
+ROOT = os.path.abspath(os.path.join('..'))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from cosmic_frog_upload import read_upload_fingerprints, save_upload_fingerprints, record_upload
+from table_encoding import table_memory_mb
+from memory_usage import current_rss_mb
+
+# Parameters in user_inputs.py that a scenario can change.
+SCENARIO_PARAMETERS = ['NewPalletCost', 'Fuel_Surcharge', 'Duty_Rate_US_to_Canada',
+                       'Duty_Rate_Canada_to_US', 'Avg_Load_Size_Issues', 'Avg_Load_Size_Returns',
+                       'Avg_Load_Size_Transfers']
+
+# Output folder of the scenarios that are not uploaded to Cosmic Frog.
+OUTPUT_FOLDER = os.path.join('..', 'scenarios')
+
+# Characters that cannot be in a scenario name (it is used as a folder name).
+INVALID_NAME_CHARACTERS = '<>:"/\\|?*'
+
+
+def read_scenarios(path, input_db_name, output_db_names=()):
+# =============================================================================
+#     Reads the scenario table (.xlsx or .csv). Returns a list of scenarios, each a dictionary with
+#     'name', 'output_db_name' (None to save the tables locally) and 'parameters' (parameter name
+#     -> value, for the non-empty cells only).
+#
+#     Raises a ValueError if a scenario's output model is the input model, one of output_db_names
+#     (the regular run's output models), or the output model of another scenario.
+# =============================================================================
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+
+    unknown = [col for col in df.columns if col not in ['Scenario', 'Output Model'] + SCENARIO_PARAMETERS]
+    if 'Scenario' not in df.columns or unknown:
+        raise ValueError(f"The scenario table needs a 'Scenario' column, and can only have an 'Output Model' "
+                         f"column and the parameter columns {SCENARIO_PARAMETERS}. Unknown columns: {unknown}")
+
+    names = df['Scenario'].astype(str).str.strip()
+    if df['Scenario'].isna().any() or names.duplicated().any():
+        raise ValueError('Every scenario needs a name, and the names must be different.')
+    bad_names = [name for name in names if any(c in name for c in INVALID_NAME_CHARACTERS)]
+    if bad_names:
+        raise ValueError(f'Scenario names cannot contain {INVALID_NAME_CHARACTERS}: {bad_names}')
+
+    scenarios = []
+    for name, (_, row) in zip(names, df.iterrows()):
+        output_db_name = row.get('Output Model')
+        output_db_name = None if pd.isna(output_db_name) else str(output_db_name).strip()
+        if output_db_name == input_db_name:
+            raise ValueError(f"Scenario '{name}' would overwrite the input model '{input_db_name}'.")
+        if output_db_name in output_db_names:
+            raise ValueError(f"Scenario '{name}' would overwrite the output model '{output_db_name}' of the "
+                             "regular run (OUTPUT_DB_NAME or ADDITIONAL_OUTPUT_DB_NAMES).")
+        if output_db_name is not None and output_db_name in [s['output_db_name'] for s in scenarios]:
+            raise ValueError(f"Scenarios cannot share an output model: '{output_db_name}' is the output model "
+                             f"of more than one scenario.")
+
+        parameters = {p: row[p].item() if hasattr(row[p], 'item') else row[p]
+                      for p in SCENARIO_PARAMETERS if p in df.columns and pd.notna(row[p])}
+        scenarios.append({'name': name, 'output_db_name': output_db_name, 'parameters': parameters})
+
+    return scenarios
+
+
+def sweep_arguments(argv):
+# =============================================================================
+#     Reads the scenario sweep arguments of soip_model_update_process.py. Returns a dictionary with
+#     'mode' (None for a regular run, 'pull' or 'scenario'), 'pulled_data' (path of the pulled data
+#     file) and 'scenario' (the scenario to run, or None).
+#
+#     python soip_model_update_process.py --pull-only <pulled data file>
+#     python soip_model_update_process.py --scenario <pulled data file> <scenario file>
+# =============================================================================
+    if len(argv) >= 2 and argv[0] == '--pull-only':
+        return {'mode': 'pull', 'pulled_data': argv[1], 'scenario': None}
+
+    if len(argv) >= 3 and argv[0] == '--scenario':
+        with open(argv[2], 'rb') as f:
+            scenario = pickle.load(f)
+        return {'mode': 'scenario', 'pulled_data': argv[1], 'scenario': scenario}
+
+    return {'mode': None, 'pulled_data': None, 'scenario': None}
+
+
+def save_pulled_data(path, excel_data, data_warehouse_data, cosmic_frog_data):
+# =============================================================================
+#     Saves the pulled data for the scenario runs, after a small header with the size of the
+#     pulled tables in memory (see pulled_table_mb).
+# =============================================================================
+    header = {'table_mb': table_memory_mb(cosmic_frog_data) + table_memory_mb(data_warehouse_data)}
+    with open(path, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump((excel_data, data_warehouse_data, cosmic_frog_data), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_pulled_data(path):
+# =============================================================================
+#     Loads the pulled data. Returns excel_data, data_warehouse_data and cosmic_frog_data.
+# =============================================================================
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+        if isinstance(data, dict):
+            data = pickle.load(f)    # Skip the header.
+        return data
+
+
+def pulled_table_mb(path):
+# =============================================================================
+#     Returns the size in memory of the pulled Cosmic Frog and data warehouse tables, in megabytes,
+#     from the header of the pulled data file (the file is not loaded). Returns None for files saved
+#     without a header.
+# =============================================================================
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+    return header['table_mb'] if isinstance(header, dict) else None
+
+
+def scenario_workers(pulled_data_path, max_multiple):
+# =============================================================================
+#     Returns the number of scenario runs that fit in the memory available now (at least 1, at most
+#     the number of CPUs). Each run loads its own copy of the pulled data, and is expected to use
+#     its interpreter and imports (about this process' memory) plus up to max_multiple times the
+#     pulled tables (see check_peak_memory in memory_usage.py).
+# =============================================================================
+    table_mb = pulled_table_mb(pulled_data_path)
+    try:
+        import psutil
+        available_mb = psutil.virtual_memory().available / 2**20
+    except ImportError:
+        available_mb = None
+    if table_mb is None or available_mb is None:
+        print('The size of the pulled data or the available memory is unknown: running one scenario at a time.')
+        return 1
+
+    run_mb = current_rss_mb() + max_multiple * table_mb
+    n_workers = max(1, min(int(available_mb // run_mb), os.cpu_count() or 1))
+    print(f'Scenarios run at the same time: {n_workers} (each needs up to {run_mb:,.0f} MB, '
+          f'{available_mb:,.0f} MB are available).')
+    return n_workers
+
+
+def scenario_folder(scenario):
+# =============================================================================
+#     Returns the folder of a scenario's tables and run log: scenarios/[Date]/[Scenario]/.
+# =============================================================================
+    today = pd.to_datetime(date.today()).strftime('%Y-%m-%d')
+    return os.path.join(OUTPUT_FOLDER, today, scenario['name'])
+
+
+def save_scenario_tables(data_to_upload, scenario):
+# =============================================================================
+#     Saves a scenario's tables as CSV files (one per Cosmic Frog table) in its scenario folder.
+# =============================================================================
+    folder = scenario_folder(scenario)
+    os.makedirs(folder, exist_ok=True)
+    for table_name, table in data_to_upload.items():
+        table.to_csv(os.path.join(folder, f'{table_name}.csv'), index=False)
+    print(f'Saved the tables to {folder}')
+
+
+def run_sweep(scenarios, n_workers, max_multiple):
+# =============================================================================
+#     Pulls the data once, then runs every scenario in up to n_workers worker processes (if
+#     n_workers is None, as many as fit in memory, see scenario_workers). Returns a summary with the
+#     status, run time and output of each scenario.
+# =============================================================================
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'soip_model_update_process.py')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pulled_data_path = os.path.join(tmp, 'pulled_data.pkl')
+        print('Pulling data...')
+        subprocess.run([sys.executable, script, '--pull-only', pulled_data_path], check=True)
+
+        def run_scenario(i):
+            scenario = scenarios[i]
+            scenario_path = os.path.join(tmp, f'scenario_{i}.pkl')
+            with open(scenario_path, 'wb') as f:
+                pickle.dump(scenario, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Each worker's output goes to a log file in its scenario folder.
+            folder = scenario_folder(scenario)
+            os.makedirs(folder, exist_ok=True)
+            t0 = time.time()
+            with open(os.path.join(folder, 'run.log'), 'w') as log:
+                result = subprocess.run([sys.executable, script, '--scenario', pulled_data_path, scenario_path],
+                                        stdout=log, stderr=subprocess.STDOUT)
+            status = 'Done' if result.returncode == 0 else f'Failed (see {folder}/run.log)'
+            print(f"\tScenario '{scenario['name']}': {status}")
+            return {'Scenario': scenario['name'], 'Status': status,
+                    'Minutes': round((time.time()-t0)/60, 1),
+                    'Output': scenario['output_db_name'] or folder}
+
+        if n_workers is None:
+            n_workers = scenario_workers(pulled_data_path, max_multiple)
+
+        print(f'Running {len(scenarios)} scenarios...')
+        with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as pool:
+            summary = list(pool.map(run_scenario, range(len(scenarios))))
+
+    return pd.DataFrame(summary)
+
+
+def forget_scenario_uploads(scenarios, upload_fingerprints_path):
+# =============================================================================
+#     Drops the scenarios' output models from the upload fingerprints (see record_upload in
+#     cosmic_frog_upload.py), since the scenarios replaced their tables.
+# =============================================================================
+    db_names = [s['output_db_name'] for s in scenarios if s['output_db_name'] is not None]
+    upload_fingerprints = read_upload_fingerprints(upload_fingerprints_path)
+    if any(db_name in upload_fingerprints for db_name in db_names):
+        record_upload(upload_fingerprints, db_names, None)
+        save_upload_fingerprints(upload_fingerprints, upload_fingerprints_path)
+
+
+if __name__ == '__main__':
+    from user_inputs import INPUT_DB_NAME, OUTPUT_DB_NAME, ADDITIONAL_OUTPUT_DB_NAMES, SCENARIO_FILENAME, \
+        SCENARIO_WORKERS, MAX_PEAK_MEMORY_MULTIPLE, UPLOAD_FINGERPRINTS_FILENAME
+
+    scenarios = read_scenarios(os.path.join('..', 'data', SCENARIO_FILENAME), INPUT_DB_NAME,
+                               [OUTPUT_DB_NAME] + list(ADDITIONAL_OUTPUT_DB_NAMES))
+    summary = run_sweep(scenarios, SCENARIO_WORKERS, MAX_PEAK_MEMORY_MULTIPLE)
+    forget_scenario_uploads(scenarios, os.path.join('..', 'data', UPLOAD_FINGERPRINTS_FILENAME))
+
+    today = pd.to_datetime(date.today()).strftime('%Y-%m-%d')
+    summary.to_csv(os.path.join(OUTPUT_FOLDER, today, 'sweep_summary.csv'), index=False)
+    print(summary.to_string(index=False))
@@ -27,10 +27,8 @@ import numpy as np
 import warnings
 import os
 import sys
-import csv
 import time
 from optilogic import pioneer
-from io import StringIO
 
 # Start time.
 t0=time.time()
@@ -38,6 +36,10 @@ t0=time.time()
 # Set display format for pandas.
 pd.options.display.float_format = "{:,.2f}".format
 
+# Copy-on-write: tables taken from other tables (filters, column subsets, etc.) share memory with
+# them until one of them is changed, so no defensive .copy() calls are needed.
+pd.options.mode.copy_on_write = True
+
 # Add project root to PATH to allow for relative imports. 
 ROOT = os.path.abspath(os.path.join('..'))
 if ROOT not in sys.path:
@@ -45,16 +47,104 @@ if ROOT not in sys.path:
 
 # Import SQL Statements
 from sql_statements import tbl_tab_Location_sql, nbr_of_depots_sql, \
-    trans_load_size_sql, trans_load_counts_sql_raw, trans_costs_sql_raw
+    trans_load_size_sql, trans_load_counts_sql_raw, trans_costs_sql_raw, \
+    trans_costs_incremental_sql_raw
     
 # Import User-Input data.
 from user_inputs import USER_NAME, APP_KEY, INPUT_DB_NAME, OUTPUT_DB_NAME, RepairCapacityNotes, \
     MinInventoryNotes, DepotCapacityNotes, BeginningInvNotes, ReturnsProductionNotes, \
     ProductionPolicyRepairBOMName, NewPalletCost, Avg_Load_Size_Issues, Avg_Load_Size_Returns, \
-    Avg_Load_Size_Transfers, Fuel_Surcharge, Duty_Rate_US_to_Canada, Duty_Rate_Canada_to_US 
+    Avg_Load_Size_Transfers, Fuel_Surcharge, Duty_Rate_US_to_Canada, Duty_Rate_Canada_to_US, \
+    COMPACT_TABLES, NEAREST_DEPOT_COUNT, LANE_STATS_FILENAME, LANE_STATS_MONTHS_BACK, \
+    LANE_STATS_MONTH_WEIGHTS, MAX_PEAK_MEMORY_MULTIPLE, STAGE_BACKENDS, DISTANCE_CACHE_FILENAME, \
+    ROAD_CIRCUITY_FACTOR, LANE_PRUNING_RADIUS, LANE_PRUNING_NEAREST_DEPOTS, \
+    UPLOAD_CHANGED_TABLES_ONLY, INPUT_SNAPSHOT_FILENAME, ADDITIONAL_OUTPUT_DB_NAMES, \
+    SCALAR_FAST_PATH, SCALAR_FAST_PATH_FILENAME, UPLOAD_MODE, UPLOAD_FINGERPRINTS_FILENAME, \
+    UPLOAD_WORKERS, REBUILD_INDEXES, VERIFY_UPLOADS
+import user_inputs
     
 # Import Excel IO function.
-from excel_data_validation import pull_data_from_excel
+from excel_data_validation import pull_data_from_excel, OUTPUT_LOCATION
+
+# Import table encoding functions.
+from table_encoding import compact_tables, table_memory_mb
+
+# Import memory usage functions.
+from memory_usage import current_rss_mb, check_peak_memory
+
+# Import forecast aggregation functions.
+from forecast_cube import build_forecast_cube, forecast_sum, forecast_mean
+
+# Import location dimension functions.
+from location_dimension import FACILITY_ROLES, build_location_dimension, \
+    refresh_location_attributes, location_keys, has_role, take, lookup_location_keys, lookup_model_ids, \
+    dimension_values
+
+# Import lane key functions.
+from lane_keys import split_lane_names, code_vocabulary, code_ids, pack_lane_keys, match_keys
+
+# Import lane distance functions.
+from lane_distances import read_distance_cache, save_distance_cache, fill_missing_distances
+
+# Import lane pruning function.
+from lane_pruning import lanes_to_keep, multi_source_lanes
+
+# Import stage backend functions (pandas or DuckDB).
+from stage_backends import stage_function
+
+# Import input snapshot functions.
+from input_snapshots import user_input_hashes, row_hashes, take_snapshot, add_to_snapshot, read_snapshot, \
+    save_snapshot, compare_snapshots, tables_to_update, only_scalars_changed, scalar_columns_to_update, \
+    fast_path_snapshot, record_input_model, input_model_columns, input_model_unchanged
+
+# Import Cosmic Frog upload functions.
+from cosmic_frog_upload import primary_keys, replace_data_in_cosmic_frog, \
+    update_columns_in_cosmic_frog, row_fingerprints, upload_record, model_checksums, \
+    upload_changes_to_cosmic_frog, read_upload_fingerprints, save_upload_fingerprints, record_upload
+
+# Import scalar fast path functions.
+from scalar_fast_path import npd_unit_cost, fuel_surcharge_and_duty_rates, \
+    customer_load_sizes, facility_load_sizes, lane_load_sizes, scalar_update_inputs, \
+    apply_scalar_update, save_fast_path_data, load_fast_path_data, remove_fast_path_data
+
+# Import scenario sweep functions.
+from scenario_sweep import sweep_arguments, save_pulled_data, load_pulled_data, \
+    save_scenario_tables
+
+# Import transfer rule functions.
+from transfer_rules import default_transfer_rules, read_transfer_rules, apply_transfer_rules
+
+# Import transportation rate functions.
+from rate_waterfall import lane_lookup, resolve_rates
+
+# Import lane statistics store functions.
+from lane_statistics import LANE_STATS_KEYS, read_lane_stats, save_lane_stats, \
+    incremental_start_date, update_lane_stats, lane_window
+
+# Cosmic Frog models that get the update: the output model, and any sibling models.
+OUTPUT_DB_NAMES = [OUTPUT_DB_NAME] + list(ADDITIONAL_OUTPUT_DB_NAMES)
+
+# Scenario sweep (see scenario_sweep.py). A scenario run replaces some of the user inputs.
+SWEEP = sweep_arguments(sys.argv[1:])
+SCENARIO = SWEEP['scenario']
+if SCENARIO is not None:
+    parameters = SCENARIO['parameters']
+    NewPalletCost = parameters.get('NewPalletCost', NewPalletCost)
+    Fuel_Surcharge = parameters.get('Fuel_Surcharge', Fuel_Surcharge)
+    Duty_Rate_US_to_Canada = parameters.get('Duty_Rate_US_to_Canada', Duty_Rate_US_to_Canada)
+    Duty_Rate_Canada_to_US = parameters.get('Duty_Rate_Canada_to_US', Duty_Rate_Canada_to_US)
+    Avg_Load_Size_Issues = parameters.get('Avg_Load_Size_Issues', Avg_Load_Size_Issues)
+    Avg_Load_Size_Returns = parameters.get('Avg_Load_Size_Returns', Avg_Load_Size_Returns)
+    Avg_Load_Size_Transfers = parameters.get('Avg_Load_Size_Transfers', Avg_Load_Size_Transfers)
+
+# Scalar parameters, for the stages that set the columns they are used for (see scalar_fast_path.py).
+scalar_parameters = {'NewPalletCost': NewPalletCost,
+                     'Fuel_Surcharge': Fuel_Surcharge,
+                     'Duty_Rate_US_to_Canada': Duty_Rate_US_to_Canada,
+                     'Duty_Rate_Canada_to_US': Duty_Rate_Canada_to_US,
+                     'Avg_Load_Size_Issues': Avg_Load_Size_Issues,
+                     'Avg_Load_Size_Returns': Avg_Load_Size_Returns,
+                     'Avg_Load_Size_Transfers': Avg_Load_Size_Transfers}
 
 # Define functions to pull data from Cosmic Frog and PECO's data warehouse.
 
@@ -134,60 +224,196 @@ def scac_sql_preprocessing(sql_statement, scac_types):
     return sql_statement
 
 
+# Memory in use before any data is pulled.
+start_mb = current_rss_mb()
+
+# Lane statistics store, read before the pull (only newer shipments are pulled).
+if LANE_STATS_FILENAME is not None:
+    lane_stats_path = os.path.join('..', 'data', LANE_STATS_FILENAME)
+    lane_stats = read_lane_stats(lane_stats_path)
+    lane_stats_start = incremental_start_date(lane_stats, LANE_STATS_MONTHS_BACK)
+
 # Pull data from Excel.
-excel_data, error_count = pull_data_from_excel()
-# Exit the program. Ensure the errors in the Excel data are correct before moving on.
-if error_count > 0:
-    exit()
-
-# Pull data from PECO's data warehouse.
-# Update transportation SQL with SCAC to Carrier Type mapping.
-print("\nAdding SCAC codes to transportation SQL statements...")
-trans_load_counts_sql = scac_sql_preprocessing(trans_load_counts_sql_raw, excel_data['SCAC Types'])
-trans_costs_sql = scac_sql_preprocessing(trans_costs_sql_raw, excel_data['SCAC Types'])
-print("\tDone.")
-
-sql_name_dict = {'tbl_tab_Location':tbl_tab_Location_sql,
-                 'nbr_of_depots':nbr_of_depots_sql,
-                 'transport_rates_hist_load_counts':trans_load_counts_sql,
-                 'transport_rates_hist_costs':trans_costs_sql,
-                 'transport_load_size':trans_load_size_sql}
-
-data_warehouse_data = pull_data_from_data_warehouse(sql_name_dict)
+if SWEEP['mode'] != 'scenario':
+    excel_data, error_count = pull_data_from_excel()
+    # Exit the program. Ensure the errors in the Excel data are correct before moving on.
+    if error_count > 0:
+        exit()
+
+# Scalar fast path: if only the scalar parameters (e.g. NewPalletCost) changed since the previous
+# run this month, only set the columns they are used for again, on the tables that run uploaded,
+# and update those columns in Cosmic Frog. No data is pulled and no other stage is run.
+snapshot_path = os.path.join('..', 'data', INPUT_SNAPSHOT_FILENAME)
+fast_path_path = os.path.join('..', 'data', SCALAR_FAST_PATH_FILENAME)
+upload_fingerprints_path = os.path.join('..', 'data', UPLOAD_FINGERPRINTS_FILENAME)
+user_input_snapshot = user_input_hashes(vars(user_inputs))
+FAST_PATH = False
+if SCALAR_FAST_PATH and SWEEP['mode'] is None and os.path.exists(fast_path_path):
+    saved_on = pd.Timestamp(os.path.getmtime(fast_path_path), unit='s')
+    previous_snapshot = read_snapshot(snapshot_path)
+    current_inputs = {**{name: row_hashes(df) for name, df in excel_data.items()}, **user_input_snapshot}
+    FAST_PATH = (saved_on.to_period('M') == pd.Timestamp.today().to_period('M')
+                 and only_scalars_changed(previous_snapshot, current_inputs, OUTPUT_DB_NAMES))
+    if FAST_PATH:
+        # Nothing is pulled from the input model either: its tables must still have the checksums
+        # recorded by the previous full run.
+        recorded_columns = input_model_columns(previous_snapshot)
+        FAST_PATH = (bool(recorded_columns) and input_model_unchanged(
+            previous_snapshot, model_checksums(USER_NAME, APP_KEY, INPUT_DB_NAME, recorded_columns)))
+        if not FAST_PATH:
+            print('\nThe Cosmic Frog input model changed since the previous run. Running the full update.')
+
+if FAST_PATH:
+    print('\nOnly scalar parameters changed since the previous run. Setting the columns they are used for...')
+    fast_path_tables, scalar_inputs = load_fast_path_data(fast_path_path)
+    for stage, inputs in scalar_inputs.items():
+        apply_scalar_update(fast_path_tables, stage, inputs, scalar_parameters)
+    print('\tDone.\n')
+
+    input_snapshot = fast_path_snapshot(previous_snapshot, current_inputs, fast_path_tables)
+    change_summary = compare_snapshots(previous_snapshot, input_snapshot)
+    change_summary.to_csv(os.path.join(OUTPUT_LOCATION, 'input_change_summary.csv'), index=False)
+
+    # Only the columns of the scalar parameters that changed.
+    columns_to_update = scalar_columns_to_update(change_summary)
+    update_columns_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAMES, fast_path_tables, columns_to_update)
+    if INPUT_DB_NAME in OUTPUT_DB_NAMES:
+        # The input model is also an output model: record its updated tables as they are now.
+        updated_columns = input_model_columns(input_snapshot, columns_to_update)
+        if updated_columns:
+            record_input_model(input_snapshot, updated_columns,
+                               model_checksums(USER_NAME, APP_KEY, INPUT_DB_NAME, updated_columns))
+
+    upload_fingerprints = read_upload_fingerprints(upload_fingerprints_path)
+    if UPLOAD_MODE == 'delta':
+        # No checksums are kept for the updated tables, so the next delta upload replaces them.
+        uploaded = {name: upload_record(row_fingerprints(fast_path_tables[name], primary_keys[name]))
+                    for name in columns_to_update}
+    else:
+        uploaded = None
+    record_upload(upload_fingerprints, OUTPUT_DB_NAMES, uploaded)
+    if upload_fingerprints or os.path.exists(upload_fingerprints_path):
+        save_upload_fingerprints(upload_fingerprints, upload_fingerprints_path)
+
+    # The saved tables are kept as the previous full run uploaded them: the next fast path sets the
+    # columns again from its own scalar parameters.
+    save_snapshot(input_snapshot, snapshot_path)
+    t1=time.time()
+    print(f'DONE! The program took {round((t1-t0)/60)} minutes to complete.')
+    sys.exit()
+
+if SWEEP['mode'] == 'scenario':
+    # Scenario run: reuse the data pulled for the scenario sweep.
+    print(f"Running scenario '{SCENARIO['name']}'. Loading the pulled data...")
+    excel_data, data_warehouse_data, cosmic_frog_data = load_pulled_data(SWEEP['pulled_data'])
+    print('Done loading data.\n')
+else:
+    # Pull data from PECO's data warehouse.
+    # Update transportation SQL with SCAC to Carrier Type mapping.
+    print("\nAdding SCAC codes to transportation SQL statements...")
+    trans_load_counts_sql = scac_sql_preprocessing(trans_load_counts_sql_raw, excel_data['SCAC Types'])
+    trans_costs_sql = scac_sql_preprocessing(trans_costs_sql_raw, excel_data['SCAC Types'])
+    print("\tDone.")
+
+    # Only pull the shipments that are not in the lane statistics store yet.
+    if LANE_STATS_FILENAME is not None:
+        print(f"\nPulling shipment costs delivered since {lane_stats_start:%Y-%m-%d} for the lane statistics store.")
+        trans_costs_sql = scac_sql_preprocessing(trans_costs_incremental_sql_raw, excel_data['SCAC Types'])
+        trans_costs_sql = trans_costs_sql.replace('__START_DATE__', f'{lane_stats_start:%Y-%m-%d}')
+
+    sql_name_dict = {'tbl_tab_Location':tbl_tab_Location_sql,
+                     'nbr_of_depots':nbr_of_depots_sql,
+                     'transport_rates_hist_load_counts':trans_load_counts_sql,
+                     'transport_rates_hist_costs':trans_costs_sql,
+                     'transport_load_size':trans_load_size_sql}
+
+    data_warehouse_data = pull_data_from_data_warehouse(sql_name_dict)
     
-# Pull data from Cosmic Frog.
-tables_we_want  = ['customerdemand',
-                   'customerfulfillmentpolicies',
-                   'customers',
-                   'facilities',
-                   'groups',
-                   'inventoryconstraints',
-                   'inventorypolicies',
-                   'periods',
-                   'productionconstraints',
-                   'productionpolicies',
-                   'replenishmentpolicies',
-                   'transportationpolicies',
-                   'warehousingpolicies',
-                   ]
-cosmic_frog_data = pull_data_from_cosmic_frog(USER_NAME, APP_KEY, INPUT_DB_NAME, tables_we_want)
-print('Done pulling data.\n')
+    # Pull data from Cosmic Frog.
+    tables_we_want  = ['customerdemand',
+                       'customerfulfillmentpolicies',
+                       'customers',
+                       'facilities',
+                       'groups',
+                       'inventoryconstraints',
+                       'inventorypolicies',
+                       'periods',
+                       'productionconstraints',
+                       'productionpolicies',
+                       'replenishmentpolicies',
+                       'transportationpolicies',
+                       'warehousingpolicies',
+                       ]
+    cosmic_frog_data = pull_data_from_cosmic_frog(USER_NAME, APP_KEY, INPUT_DB_NAME, tables_we_want)
+    print('Done pulling data.\n')
+
+    # Scenario sweep: save the pulled data for the scenario runs, and stop.
+    if SWEEP['mode'] == 'pull':
+        save_pulled_data(SWEEP['pulled_data'], excel_data, data_warehouse_data, cosmic_frog_data)
+        sys.exit()
+
+# Size of the tables as pulled, for the peak memory check at the end.
+raw_table_mb = table_memory_mb(cosmic_frog_data) + table_memory_mb(data_warehouse_data)
+
+# Snapshot the inputs before any of them are changed, for the input change report and the scalar
+# fast path. The data warehouse and Cosmic Frog inputs are only hashed for UPLOAD_CHANGED_TABLES_ONLY
+# (the fast path does not check them). Scenario runs are not compared, they do not update the
+# output model.
+SNAPSHOT_INPUTS = SCENARIO is None and (UPLOAD_CHANGED_TABLES_ONLY or SCALAR_FAST_PATH)
+input_snapshot = None
+if SNAPSHOT_INPUTS:
+    print('Taking a snapshot of the inputs...')
+    snapshot_inputs = {**excel_data, **user_input_snapshot}
+    if UPLOAD_CHANGED_TABLES_ONLY:
+        snapshot_inputs.update({**data_warehouse_data, **cosmic_frog_data})
+    input_snapshot = take_snapshot(snapshot_inputs, OUTPUT_DB_NAMES)
+    previous_snapshot = read_snapshot(snapshot_path)
+    del snapshot_inputs
+    # The input model's tables as pulled, which the scalar fast path checks before it is taken.
+    if SCALAR_FAST_PATH:
+        input_columns = {name: list(table.columns) for name, table in cosmic_frog_data.items()}
+        record_input_model(input_snapshot, input_columns,
+                           model_checksums(USER_NAME, APP_KEY, INPUT_DB_NAME, input_columns))
+    print('\tDone.\n')
+
+# Delta upload: what the input model holds now, as the baseline of its first delta upload (if it is
+# also an output model).
+input_fingerprints = {}
+if UPLOAD_MODE == 'delta' and SCENARIO is None and INPUT_DB_NAME in OUTPUT_DB_NAMES:
+    input_tables = {name: table for name, table in cosmic_frog_data.items() if name in primary_keys}
+    input_checksums = model_checksums(USER_NAME, APP_KEY, INPUT_DB_NAME, input_tables)
+    input_fingerprints = {name: upload_record(row_fingerprints(table, primary_keys[name]),
+                                              {INPUT_DB_NAME: input_checksums[name]})
+                          for name, table in input_tables.items()}
+    del input_tables
+
+# Dictionary-encode the repeated name columns against one shared vocabulary.
+if COMPACT_TABLES:
+    print('Compacting Cosmic Frog tables...')
+    mb_before = table_memory_mb(cosmic_frog_data)
+    # Labels that are assigned into the encoded 'notes' column further down, and the depot types
+    # from the Excel files that are assigned into the encoded depottype columns.
+    note_labels = ['Baseline_Issues', 'Baseline_Returns', 'NewAllToAll_Issues', 'NewAllToAll_Returns']
+    depot_types = excel_data['Depot Assumptions']['Type'].dropna().unique().tolist() + ['Manufacturing']
+    compact_tables(cosmic_frog_data, extra_values=note_labels + depot_types)
+    mb_after = table_memory_mb(cosmic_frog_data)
+    print(f'\tDone. {mb_before:,.1f} MB -> {mb_after:,.1f} MB\n')
 
 
 # Cosmic Frog Data
-customerdemand = cosmic_frog_data['customerdemand'].copy()
-customerfulfillmentpolicies = cosmic_frog_data['customerfulfillmentpolicies'].copy()
-customers = cosmic_frog_data['customers'].copy()
-facilities = cosmic_frog_data['facilities'].copy()
-groups = cosmic_frog_data['groups'].copy()
-inventoryconstraints = cosmic_frog_data['inventoryconstraints'].copy()
-inventorypolicies = cosmic_frog_data['inventorypolicies'].copy()
-periods = cosmic_frog_data['periods'].copy()
-productionconstraints = cosmic_frog_data['productionconstraints'].copy()
-productionpolicies = cosmic_frog_data['productionpolicies'].copy()
-replenishmentpolicies = cosmic_frog_data['replenishmentpolicies'].copy()
-transportationpolicies = cosmic_frog_data['transportationpolicies'].copy()
-warehousingpolicies = cosmic_frog_data['warehousingpolicies'].copy()
+customerdemand = cosmic_frog_data['customerdemand']
+customerfulfillmentpolicies = cosmic_frog_data['customerfulfillmentpolicies']
+customers = cosmic_frog_data['customers']
+facilities = cosmic_frog_data['facilities']
+groups = cosmic_frog_data['groups']
+inventoryconstraints = cosmic_frog_data['inventoryconstraints']
+inventorypolicies = cosmic_frog_data['inventorypolicies']
+periods = cosmic_frog_data['periods']
+productionconstraints = cosmic_frog_data['productionconstraints']
+productionpolicies = cosmic_frog_data['productionpolicies']
+replenishmentpolicies = cosmic_frog_data['replenishmentpolicies']
+transportationpolicies = cosmic_frog_data['transportationpolicies']
+warehousingpolicies = cosmic_frog_data['warehousingpolicies']
 
 # =============================================================================
 # # NOTE: We will change this during development and compare to the unedited dataframes. 
@@ -208,11 +434,11 @@ warehousingpolicies = cosmic_frog_data['warehousingpolicies'].copy()
 # =============================================================================
 
 # Data Warehouse Data
-tbl_tab_Location = data_warehouse_data['tbl_tab_Location'].copy()
-nbr_of_depots = data_warehouse_data['nbr_of_depots'].copy()
-transport_rates_hist_load_counts = data_warehouse_data['transport_rates_hist_load_counts'].copy()
-transport_rates_hist_costs = data_warehouse_data['transport_rates_hist_costs'].copy()
-transport_load_size = data_warehouse_data['transport_load_size'].copy()
+tbl_tab_Location = data_warehouse_data['tbl_tab_Location']
+nbr_of_depots = data_warehouse_data['nbr_of_depots']
+transport_rates_hist_load_counts = data_warehouse_data['transport_rates_hist_load_counts']
+transport_rates_hist_costs = data_warehouse_data['transport_rates_hist_costs']
+transport_load_size = data_warehouse_data['transport_load_size']
 
 # =============================================================================
 # # NOTE: We will change this during development and compare to the unedited dataframes. 
@@ -224,69 +450,97 @@ transport_load_size = data_warehouse_data['transport_load_size'].copy()
 # transport_load_size_orig = data_warehouse_data['transport_load_size'].copy()
 # =============================================================================
 
+# Only the working tables above are used from here on. Drop the source dictionaries so they do
+# not keep the pulled tables alive once the working tables are changed.
+del cosmic_frog_data, data_warehouse_data
+
 
 #%% Subprocesses.
 print('Executing subprocesses prior to editing Cosmic Frog data...\n')
+########################################## Location Dimension - (For all workflows)
+print('\tLocation dimension...')
+# Model IDs, roles (Issue/Return/Depot) and attributes of every customer and facility, with
+# vectorized loccode -> model ID and model ID -> attribute lookups.
+loc_dim = build_location_dimension(customers, facilities)
+print('\tDone.\n')
+
+########################################## Lane Distances - (For Lane Pruning and 020-Lane Attributes)
+print('\tLane distances...')
+# Fill in missing lane distances from the location coordinates.
+if DISTANCE_CACHE_FILENAME is None:
+    distance_cache = read_distance_cache('')
+else:
+    distance_cache_path = os.path.join('..', 'data', DISTANCE_CACHE_FILENAME)
+    distance_cache = read_distance_cache(distance_cache_path)
+    if SNAPSHOT_INPUTS:
+        add_to_snapshot(input_snapshot, 'lane distance cache', distance_cache)
+
+for policies, origin_col, destination_col in [(customerfulfillmentpolicies, 'sourcename', 'customername'),
+                                              (replenishmentpolicies, 'sourcename', 'facilityname')]:
+    distance = policies['distance'].astype(float)
+    filled, distance_cache = fill_missing_distances(distance, policies[origin_col],
+                                                    policies[destination_col], loc_dim,
+                                                    distance_cache, ROAD_CIRCUITY_FACTOR)
+    missing = distance.isna().to_numpy() & ~np.isnan(filled)
+    policies.loc[missing, 'distance'] = filled[missing]
+
+if DISTANCE_CACHE_FILENAME is not None and SCENARIO is None:
+    save_distance_cache(distance_cache, distance_cache_path)
+print('\tDone.\n')
+
 ########################################## Number of Depots - (For 020-Lane Attributes)
 print('\tNumber of depots...')
 
-nod = nbr_of_depots.copy()
-nod['ModelID'] = np.nan
-nod.set_index(['movetype', 'customer'], inplace=True)
-
-cus = customers[['customername', 'loccode']].copy()
-cus.rename(columns={'customername':'ModelID', 'loccode':'customer'}, inplace=True)
-cus['movetype'] = 'Issue'
-cus.set_index(['movetype', 'customer'], inplace=True)
-
-fac = facilities.loc[facilities['facilityname'].str.startswith('R_'),
-                     ['facilityname', 'loccode']].copy()
-fac.rename(columns={'facilityname':'ModelID', 'loccode':'customer'}, inplace=True)
-fac['movetype'] = 'Return'
-fac.set_index(['movetype', 'customer'], inplace=True)
-
-nod.update(cus)
-nod.update(fac)
-nod.reset_index(inplace=True)
-nod.dropna(inplace=True)
+iss = (nbr_of_depots['movetype']=='Issue').to_numpy()
+ret = (nbr_of_depots['movetype']=='Return').to_numpy()
+nod = nbr_of_depots.assign(ModelID=np.select([iss, ret],
+                                             [lookup_model_ids(loc_dim, nbr_of_depots['customer'], 'Issue'),
+                                              lookup_model_ids(loc_dim, nbr_of_depots['customer'], 'Return')],
+                                             default=np.nan))
+nod = nod.dropna()
 print('\tDone.\n')
 
 ########################################## Transport Load Size - (For 070-Trans Load Size)
 print('\tTransport Load Size...')
-iss = transport_load_size[transport_load_size['movetype']=='Issue'].copy()
-oth = transport_load_size[transport_load_size['movetype']!='Issue'].copy()
-iss = iss.merge(customers[['loccode', 'customername']], how='left', left_on='customer_Loc_Code', right_on='loccode')
-oth = oth.merge(facilities[['loccode', 'facilityname']], how='left', left_on='customer_Loc_Code', right_on='loccode')
-iss.rename(columns={'customername':'ModelID'}, inplace=True)
-oth.rename(columns={'facilityname':'ModelID'}, inplace=True)
-
-tls = pd.concat([iss, oth])
-tls['originname'] = tls.apply(lambda row: row['ModelID'] if row['movetype'] == 'Return' else None, axis=1)
-tls['destinationname'] = tls.apply(lambda row: row['ModelID'] if row['movetype'] == 'Issue' else None, axis=1)
+iss = (transport_load_size['movetype']=='Issue').to_numpy()
+tls = transport_load_size.assign(locationkey=np.where(
+    iss, lookup_location_keys(loc_dim, transport_load_size['customer_Loc_Code'], 'Issue'),
+         lookup_location_keys(loc_dim, transport_load_size['customer_Loc_Code'], FACILITY_ROLES)))
+tls['ModelID'] = take(loc_dim['modelid'].to_numpy(object), tls['locationkey'].to_numpy())
+
+tls['originname'] = tls['ModelID'].where(tls['movetype']=='Return', None)
+tls['destinationname'] = tls['ModelID'].where(tls['movetype']=='Issue', None)
 print('\tDone.\n')
 
 ########################################## Multi-Source Options - (For 090-Flag Multi-Source Options)
 print('\tMulti-Source Options...')
-msl = excel_data['MultiSource List'].copy()
-msl = msl.merge(customers[['loccode', 'customername']], how='left', left_on='CustomerCode', right_on='loccode')
-msl = msl.merge(facilities[['loccode', 'facilityname']], how='left', left_on='CustomerCode', right_on='loccode', suffixes=('_issu', '_retu'))
-msl = msl.merge(facilities[['loccode', 'facilityname']], how='left', left_on='DepotCode', right_on='loccode', suffixes=('_retu', '_depot'))
+msl = excel_data['MultiSource List']
+cust_issu  = lookup_model_ids(loc_dim, msl['CustomerCode'], 'Issue')
+cust_retu  = lookup_model_ids(loc_dim, msl['CustomerCode'], 'Return')
+depot      = lookup_model_ids(loc_dim, msl['DepotCode'], 'Depot')
 
-cond = msl['MoveType']=='Issue'
-msl.loc[cond, 'OModelID']  = msl.loc[cond, 'facilityname_depot']
-msl.loc[~cond, 'OModelID'] = msl.loc[~cond, 'facilityname_retu']
-msl.loc[cond, 'DModelID']  = msl.loc[cond, 'customername']
-msl.loc[~cond, 'DModelID'] = msl.loc[~cond, 'facilityname_depot']
+cond = (msl['MoveType']=='Issue').to_numpy()
+msl = msl.assign(OModelID=np.where(cond, depot, cust_retu),
+                 DModelID=np.where(cond, cust_issu, depot))
 
 msl = msl[msl['OK to Include SOIP'].isin(['YES', 'Yes', 'Y', 'y'])]
 print('\tDone.\n')
 
+########################################## Forecast Cubes - (For 015, 017, and 020)
+print('\tForecast cubes...')
+# Issues forecast per customer, and returns forecast per returner, by period.
+demand_cube = build_forecast_cube(customerdemand, 'customername', 'quantity')
+
+rpn = productionconstraints[productionconstraints['notes']==ReturnsProductionNotes]
+returns_cube = build_forecast_cube(rpn, 'facilityname', 'constraintvalue')
+print('\tDone.\n')
+
 #%% Update Depot Costs and Attributes (Alteryx workflow 010)
 print('Executing : Update Depot Costs and Attributes (Alteryx workflow 010)...')
 
 ###################################################################### Customer Fulfillment Policies
 cols = ['ModelID', 'Type', 'Paint Upd']
-cfp = excel_data['Depot Assumptions'][cols].copy()
+cfp = excel_data['Depot Assumptions'][cols]
 cfp.index = cfp['ModelID']
 
 cfp['unitcost'] = cfp['Paint Upd'].fillna(0)
@@ -301,7 +555,7 @@ customerfulfillmentpolicies.reset_index(inplace=True)
 
 ###################################################################### Facilities
 cols = ['ModelID', 'Type', 'Closed', 'Heat Treat', 'Fixed Upd']
-fac = excel_data['Depot Assumptions'][cols].copy()
+fac = excel_data['Depot Assumptions'][cols]
 fac.index = fac['ModelID']
 
 fac['fixedoperatingcost'] = fac['Fixed Upd'].fillna(0)
@@ -328,16 +582,16 @@ facilities.reset_index(inplace=True)
 
 ###################################################################### Inventory Constraints
 cols = ['ModelID', 'Minimum Inv', 'Storage', 'Yard Space', 'Temp Storage']
-ivc = excel_data['Depot Assumptions'][cols].copy()
+ivc = excel_data['Depot Assumptions'][cols]
 ivc.fillna(0, inplace=True)
 
 ic_min = inventoryconstraints.loc[inventoryconstraints['notes']==MinInventoryNotes,
-                                  ['facilityname', 'notes']].copy()
+                                  ['facilityname', 'notes']]
 ic_min = ic_min.merge(ivc, how='left', left_on='facilityname', right_on='ModelID')
 ic_min['constraintvalue'] = ic_min['Minimum Inv']
 
 ic_max = inventoryconstraints.loc[inventoryconstraints['notes']==DepotCapacityNotes,
-                                  ['facilityname', 'notes']].copy()
+                                  ['facilityname', 'notes']]
 ic_max = ic_max.merge(ivc, how='left', left_on='facilityname', right_on='ModelID')
 ic_max['constraintvalue'] = ic_max['Storage'] + ic_max['Yard Space'] + ic_max['Temp Storage']
 
@@ -354,14 +608,14 @@ inventoryconstraints.reset_index(inplace=True)
 
 ###################################################################### Inventory Policies
 cols = ['ModelID', 'DmgRate', 'BegInv_RFU', 'BegInv_WIP', 'BegInv_MIX']
-ivp = excel_data['Depot Assumptions'][cols].copy()
+ivp = excel_data['Depot Assumptions'][cols]
 nonneg_cols = ['DmgRate', 'BegInv_RFU', 'BegInv_WIP', 'BegInv_MIX']
 ivp[nonneg_cols] = ivp[nonneg_cols].clip(0)
 
 ip = inventorypolicies.loc[inventorypolicies['notes']==BeginningInvNotes,
-                           ['facilityname','notes','productname']].copy()
+                           ['facilityname','notes','productname']]
 ip = ip.merge(ivp, how='left', left_on='facilityname', right_on='ModelID')
-ip.fillna(0, inplace=True)
+ip[cols] = ip[cols].fillna(0)
 
 def set_initial_inv(row):
     rfu_count = row['BegInv_RFU'] + (1-row['DmgRate'])*(row['BegInv_MIX'])
@@ -383,11 +637,11 @@ inventorypolicies.reset_index(inplace=True)
 
 ###################################################################### Production Constraints
 cols = ['ModelID', 'Repair / Day']
-pcs = excel_data['Depot Assumptions'][cols].copy()
+pcs = excel_data['Depot Assumptions'][cols]
 
 pc = productionconstraints.loc[productionconstraints['notes']==RepairCapacityNotes,
-                               ['facilityname', 'periodname', 'notes']].copy()
-workdays = periods[['periodname', 'workingdays']].copy()
+                               ['facilityname', 'periodname', 'notes']]
+workdays = periods[['periodname', 'workingdays']]
 pc = pc.merge(workdays, how='left', on='periodname')
 
 pc = pc.merge(pcs, how='left', left_on='facilityname', right_on='ModelID')
@@ -406,7 +660,7 @@ productionconstraints.reset_index(inplace=True)
 
 ###################################################################### Production Policies
 cols = ['ModelID', 'Type', 'Repair Upd']
-pps = excel_data['Depot Assumptions'][cols].copy()
+pps = excel_data['Depot Assumptions'][cols]
 
 pps['bomname'] = ProductionPolicyRepairBOMName
 pps['unitcost'] = pps['Repair Upd'].fillna(0)
@@ -422,7 +676,7 @@ productionpolicies.reset_index(inplace=True)
 
 ###################################################################### Replenishment Policies
 cols = ['ModelID', 'Type']
-rps = excel_data['Depot Assumptions'][cols].copy()
+rps = excel_data['Depot Assumptions'][cols]
 rps.index = rps['ModelID']
 
 rps['odepottype'] = rps['Type']
@@ -438,7 +692,7 @@ replenishmentpolicies.reset_index(inplace=True)
 
 ###################################################################### Warehousing Policies
 cols = ['ModelID', 'Handling In Upd', 'Handling Out Upd', 'Sort Upd']
-whp = excel_data['Depot Assumptions'][cols].copy()
+whp = excel_data['Depot Assumptions'][cols]
 whp.set_index('ModelID', inplace=True)
 whp['inboundhandlingcost'] = whp['Handling In Upd'].fillna(0) + whp['Sort Upd'].fillna(0)
 whp['outboundhandlingcost'] = whp['Handling Out Upd']
@@ -456,7 +710,7 @@ print('Executing : Set SOIP Solve Flag (Alteryx workflow 015)...')
 
 ###################################################################### Customer Fulfillment Policies
 cols = ['Oname', 'RevisedDName']
-cfp = excel_data['Depot Assignments'][cols].copy()
+cfp = excel_data['Depot Assignments'][cols]
 cfp['customername'] = cfp['Oname']
 cfp['sourcename'] = cfp['RevisedDName']
 
@@ -468,7 +722,7 @@ cfp['notes']  = 'Baseline_Issues'
 # Set existing values prior to updating.
 customerfulfillmentpolicies['soipplan'] = 'N'
 customerfulfillmentpolicies['status'] = 'Exclude'
-customerfulfillmentpolicies['notes'] = 'NewAllToAll_Issues'
+customerfulfillmentpolicies.loc[:, 'notes'] = 'NewAllToAll_Issues'
 
 index_cols = ['customername', 'sourcename']
 cfp.set_index(index_cols, inplace=True)
@@ -480,10 +734,7 @@ customerfulfillmentpolicies.reset_index(inplace=True)
 
 
 ###################################################################### Customers
-cols = ['customername', 'quantity']
-cd = customerdemand[cols].copy()
-cd['quantity'] = cd['quantity'].astype('float')
-cd = cd.groupby(by='customername').sum()
+cd = forecast_sum(demand_cube).to_frame('quantity')
 cd['status'] = cd.apply(lambda row: 'Include' if row['quantity'] > 0 else 'Exclude', axis=1)
 cd['insoip'] = cd.apply(lambda row: 'Y' if row['quantity'] > 0 else 'N', axis=1)
 
@@ -497,16 +748,14 @@ customers.reset_index(inplace=True)
 
 
 ###################################################################### Facilities
-cols = ['facilityname', 'constraintvalue']
-pc = productionconstraints.loc[productionconstraints['notes']==ReturnsProductionNotes, cols].copy()
-pc['constraintvalue'] = pc['constraintvalue'].astype('float')
-pc = pc.groupby(by='facilityname').sum()
+pc = forecast_sum(returns_cube).to_frame('constraintvalue')
 
 pc['status'] = pc.apply(lambda row: 'Include' if row['constraintvalue'] > 0 else 'Exclude', axis=1)
 pc['insoipmodel'] = pc.apply(lambda row: 'Y' if row['constraintvalue'] > 0 else 'N', axis=1)
 
-facilities.loc[facilities['facilityname'].str.startswith('R_'), 'status'] = 'Exclude'
-facilities.loc[facilities['facilityname'].str.startswith('R_'), 'insoipmodel'] = 'N'
+returners = has_role(loc_dim, facilities['facilityname'], 'Return')
+facilities.loc[returners, 'status'] = 'Exclude'
+facilities.loc[returners, 'insoipmodel'] = 'N'
 facilities.set_index('facilityname', inplace=True)
 facilities.update(pc)
 facilities.reset_index(inplace=True)
@@ -515,7 +764,7 @@ facilities.reset_index(inplace=True)
 
 ###################################################################### Replenishment Policies
 cols = ['Oname', 'RevisedDName']
-rps = excel_data['Depot Assignments'][cols].copy()
+rps = excel_data['Depot Assignments'][cols]
 rps['sourcename'] = rps['Oname']
 rps['facilityname'] = rps['RevisedDName']
 
@@ -526,8 +775,9 @@ rps['notes']  = 'Baseline_Returns'
 
 # Set existing values prior to updating.
 replenishmentpolicies['soipplan'] = 'N'
-replenishmentpolicies.loc[replenishmentpolicies['sourcename'].str.startswith('R'), 'status'] = 'Exclude'
-replenishmentpolicies.loc[replenishmentpolicies['sourcename'].str.startswith('R'), 'notes'] = 'NewAllToAll_Returns'
+return_lanes = has_role(loc_dim, replenishmentpolicies['sourcename'], 'Return')
+replenishmentpolicies.loc[return_lanes, 'status'] = 'Exclude'
+replenishmentpolicies.loc[return_lanes, 'notes'] = 'NewAllToAll_Returns'
 
 index_cols = ['sourcename', 'facilityname']
 rps.set_index(index_cols, inplace=True)
@@ -537,6 +787,49 @@ replenishmentpolicies.update(rps)
 replenishmentpolicies.reset_index(inplace=True)
 print('\tDone.\n')
 
+#%% Lane Candidate Pruning
+print('Executing : Lane Candidate Pruning...')
+
+# Lanes that are always kept, as (depot, location) pairs: MultiSource List lanes, and
+# RenterDistSort preferred depot lanes (both directions).
+rds = excel_data['RenterDistSort Preferred Depot']
+rds_o = lookup_model_ids(loc_dim, rds['Ocode'], 'Depot')
+rds_d = lookup_model_ids(loc_dim, rds['Dcode'], 'Depot')
+keep_lanes = pd.concat([multi_source_lanes(msl),
+                        pd.DataFrame({'depot': rds_o, 'location': rds_d}),
+                        pd.DataFrame({'depot': rds_d, 'location': rds_o})]).dropna()
+
+# The nearest depots are ranked among the depots the 020 closest depot ranking can choose: open
+# Full Service and Sort Only depots, with the depot types and statuses set by workflows 010 and 015.
+refresh_location_attributes(loc_dim, facilities, 'facilityname', ['depottype', 'status'])
+atts = loc_dim['attributes']
+
+###################################################################### Customer Fulfillment Policies
+candidate = ((customerfulfillmentpolicies['notes']=='NewAllToAll_Issues') &
+             (customerfulfillmentpolicies['soipplan']=='N'))
+depo = location_keys(loc_dim, customerfulfillmentpolicies['sourcename'], FACILITY_ROLES)
+eligible = ((take(atts['status'], depo)=='Include') &
+            np.isin(take(atts['depottype'], depo), ['Full Service', 'Sort Only']))
+keep = lanes_to_keep(customerfulfillmentpolicies, 'customername', 'sourcename', 'depottype',
+                     candidate, LANE_PRUNING_RADIUS, LANE_PRUNING_NEAREST_DEPOTS, keep_lanes,
+                     eligible, loc_dim)
+print(f'\tKeeping {keep.sum():,} of {len(keep):,} customer fulfillment policy lanes.')
+customerfulfillmentpolicies = customerfulfillmentpolicies[keep].reset_index(drop=True)
+
+###################################################################### Replenishment Policies
+candidate = ((replenishmentpolicies['notes']=='NewAllToAll_Returns') &
+             (replenishmentpolicies['soipplan']=='N'))
+dst = location_keys(loc_dim, replenishmentpolicies['facilityname'], FACILITY_ROLES)
+eligible = ((take(atts['status'], dst)=='Include') &
+            np.isin(take(atts['depottype'], dst), ['Full Service', 'Sort Only']) &
+            has_role(loc_dim, replenishmentpolicies['sourcename'], 'Return'))
+keep = lanes_to_keep(replenishmentpolicies, 'sourcename', 'facilityname', 'ddepottype',
+                     candidate, LANE_PRUNING_RADIUS, LANE_PRUNING_NEAREST_DEPOTS, keep_lanes,
+                     eligible, loc_dim)
+print(f'\tKeeping {keep.sum():,} of {len(keep):,} replenishment policy lanes.')
+replenishmentpolicies = replenishmentpolicies[keep].reset_index(drop=True)
+print('\tDone.\n')
+
 #%% Issue and Return Location Details (Alteryx workflow 017)
 print('Executing : Issue and Return Location Details (Alteryx workflow 017)...')
 
@@ -545,16 +838,13 @@ renters = tbl_tab_Location.loc[(tbl_tab_Location['RL Location Type'] == 'Renter'
                                ['Code', 'Corporate Code', 'Corporate Name']]
 
 cols = ['customername', 'loccode']
-cs = customers[cols].copy()
+cs = customers[cols]
 cs = cs.merge(renters, how='left', left_on='loccode', right_on='Code')
 
-cols = ['customername', 'quantity']
-dm = customerdemand.loc[customerdemand['periodname'].str[-2:].astype(int) <= 12, cols].copy()
-dm['quantity'] = dm['quantity'].astype(float)
-dm = dm.groupby(by='customername').sum()
+dm = forecast_sum(demand_cube, last_period=12).to_frame('quantity')
 
 cs = cs.merge(dm, how='left', on='customername')
-cs['quantity'].fillna(0, inplace=True)
+cs['quantity'] = cs['quantity'].fillna(0)
 cs['corpcode'] = cs['Corporate Code']
 cs['corpname'] = cs['Corporate Name']
 cs['soipquantity'] = cs['quantity']
@@ -572,18 +862,13 @@ customers.reset_index(inplace=True)
 r_types = ['Distributor', 'Recovery', 'NPD']
 returners_dw = tbl_tab_Location.loc[tbl_tab_Location['RL Location Type'].isin(r_types),['Code', 'Corporate Code', 'Corporate Name']]
 
-cols = ['facilityname', 'constraintvalue']
-return_fcst = productionconstraints.loc[(productionconstraints['notes'] == ReturnsProductionNotes) & 
-                                        (productionconstraints['periodname'].str[-2:].astype(int) <= 12),
-                                        cols]
-return_fcst['constraintvalue'] = return_fcst['constraintvalue'].astype(float)
-return_fcst = return_fcst.groupby('facilityname').sum()
+return_fcst = forecast_sum(returns_cube, last_period=12).to_frame('constraintvalue')
 
-returners_cf = facilities.loc[facilities['facilityname'].str.startswith('R_'), ['facilityname', 'loccode']]
+returners_cf = facilities.loc[has_role(loc_dim, facilities['facilityname'], 'Return'), ['facilityname', 'loccode']]
 returners_cf = returners_cf.merge(returners_dw, how='left', left_on='loccode', right_on='Code')
 returners_cf = returners_cf.merge(return_fcst, how='left', on='facilityname')
 
-returners_cf['constraintvalue'].fillna(0, inplace=True)
+returners_cf['constraintvalue'] = returners_cf['constraintvalue'].fillna(0)
 returners_cf['corpcode'] = returners_cf['Corporate Code']
 returners_cf['corpname'] = returners_cf['Corporate Name']
 returners_cf['returnqty'] = returners_cf['constraintvalue']
@@ -597,73 +882,66 @@ print('\tDone.\n')
 
 #%% Lane Attributes (Alteryx workflow 020)
 print('Executing : Lane Attributes (Alteryx workflow 020)...')
+closest_depot_ranks = stage_function('020', STAGE_BACKENDS)
 
 ###################################################################### Customer Fulfillment Policies
 cols = ['customername', 'sourcename', 'soipplan', 'distance', 'greenfieldcandidate', 'cpudedicated']
-cfp = customerfulfillmentpolicies[cols].copy()
-cfp['distance'] = cfp['distance'].astype(float).fillna(0)
+cfp = customerfulfillmentpolicies[cols]
 
-cols = ['customername', 'country', 'georegion', 'pecoregion', 'pecosubregion', 'zone']
-cus = customers[cols].copy().add_suffix('_cust')
+# Workflows 010 and 015 change the facility depot types and statuses, so refresh them in the
+# location dimension before reading them below.
+refresh_location_attributes(loc_dim, facilities, 'facilityname', ['depottype', 'status'])
+atts = loc_dim['attributes']
 
-cols = ['facilityname', 'country', 'depottype', 'georegion', 'pecoregion', 'pecosubregion', 'zone']
-fac = facilities[cols].copy().add_suffix('_depo')
+cfp['distance'] = cfp['distance'].astype(float).fillna(0)
 
-cols = ['customername', 'quantity']
-dem = customerdemand.loc[customerdemand['periodname'].str[-2:].astype(int) <= 12,
-                         cols].copy()
-dem['quantity'] = dem['quantity'].astype(float)
-dem = dem.groupby('customername').mean()
+cust = location_keys(loc_dim, cfp['customername'], ['Issue'])
+depo = location_keys(loc_dim, cfp['sourcename'], FACILITY_ROLES)
 
-cfp = cfp.merge(cus, how='left', left_on='customername', right_on='customername_cust')
-cfp = cfp.merge(fac, how='left', left_on='sourcename', right_on='facilityname_depo')
-cfp = cfp.merge(dem, how='left', on='customername')
-cfp['quantity'].fillna(0, inplace=True)
+# Per-customer values are spread over the location dimension once, then gathered onto the lanes
+# with the customer keys (no merges).
+cust_any = location_keys(loc_dim, cfp['customername'])
+dem = dimension_values(loc_dim, forecast_mean(demand_cube, last_period=12))
+cfp['quantity'] = pd.to_numeric(take(dem, cust_any))
+cfp['quantity'] = cfp['quantity'].fillna(0)
 
 bins = [-np.inf,50,100,150,200,300,400,500,1000,1500,2000,np.inf]
 labs = ['LT0050','GT0050','GT0100','GT0150','GT0200','GT0300','GT0400','GT0500','GT1000','GT1500','GT2000']
 
-cfp['depottype'] = cfp['depottype_depo']
-cfp['oregion'] = cfp['georegion_depo']
-cfp['dregion'] = cfp['georegion_cust']
-cfp['ocountry'] = cfp['country_depo']
-cfp['dcountry'] = cfp['country_cust']
-cfp['ozone'] = cfp['zone_depo']
-cfp['dzone'] = cfp['zone_cust']
-cfp['opecoregion'] = cfp['pecoregion_depo']
-cfp['dpecoregion'] = cfp['pecoregion_cust']
-cfp['opecosubregion'] = cfp['pecosubregion_depo']
-cfp['dpecosubregion'] = cfp['pecosubregion_cust']
+cfp['depottype'] = take(atts['depottype'], depo)
+cfp['oregion'] = take(atts['georegion'], depo)
+cfp['dregion'] = take(atts['georegion'], cust)
+cfp['ocountry'] = take(atts['country'], depo)
+cfp['dcountry'] = take(atts['country'], cust)
+cfp['ozone'] = take(atts['zone'], depo)
+cfp['dzone'] = take(atts['zone'], cust)
+cfp['opecoregion'] = take(atts['pecoregion'], depo)
+cfp['dpecoregion'] = take(atts['pecoregion'], cust)
+cfp['opecosubregion'] = take(atts['pecosubregion'], depo)
+cfp['dpecosubregion'] = take(atts['pecosubregion'], cust)
+cfp['DepotStatus'] = take(atts['status'], depo)
 cfp['mileageband'] = pd.cut(cfp['distance'], bins, right=False, labels=labs)   # Should be based on 'distance' not 'quantity'
 cfp['monthly_avg'] = cfp['quantity']
-cfp['monthlypalletband'] = cfp.apply(lambda row: 'LT3500' if row['monthly_avg']<=3500 else 'GT3500', axis=1)
+cfp['monthlypalletband'] = np.where(cfp['monthly_avg']<=3500, 'LT3500', 'GT3500')
 
-cfp = cfp.merge(nod[['ModelID', 'number_of_depots']], how='left', left_on='customername', right_on='ModelID')
+nbr_depots = dimension_values(loc_dim, nod.set_index('ModelID')['number_of_depots'])
+cfp['number_of_depots'] = pd.to_numeric(take(nbr_depots, cust_any))
 cfp['number_of_depots_served'] = cfp['number_of_depots'].fillna(0)
-cfp['nbrdepotsband'] = cfp.apply(lambda row: 'LT01' if row['number_of_depots_served'] <= 1 else 'GT01', axis=1)
-
-def add_to_model(row):
-    if (row['soipplan'] == 'N' and 
-        row['distance'] <= 1000 and
-        row['greenfieldcandidate'] == 'Y' and
-        row['cpudedicated'] is None and
-        (row['monthly_avg'] <= 3500 or row['number_of_depots'] >= 2)
-        ):
-        return 'Y'
-    else:
-        return 'N'
-cfp['addtomodel'] = cfp.apply(add_to_model, axis=1)
-
-# Closest Depot Identifier
-cfp = cfp.merge(facilities[['facilityname', 'status']], how='left', left_on='sourcename', right_on='facilityname')
-cfp.rename(columns={'status':'DepotStatus'}, inplace=True)
-
-closest_depot = cfp[(cfp['DepotStatus']=='Include') & (cfp['depottype'].isin(['Full Service', 'Sort Only']))].copy()
-closest_depot = closest_depot.sort_values(['distance', 'depottype', 'sourcename']).groupby('customername').head(1)
-closest_depot = closest_depot[['sourcename', 'customername']]
-closest_depot['closestdepot'] = 'Y'
-cfp = cfp.merge(closest_depot, how='left', on=['sourcename', 'customername'])
-cfp['closestdepot'].fillna('N', inplace=True)
+cfp['nbrdepotsband'] = np.where(cfp['number_of_depots_served']<=1, 'LT01', 'GT01')
+
+add_to_model = ((cfp['soipplan']=='N') &
+                (cfp['distance']<=1000) &
+                (cfp['greenfieldcandidate']=='Y') &
+                np.equal(cfp['cpudedicated'].to_numpy(object), None) &
+                ((cfp['monthly_avg']<=3500) | (cfp['number_of_depots']>=2)))
+cfp['addtomodel'] = np.where(add_to_model, 'Y', 'N')
+
+# Closest Depot Identifier. Only the open depots are ranked, so the depots closed in the Depot
+# Assumptions sheet (Exclude status) are never the closest depot and do not count in depotrank.
+eligible = (cfp['DepotStatus']=='Include') & (cfp['depottype'].isin(['Full Service', 'Sort Only']))
+cfp['depotrank'] = closest_depot_ranks(cfp, 'customername', 'sourcename', 'depottype', eligible,
+                                       k=NEAREST_DEPOT_COUNT)
+cfp['closestdepot'] = np.where(cfp['depotrank']==1, 'Y', 'N')
 
 index_cols = ['customername', 'sourcename']
 cfp.set_index(index_cols, inplace=True)
@@ -676,71 +954,56 @@ customerfulfillmentpolicies.reset_index(inplace=True)
 ###################################################################### Replenishment Policies
 
 cols = ['facilityname', 'productname', 'sourcename', 'soipplan', 'distance', 'greenfieldcandidate', 'cpudedicated']
-rps = replenishmentpolicies[cols].copy()
+rps = replenishmentpolicies[cols]
 rps['distance'] = rps['distance'].astype(float).fillna(0)
 
-cols = ['facilityname', 'country', 'depottype', 'georegion', 'pecoregion', 'pecosubregion', 'zone']
-org = facilities[cols].copy().add_suffix('_orig')
-dst = facilities[cols].copy().add_suffix('_dest')
-
-cols = ['facilityname', 'constraintvalue']
-fst = productionconstraints.loc[(productionconstraints['periodname'].str[-2:].astype(int) <= 12) & 
-                                (productionconstraints['notes'] == ReturnsProductionNotes),
-                                cols].copy()
-fst['constraintvalue'] = fst['constraintvalue'].astype(float)
-fst = fst.groupby('facilityname').mean()
+# Per-return location values are gathered onto the lanes with the return location keys.
+org_any = location_keys(loc_dim, rps['sourcename'])
+fst = dimension_values(loc_dim, forecast_mean(returns_cube, last_period=12))
+rps['constraintvalue'] = pd.to_numeric(take(fst, org_any))
+rps['constraintvalue'] = rps['constraintvalue'].fillna(0)
 
-rps = rps.merge(org, how='left', left_on='sourcename', right_on='facilityname_orig')
-rps = rps.merge(dst, how='left', left_on='facilityname', right_on='facilityname_dest')
-rps = rps.merge(fst, how='left', left_on='sourcename', right_on='facilityname')
-rps['constraintvalue'].fillna(0, inplace=True)
+org = location_keys(loc_dim, rps['sourcename'], FACILITY_ROLES)
+dst = location_keys(loc_dim, rps['facilityname'], FACILITY_ROLES)
 
 bins = [-np.inf,50,100,150,200,300,400,500,1000,1500,2000,np.inf]
 labs = ['LT0050','GT0050','GT0100','GT0150','GT0200','GT0300','GT0400','GT0500','GT1000','GT1500','GT2000']
 
-rps['odepottype'] = rps['depottype_orig']
-rps['ddepottype'] = rps['depottype_dest']
-rps['ocountry'] = rps['country_orig']
-rps['dcountry'] = rps['country_dest']
-rps['oregion'] = rps['georegion_orig']
-rps['dregion'] = rps['georegion_dest']
-rps['opecoregion'] = rps['pecoregion_orig']
-rps['dpecoregion'] = rps['pecoregion_dest']
-rps['opecosubregion'] = rps['pecosubregion_orig']
-rps['dpecosubregion'] = rps['pecosubregion_dest']
+rps['odepottype'] = take(atts['depottype'], org)
+rps['ddepottype'] = take(atts['depottype'], dst)
+rps['ocountry'] = take(atts['country'], org)
+rps['dcountry'] = take(atts['country'], dst)
+rps['oregion'] = take(atts['georegion'], org)
+rps['dregion'] = take(atts['georegion'], dst)
+rps['opecoregion'] = take(atts['pecoregion'], org)
+rps['dpecoregion'] = take(atts['pecoregion'], dst)
+rps['opecosubregion'] = take(atts['pecosubregion'], org)
+rps['dpecosubregion'] = take(atts['pecosubregion'], dst)
+rps['DepotStatus'] = take(atts['status'], dst)
+rps['returnlocation'] = has_role(loc_dim, rps['sourcename'], 'Return')
 rps['mileageband'] = pd.cut(rps['distance'], bins, right=False, labels=labs)
 rps['monthly_avg'] = rps['constraintvalue']
-rps['monthlypalletband'] = rps.apply(lambda row: 'LT3500' if row['monthly_avg']<=3500 else 'GT3500', axis=1)
+rps['monthlypalletband'] = np.where(rps['monthly_avg']<=3500, 'LT3500', 'GT3500')
 
-rps = rps.merge(nod[['ModelID', 'number_of_depots']], how='left', left_on='sourcename', right_on='ModelID')
+rps['number_of_depots'] = pd.to_numeric(take(nbr_depots, org_any))
 rps['number_of_depots_served'] = rps['number_of_depots'].fillna(0)
-rps['nbrdepotsband'] = rps.apply(lambda row: 'LT01' if row['number_of_depots_served'] <= 1 else 'GT01', axis=1)
-
-def add_to_model(row):
-    if (row['sourcename'].startswith('R_') and
-        row['soipplan'] == 'N' and 
-        row['distance'] <= 1000 and
-        row['greenfieldcandidate'] == 'Y' and
-        row['cpudedicated'] is None and
-        (row['monthly_avg'] <= 3500 or row['number_of_depots'] >= 2)
-        ):
-        return 'Y'
-    else:
-        return 'N'
-rps['addtomodel'] = rps.apply(add_to_model, axis=1)
+rps['nbrdepotsband'] = np.where(rps['number_of_depots_served']<=1, 'LT01', 'GT01')
+
+add_to_model = (rps['returnlocation'] &
+                (rps['soipplan']=='N') &
+                (rps['distance']<=1000) &
+                (rps['greenfieldcandidate']=='Y') &
+                np.equal(rps['cpudedicated'].to_numpy(object), None) &
+                ((rps['monthly_avg']<=3500) | (rps['number_of_depots']>=2)))
+rps['addtomodel'] = np.where(add_to_model, 'Y', 'N')
 
 # Closest depot identifier.
-rps = rps.merge(facilities[['facilityname', 'status']], how='left', on='facilityname')
-rps.rename(columns={'status':'DepotStatus'}, inplace=True)
-
-closest_depot = rps[(rps['DepotStatus']=='Include') & 
-                    (rps['ddepottype'].isin(['Full Service', 'Sort Only'])) &
-                    (rps['sourcename'].str.startswith('R'))].copy()
-closest_depot = closest_depot.sort_values(['distance', 'ddepottype', 'facilityname']).groupby('sourcename').head(1)
-closest_depot = closest_depot[['facilityname', 'sourcename']]
-closest_depot['closestdepot'] = 'Y'
-rps = rps.merge(closest_depot, how='left', on=['facilityname', 'sourcename'])
-rps['closestdepot'].fillna('N', inplace=True)
+eligible = ((rps['DepotStatus']=='Include') &
+            (rps['ddepottype'].isin(['Full Service', 'Sort Only'])) &
+            has_role(loc_dim, rps['sourcename'], 'Return'))
+rps['depotrank'] = closest_depot_ranks(rps, 'sourcename', 'facilityname', 'ddepottype', eligible,
+                                       k=NEAREST_DEPOT_COUNT)
+rps['closestdepot'] = np.where(rps['depotrank']==1, 'Y', 'N')
 
 index_cols = ['facilityname', 'sourcename']
 rps.set_index(index_cols, inplace=True)
@@ -751,18 +1014,15 @@ replenishmentpolicies.reset_index(inplace=True)
 
 ###################################################################### Transportation Policies
 cols = ['originname', 'destinationname']
-tps = transportationpolicies[cols].copy()
-
-cols = ['facilityname', 'country', 'loccode']
-fac = facilities[cols]
+tps = transportationpolicies[cols]
 
-tps = tps.merge(fac.add_suffix('_orig'), how='left', left_on='originname', right_on='facilityname_orig')
-tps = tps.merge(fac.add_suffix('_dest'), how='left', left_on='destinationname', right_on='facilityname_dest')
+org = location_keys(loc_dim, tps['originname'], FACILITY_ROLES)
+dst = location_keys(loc_dim, tps['destinationname'], FACILITY_ROLES)
 
-tps['ocountry'] = tps['country_orig']
-tps['dcountry'] = tps['country_dest']
-tps['oloccode'] = tps['loccode_orig']
-tps['dloccode'] = tps['loccode_dest']
+tps['ocountry'] = take(atts['country'], org)
+tps['dcountry'] = take(atts['country'], dst)
+tps['oloccode'] = take(atts['loccode'], org)
+tps['dloccode'] = take(atts['loccode'], dst)
 
 index_cols = ['originname', 'destinationname']
 tps.set_index(index_cols, inplace=True)
@@ -775,12 +1035,17 @@ print('\tDone.\n')
 #%% NPD Percentage Penalty (Alteryx workflow 030)
 print('Executing : NPD Percentage Penalty (Alteryx workflow 030)...')
 
+# Inputs of the stages' scalar updates (see scalar_fast_path.py), kept for the scalar fast path.
+scalar_inputs = {}
+
 ###################################################################### Customer Fulfillment Policies
 cols = ['ModelID', 'NPD %']
-cfp = excel_data['Renter Assumptions'][cols].copy().drop_duplicates()
+cfp = excel_data['Renter Assumptions'][cols].drop_duplicates()
 cfp['customername'] = cfp['ModelID']
 cfp['depottype'] = 'Manufacturing'
-cfp['unitcost'] = (cfp['NPD %']*NewPalletCost).fillna(0)
+npd_unit_cost(cfp, scalar_parameters)
+if SCALAR_FAST_PATH:
+    scalar_inputs['030'] = scalar_update_inputs('030', cfp)
 
 index_cols = ['customername', 'depottype']
 cfp.set_index(index_cols, inplace=True)
@@ -799,34 +1064,31 @@ print('Executing : Transportation Rates Historical (Alteryx workflow 060)...')
 # so pick the one that is the most common for that OD pair.
 # Calculate the avg cost per load cost across all carriers.
 
-shp_hist = transport_rates_hist_costs.copy()
+shp_hist = transport_rates_hist_costs
 
 cond = (shp_hist['Ttl_LH_Cost']>100) | (shp_hist['Carrier_Type']=='CPU')
 shp_hist = shp_hist[cond]
 
-groupby_cols = ['movetype', 'Lane_ID', 'Depot', 'Customer', 'SCAC', 'Carrier_Type']
-shp_hist = shp_hist.groupby(groupby_cols)[['Total_Loads', 'Ttl_LH_Cost']].sum()
+# Sum the loads and costs per lane and carrier, over the look-back window.
+if LANE_STATS_FILENAME is None:
+    shp_hist = shp_hist.groupby(LANE_STATS_KEYS)[['Total_Loads', 'Ttl_LH_Cost']].sum()
+else:
+    lane_stats = update_lane_stats(lane_stats, shp_hist, lane_stats_start)
+    if SCENARIO is None:
+        save_lane_stats(lane_stats, lane_stats_path)
+    shp_hist = lane_window(lane_stats, LANE_STATS_MONTHS_BACK, LANE_STATS_MONTH_WEIGHTS)
+    # The window moves every month, so it is an input of its own.
+    if SNAPSHOT_INPUTS:
+        add_to_snapshot(input_snapshot, 'lane statistics window', shp_hist.reset_index())
 
 cond = shp_hist['Total_Loads'] > 5
 shp_hist = shp_hist[cond].reset_index()
 
-groupby_cols = ['movetype', 'Lane_ID']
-shp_cst_per_load_avg = shp_hist.groupby(groupby_cols)[['Total_Loads', 'Ttl_LH_Cost']].sum().reset_index()
-
-groupby_cols = ['movetype', 'Lane_ID', 'SCAC', 'Carrier_Type']
-shp_top_carrier = shp_hist.groupby(groupby_cols)[['Total_Loads']].sum().reset_index()
-shp_top_carrier = shp_top_carrier.sort_values(['Total_Loads', 'SCAC'], ascending=[False, True]).groupby(['movetype', 'Lane_ID']).first().reset_index()
-
-merge_cols = ['movetype', 'Lane_ID']
-shp_hist_final = shp_cst_per_load_avg.merge(shp_top_carrier, how='inner', on=merge_cols,
-                                            suffixes=('', '_carrier_max'))
-shp_hist_final['CostPerLoadAvg'] = shp_hist_final['Ttl_LH_Cost']/shp_hist_final['Total_Loads']
-
-cols_to_keep = ['movetype','Lane_ID','SCAC','Carrier_Type','CostPerLoadAvg']
-cost_per_load = shp_hist_final[cols_to_keep].copy()   # Renaming to 'cost_per_load' as this is more descriptive.
+# Average cost per load and top carrier of each lane.
+cost_per_load = stage_function('060', STAGE_BACKENDS)(shp_hist)
 
 # History - Issues, Returns, and Transfers by Lane Type (loads by lane type)
-lblt = transport_rates_hist_load_counts.copy()
+lblt = transport_rates_hist_load_counts
 lblt = lblt.dropna()
 
 # Join Loads by Lane Type to Cost per Load
@@ -851,37 +1113,25 @@ def label_type(row):
         
 lblt['Type'] = lblt.apply(label_type, axis=1)   
 
-# Bring in ModelID's
-lblt_iss = lblt[lblt['movetype']=='Issue'].copy()
-lblt_ret = lblt[lblt['movetype']=='Return'].copy()
-lblt_trs = lblt[~lblt['movetype'].isin(['Issue', 'Return'])].copy()
-
-# Bring in Model ID's for the Origin and Destination Locations
-locs_issue  = customers[['customername', 'loccode']].drop_duplicates()
-locs_depot  = facilities.loc[facilities['facilityname'].str.startswith('D_'), ['facilityname', 'loccode']].drop_duplicates()
-locs_return = facilities.loc[facilities['facilityname'].str.startswith('R_'), ['facilityname', 'loccode']].drop_duplicates()
-
-
-lblt_iss = lblt_iss.merge(locs_issue, how='left', left_on='Customer', right_on='loccode')
-lblt_iss = lblt_iss.merge(locs_depot, how='left', left_on='Depot', right_on='loccode')
-lblt_iss.rename(columns={'facilityname':'originname', 'customername':'destinationname'}, inplace=True)
-lblt_iss.drop(columns=['loccode_x', 'loccode_y'], inplace=True)
-
-lblt_ret = lblt_ret.merge(locs_return, how='left', left_on='Customer', right_on='loccode')
-lblt_ret = lblt_ret.merge(locs_depot, how='left', left_on='Depot', right_on='loccode')
-lblt_ret.rename(columns={'facilityname_x':'originname', 'facilityname_y':'destinationname'}, inplace=True)
-lblt_ret.drop(columns=['loccode_x', 'loccode_y'], inplace=True)
-
-lblt_trs['orig'] = lblt_trs['Lane_ID'].str[0:5]
-lblt_trs['dest'] = lblt_trs['Lane_ID'].str[-5:]
-lblt_trs = lblt_trs.merge(locs_depot, how='left', left_on='orig', right_on='loccode')
-lblt_trs = lblt_trs.merge(locs_depot, how='left', left_on='dest', right_on='loccode')
-lblt_trs.rename(columns={'facilityname_x':'originname', 'facilityname_y':'destinationname'}, inplace=True)
-lblt_trs.drop(columns=['loccode_x', 'loccode_y'], inplace=True)
-
-cols_to_keep = list(lblt.columns)+['originname', 'destinationname']
-
-lblt = pd.concat([lblt_iss[cols_to_keep], lblt_ret[cols_to_keep], lblt_trs[cols_to_keep]]).reset_index(drop=True)
+# Bring in Model ID's for the Origin and Destination Locations.
+# Issues go from a depot to a customer, returns from a return location to a depot, and transfers
+# between the two depots in the Lane_ID.
+iss = (lblt['movetype']=='Issue').to_numpy()
+ret = (lblt['movetype']=='Return').to_numpy()
+lane_orig, lane_dest = split_lane_names(lblt['Lane_ID'])
+lblt['originkey'] = np.select([iss, ret],
+                              [lookup_location_keys(loc_dim, lblt['Depot'], 'Depot'),
+                               lookup_location_keys(loc_dim, lblt['Customer'], 'Return')],
+                              default=lookup_location_keys(loc_dim, lane_orig, 'Depot'))
+lblt['destinationkey'] = np.select([iss, ret],
+                                   [lookup_location_keys(loc_dim, lblt['Customer'], 'Issue'),
+                                    lookup_location_keys(loc_dim, lblt['Depot'], 'Depot')],
+                                   default=lookup_location_keys(loc_dim, lane_dest, 'Depot'))
+lblt['originname'] = take(loc_dim['modelid'].to_numpy(object), lblt['originkey'].to_numpy())
+lblt['destinationname'] = take(loc_dim['modelid'].to_numpy(object), lblt['destinationkey'].to_numpy())
+
+# Keep the issues first, then returns, then transfers.
+lblt = lblt.iloc[np.argsort(np.select([iss, ret], [0, 1], default=2), kind='stable')].reset_index(drop=True)
 lblt.dropna(subset=['origin_Name', 'Destination_Name'], inplace=True)
 
 # Rename to match transportationpolicies column names.
@@ -893,7 +1143,7 @@ lblt.rename(columns={'CostPerLoadAvg':'histrate', 'SCAC':'scac', 'Type':'scaccar
 cols = ['originname','productname','destinationname','ocountry','dcountry','oloccode','dloccode',
         'histrate','marketrate','rateused','fixedcost','scac','scaccarriertype','cpu','unitcost',
         'dutyrate']
-tps = transportationpolicies[cols].copy()
+tps = transportationpolicies[cols]
 
 # Reset all columns that we want to update.
 cols_to_update = [i for i in cols if i not in ['originname','destinationname','ocountry',
@@ -903,24 +1153,31 @@ cols_to_update = [i for i in cols if i not in ['originname','destinationname','o
 tps[cols_to_update] = None
 tps['rfqrate'] = None     # Adding here and not above becasue currently rfqrate isn't a column in transportationpolicies.
 
-# Update oloccode and dloccode
-tps['oloccode'] = tps['originname'].str[-5:]
-tps['dloccode'] = tps['destinationname'].str[-5:]
+# Update oloccode and dloccode from the location dimension.
+tps_orig = location_keys(loc_dim, tps['originname'])
+tps_dest = location_keys(loc_dim, tps['destinationname'])
+tps['oloccode'] = take(loc_dim['attributes']['loccode'], tps_orig)
+tps['dloccode'] = take(loc_dim['attributes']['loccode'], tps_dest)
 
 # Get rfqrate from Excel input data.
-trans_rfq_rates = excel_data['Trans RFQ Rates'].copy()
-trans_rfq_rates.rename(columns={'Final Rate Award':'rfqrate'}, inplace=True)
-trans_rfq_rates['oloccode'] = trans_rfq_rates['Lane Name'].str[0:5]
-trans_rfq_rates['dloccode'] = trans_rfq_rates['Lane Name'].str[-5:]
+trans_rfq_rates = excel_data['Trans RFQ Rates'].rename(columns={'Final Rate Award':'rfqrate'})
 
-cols = ['oloccode', 'dloccode', 'rfqrate']
-tps = tps.merge(trans_rfq_rates[cols], how='left', on=['oloccode', 'dloccode'], suffixes=('_drop', ''))
-tps.drop(columns=[c for c in tps.columns if '_drop' in c], inplace=True)
+# Pack the lanes into integer keys: by location code for the RFQ rates, and by location
+# dimension key for the historical lane costs.
+rfq_orig, rfq_dest = split_lane_names(trans_rfq_rates['Lane Name'])
+codes = code_vocabulary(tps['oloccode'], tps['dloccode'], rfq_orig, rfq_dest)
+tps_code_lanes = pack_lane_keys(code_ids(codes, tps['oloccode']), code_ids(codes, tps['dloccode']))
+rfq_code_lanes = pack_lane_keys(code_ids(codes, rfq_orig), code_ids(codes, rfq_dest))
+
+tps_lanes = pack_lane_keys(tps_orig, tps_dest)
+lblt_lanes = pack_lane_keys(lblt['originkey'], lblt['destinationkey'])
+
+# Join the RFQ rates and the historical lane costs to the lanes.
+tps[['rfqrate']] = lane_lookup(tps_code_lanes, trans_rfq_rates, rfq_code_lanes, ['rfqrate'], tps.index)
 
 # Update histrate, scac, scaccarriertype, and cpu
-cols = ['originname', 'destinationname', 'histrate', 'scac', 'scaccarriertype']
-tps = tps.merge(lblt[cols], how='left', on=['originname', 'destinationname'], suffixes=('_drop', ''))
-tps.drop(columns=[c for c in tps.columns if '_drop' in c], inplace=True)
+cols = ['histrate', 'scac', 'scaccarriertype']
+tps[cols] = lane_lookup(tps_lanes, lblt, lblt_lanes, cols, tps.index)
 
 # =============================================================================
 # Rate priority:
@@ -939,37 +1196,22 @@ tps['histrate'] = tps['histrate'].astype(float)
 tps['rfqrate'] = tps['rfqrate'].astype(float)
 tps['marketrate'] = tps['marketrate'].astype(float)
 
-# Set rates for CPUs
-cpu = tps['scaccarriertype']=='CPU'
-tps.loc[cpu, ['rateused', 'fixedcost', 'cpu']] = ['CPU', 0, 'C']
-
-# Set cpu flag for dedicated.
-ded = tps['scaccarriertype']=='Dedicated'
-tps.loc[ded, 'cpu'] = 'D'
-
-# Choose the appropriate rate to use.
-# Use RFQ rate.
-rfq = ~tps['rfqrate'].isna()
-tps.loc[~cpu & rfq, 'fixedcost'] = tps['rfqrate']
-tps.loc[~cpu & rfq, 'rateused'] = 'rfqrate'
-
-# Use historical rate.
-hst = ~tps['histrate'].isna()
-tps.loc[~cpu & ~rfq & hst, 'fixedcost'] = tps['histrate']
-tps.loc[~cpu & ~rfq & hst, 'rateused'] = 'HistRate'
+cpu = (tps['scaccarriertype']=='CPU').to_numpy()
+ded = (tps['scaccarriertype']=='Dedicated').to_numpy()
 
-# Use market rate.
-tps.loc[~cpu & ~rfq & ~hst, 'fixedcost'] = tps['marketrate']
-tps.loc[~cpu & ~rfq & ~hst, 'rateused'] = 'MarketRate'
+# Rate sources, in priority order.
+rate_sources = [{'name':'CPU',        'rate':0,                 'available':cpu},
+                {'name':'rfqrate',    'rate':tps['rfqrate']},
+                {'name':'HistRate',   'rate':tps['histrate']},
+                {'name':'MarketRate', 'rate':tps['marketrate'], 'available':True}]
 
-# Set fuel surcharge.
-tps.loc[~cpu, 'unitcost'] = Fuel_Surcharge
+tps['fixedcost'], tps['rateused'] = resolve_rates(rate_sources, len(tps))
+tps['cpu'] = np.select([cpu, ded], ['C', 'D'], default=None)
 
-# Set the duty rates.
-us_to_can = (tps['ocountry']=='USA') & (tps['dcountry']=='CAN')
-can_to_us = (tps['ocountry']=='CAN') & (tps['dcountry']=='USA')
-tps.loc[us_to_can, 'dutyrate'] = Duty_Rate_US_to_Canada
-tps.loc[can_to_us, 'dutyrate'] = Duty_Rate_Canada_to_US
+# Set the fuel surcharge and the duty rates.
+fuel_surcharge_and_duty_rates(tps, scalar_parameters)
+if SCALAR_FAST_PATH:
+    scalar_inputs['060'] = scalar_update_inputs('060', tps)
 
 index_cols = ['originname', 'destinationname', 'productname']
 tps.set_index(index_cols, inplace=True)
@@ -984,72 +1226,47 @@ transportationpolicies.reset_index(inplace=True)
 ### Update Customer Fulfillment Policies and Replenishment Policies using the new 
 ### Transportation Policies data.
 cols = ['originname', 'destinationname', 'cpu']
-tps = transportationpolicies[cols].copy()
+tps = transportationpolicies[cols]
 tps = tps[tps['cpu'].isin(['C', 'D'])].drop_duplicates()
 
-cols = ['sourcename', 'customername']
-cfp = customerfulfillmentpolicies[cols].copy().drop_duplicates()
+# Pack the CPU and dedicated lanes into integer keys of the location dimension.
+tps_orig = location_keys(loc_dim, tps['originname'])
+tps_dest = location_keys(loc_dim, tps['destinationname'])
+tps_lanes = pack_lane_keys(tps_orig, tps_dest)
+tps_cpu = tps['cpu'].to_numpy(object)
 
-# Identify customers that have customer pickup issue lanes.
-cfp = cfp.merge(tps, how='left', left_on='customername', right_on='destinationname')
 
-# Label these customers with an "N" in front of their CPU flag.
-flag = ~cfp['cpu'].isna()
-cfp.loc[flag, 'cpudedicated'] = 'N'+cfp['cpu']
-
-# Bring in the specific CPU and dedicated lanes that are in the transportation policies.
-cfp = cfp.merge(tps, how='left', left_on=['customername', 'sourcename'], 
-                                 right_on=['destinationname', 'originname'],
-                                 suffixes=('_drop', ''))
+def cpu_flags(location, lanes, location_side):
+# =============================================================================
+#     Returns the CPU flag of each lane: the flag of the CPU or dedicated lane itself if it is one,
+#     otherwise "N" in front of the flag of the first CPU or dedicated lane of its location (its
+#     customer or return location), otherwise NaN.
+# =============================================================================
+    lane_cpu = take(tps_cpu, match_keys(lanes, tps_lanes))
+    location_cpu = ('N'+pd.Series(take(tps_cpu, match_keys(location, location_side)))).to_numpy(object)
+    return np.where(pd.notna(lane_cpu), lane_cpu, location_cpu)
 
-# Update these OD pairs with their CPU flag.
-flag = ~cfp['cpu'].isna()
-cfp.loc[flag, 'cpudedicated'] = cfp['cpu']
 
-# Drop unneeded columns
-cols = [c for c in cfp.columns if '_drop' in c] + ['originname', 'destinationname', 'cpu']
-cfp.drop(columns=cols, inplace=True)
+# Label the customers that have customer pickup issue lanes with an "N" in front of their CPU flag,
+# and the CPU and dedicated lanes with their CPU flag.
+cfp_cust = location_keys(loc_dim, customerfulfillmentpolicies['customername'])
+cfp_lanes = pack_lane_keys(location_keys(loc_dim, customerfulfillmentpolicies['sourcename']), cfp_cust)
+flags = cpu_flags(cfp_cust, cfp_lanes, tps_dest)
 
 # Update Customer Fulfillment Policies
-index_cols = ['customername', 'sourcename']
-cfp.set_index(index_cols, inplace=True)
-cfp = cfp[~cfp.index.duplicated()]
-customerfulfillmentpolicies.set_index(index_cols, inplace=True)
-customerfulfillmentpolicies.update(cfp)
-customerfulfillmentpolicies.reset_index(inplace=True)
+flag = pd.notna(flags)
+customerfulfillmentpolicies['cpudedicated'] = np.where(flag, flags, customerfulfillmentpolicies['cpudedicated'])
 
 
 ###################################################################### Replenishment Policies
-cols = ['sourcename', 'facilityname']
-rps = replenishmentpolicies[cols].copy().drop_duplicates()
-
-# Identify customers that have customer pickup return lanes.
-rps = rps.merge(tps, how='left', left_on='sourcename', right_on='originname')
-
-# Label these customers with an "N" in front of their CPU flag.
-flag = ~rps['cpu'].isna()
-rps.loc[flag, 'cpudedicated'] = 'N'+rps['cpu']
-
-# Bring in the specific CPU and dedicated lanes that are in the transportation policies.
-rps = rps.merge(tps, how='left', left_on=['facilityname', 'sourcename'], 
-                                 right_on=['destinationname', 'originname'],
-                                 suffixes=('_drop', ''))
-
-# Update these OD pairs with their CPU flag.
-flag = ~rps['cpu'].isna()
-rps.loc[flag, 'cpudedicated'] = rps['cpu']
-
-# Drop unneeded columns
-cols = [c for c in rps.columns if '_drop' in c] + ['originname', 'destinationname', 'cpu']
-rps.drop(columns=cols, inplace=True)
-
-# Update Customer Fulfillment Policies
-index_cols = ['sourcename', 'facilityname']
-rps.set_index(index_cols, inplace=True)
-rps = rps[~rps.index.duplicated()]
-replenishmentpolicies.set_index(index_cols, inplace=True)
-replenishmentpolicies.update(rps)
-replenishmentpolicies.reset_index(inplace=True)
+# Same for the return locations that have customer pickup return lanes.
+rps_src = location_keys(loc_dim, replenishmentpolicies['sourcename'])
+rps_lanes = pack_lane_keys(rps_src, location_keys(loc_dim, replenishmentpolicies['facilityname']))
+flags = cpu_flags(rps_src, rps_lanes, tps_orig)
+
+# Update Replenishment Policies
+flag = pd.notna(flags)
+replenishmentpolicies['cpudedicated'] = np.where(flag, flags, replenishmentpolicies['cpudedicated'])
 print('\tDone.\n')
 
 
@@ -1058,12 +1275,14 @@ print('Executing : Transportation Load Size (Alteryx workflow 070)...')
 
 
 ###################################################################### Customers
-cs = tls.loc[tls['movetype']=='Issue',['destinationname', 'Average_Cube']].copy()
+cs = tls.loc[tls['movetype']=='Issue',['destinationname', 'Average_Cube']]
 cs.rename(columns={'destinationname':'customername'}, inplace=True)
 
-cus = customers['customername'].copy().to_frame().drop_duplicates()
+cus = customers['customername'].to_frame().drop_duplicates()
 cus = cus.merge(cs, how='left', on='customername')
-cus['avgloadsz'] = cus['Average_Cube'].fillna(Avg_Load_Size_Issues)
+customer_load_sizes(cus, scalar_parameters)
+if SCALAR_FAST_PATH:
+    scalar_inputs['070 customers'] = scalar_update_inputs('070 customers', cus)
 
 index_cols = ['customername']
 cus.set_index(index_cols, inplace=True)
@@ -1073,15 +1292,14 @@ customers.reset_index(inplace=True)
 
 
 ###################################################################### Facilities
-fs = tls.loc[tls['movetype']=='Return',['originname', 'Average_Cube']].copy()
+fs = tls.loc[tls['movetype']=='Return',['originname', 'Average_Cube']]
 fs.rename(columns={'originname':'facilityname'}, inplace=True)
 
-fac = facilities['facilityname'].copy().to_frame().drop_duplicates()
+fac = facilities['facilityname'].to_frame().drop_duplicates()
 fac = fac.merge(fs, how='left', on='facilityname')
-
-fac.loc[fac['facilityname'].str.startswith('R_'), 'defaultloadsz'] = Avg_Load_Size_Returns
-fac.loc[fac['facilityname'].str.startswith('D_'), 'defaultloadsz'] = Avg_Load_Size_Transfers
-fac['avgloadsz'] = fac[['Average_Cube', 'defaultloadsz']].bfill(axis=1).iloc[:,0]
+facility_load_sizes(fac, scalar_parameters)
+if SCALAR_FAST_PATH:
+    scalar_inputs['070 facilities'] = scalar_update_inputs('070 facilities', fac)
 
 index_cols = ['facilityname']
 fac.set_index(index_cols, inplace=True)
@@ -1092,28 +1310,35 @@ facilities.reset_index(inplace=True)
 
 ###################################################################### Transportation Policies
 cols = ['originname', 'destinationname', 'productname', 'modename']
-tps = transportationpolicies[cols].dropna(subset=['originname', 'destinationname']).copy()
+tps = transportationpolicies[cols].dropna(subset=['originname', 'destinationname'])
 
 choices = ['Issue', 'Return']
-conditions = [tps['destinationname'].str.startswith('I_'),
-              tps['originname'].str.startswith('R_')]
+conditions = [has_role(loc_dim, tps['destinationname'], 'Issue'),
+              has_role(loc_dim, tps['originname'], 'Return')]
 tps['movetype'] = np.select(conditions, choices, default='Transfer')
 
-issues    = tps[tps['movetype']=='Issue'].copy()
-returns   = tps[tps['movetype']=='Return'].copy()
-transfers = tps[tps['movetype']=='Transfer'].copy()
+issues    = tps[tps['movetype']=='Issue']
+returns   = tps[tps['movetype']=='Return']
+transfers = tps[tps['movetype']=='Transfer']
+
+# Match the issue destinations / return origins to the load sizes on location dimension keys.
+cube = tls['Average_Cube'].to_numpy(float)
+tls_issues = np.where(tls['movetype']=='Issue', tls['locationkey'], -1)
+tls_returns = np.where(tls['movetype']=='Return', tls['locationkey'], -1)
 
-issues = issues.merge(tls[['movetype', 'destinationname', 'Average_Cube']], how='left', 
-                      on=['movetype', 'destinationname'])
-issues['averageshipmentsize'] = issues['Average_Cube'].fillna(Avg_Load_Size_Issues)
+rows = match_keys(location_keys(loc_dim, issues['destinationname']), tls_issues)
+issues['Average_Cube'] = np.where(rows >= 0, cube[rows], np.nan)
 
-returns = returns.merge(tls[['movetype', 'originname', 'Average_Cube']], how='left', 
-                        on=['movetype', 'originname'])
-returns['averageshipmentsize'] = returns['Average_Cube'].fillna(Avg_Load_Size_Returns)
+rows = match_keys(location_keys(loc_dim, returns['originname']), tls_returns)
+returns['Average_Cube'] = np.where(rows >= 0, cube[rows], np.nan)
 
-transfers['averageshipmentsize'] = Avg_Load_Size_Transfers
+# Transfers have no average cube, they all get Avg_Load_Size_Transfers.
+transfers['Average_Cube'] = np.nan
 
 tps = pd.concat([issues, returns, transfers])
+lane_load_sizes(tps, scalar_parameters)
+if SCALAR_FAST_PATH:
+    scalar_inputs['070 lanes'] = scalar_update_inputs('070 lanes', tps)
 
 index_cols = ['originname', 'destinationname', 'productname', 'modename']
 tps.set_index(index_cols, inplace=True)
@@ -1128,20 +1353,10 @@ print('\tDone.\n')
 print('Executing : Flag Multi-Source Options (Alteryx workflow 090)...')
 
 ###################################################################### Customer Fulfillment Policies
-cols = ['sourcename', 'customername']
-cfp = customerfulfillmentpolicies[cols].copy()
-
-iss = msl.loc[msl['MoveType']=='Issue', 'DModelID'].drop_duplicates().to_frame()
-cfp = cfp.merge(iss, how='left', left_on='customername', right_on='DModelID')
-cols = ['OModelID', 'DModelID']
-cfp = cfp.merge(msl[cols], how='left', left_on=['sourcename', 'customername'], 
-                                       right_on=['OModelID', 'DModelID'], suffixes=('', '_msl'))
+multi_source_flags = stage_function('090', STAGE_BACKENDS)
 
-cond_N = ~cfp['DModelID'].isna() &  cfp['OModelID'].isna()
-cond_Y = ~cfp['DModelID'].isna() & ~cfp['OModelID'].isna()
-
-cfp.loc[cond_N, 'multi_source_option'] = 'N'
-cfp.loc[cond_Y, 'multi_source_option'] = 'Y'
+# Customers in the MultiSource List: 'Y' on their listed lanes, 'N' on the others.
+cfp = multi_source_flags(customerfulfillmentpolicies, 'sourcename', 'customername', msl, 'Issue')
 
 index_cols = ['customername', 'sourcename']
 cfp.set_index(index_cols, inplace=True)
@@ -1155,7 +1370,7 @@ customerfulfillmentpolicies.reset_index(inplace=True)
 
 #Return locations
 ret = msl.loc[msl['MoveType']=='Return', 'OModelID'].drop_duplicates().to_frame() # 37
-ret_locs = facilities.loc[facilities['facilityname'].str.startswith('R_'),
+ret_locs = facilities.loc[has_role(loc_dim, facilities['facilityname'], 'Return'),
                           'facilityname'].drop_duplicates().to_frame()
 ret_locs = ret_locs.merge(ret, how='left', left_on='facilityname', right_on='OModelID')
 
@@ -1178,6 +1393,8 @@ iss_locs.rename(columns={'customername':'membername'}, inplace=True)
 
 cols = ['membername', 'groupname', 'grouptype']
 grp = pd.concat([iss_locs[cols], ret_locs[cols]])
+# The member names come from the encoded name columns, but the merges above made them strings.
+grp['membername'] = grp['membername'].astype(groups['membername'].dtype)
 
 # Note: Can't use DataFrame.update for groups, as the primary keys of dataset are what is being 
 # updated. Need to make a new Groups dataframe.
@@ -1190,20 +1407,8 @@ groups = pd.concat([grp, groups[~cond]])
 
 
 ###################################################################### Replenishment Policies
-cols = ['sourcename', 'facilityname']
-rps = replenishmentpolicies[cols].copy()
-
-ret = msl.loc[msl['MoveType']=='Return', 'OModelID'].drop_duplicates().to_frame()
-rps = rps.merge(ret, how='left', left_on='sourcename', right_on='OModelID')
-cols = ['OModelID', 'DModelID']
-rps = rps.merge(msl[cols], how='left', left_on=['sourcename', 'facilityname'], 
-                                       right_on=['OModelID', 'DModelID'], suffixes=('', '_msl'))
-
-cond_N = ~rps['OModelID'].isna() &  rps['DModelID'].isna()
-cond_Y = ~rps['OModelID'].isna() & ~rps['DModelID'].isna()
-
-rps.loc[cond_N, 'multi_source_option'] = 'N'
-rps.loc[cond_Y, 'multi_source_option'] = 'Y'
+# Return locations in the MultiSource List: 'Y' on their listed lanes, 'N' on the others.
+rps = multi_source_flags(replenishmentpolicies, 'sourcename', 'facilityname', msl, 'Return')
 
 index_cols = ['facilityname', 'sourcename']
 rps.set_index(index_cols, inplace=True)
@@ -1218,47 +1423,19 @@ print('Executing : Transfer Matrix Update (Alteryx workflow 100)...')
 
 ###################################################################### Replenishment Policies
 cols = ['facilityname', 'sourcename', 'odepottype', 'ddepottype', 'status']
-rps = replenishmentpolicies[cols].copy()
+rps = replenishmentpolicies[cols]
 
 # Keep only transfers.
-rps = rps[rps['sourcename'].str.startswith('D') & rps['facilityname'].str.startswith('D')].copy()
+rps = rps[has_role(loc_dim, rps['sourcename'], 'Depot') & has_role(loc_dim, rps['facilityname'], 'Depot')]
 
-rps['status'] = 'Include'
+# Set each transfer lane's status from the transfer rules matrix (odepottype x ddepottype).
+# Use the 'Transfer Rules' Excel tab if there is one, otherwise the default rules.
+if 'Transfer Rules' in excel_data:
+    transfer_rules = read_transfer_rules(excel_data['Transfer Rules'])
+else:
+    transfer_rules = default_transfer_rules()
 
-# mfg_lanes
-rps.loc[(rps['odepottype']=='Manufacturing') & 
-        (rps['ddepottype'].isin(['Manufacturing', 'DO NOT USE', 'Distributor Sort', 
-                                 'Renter Sort', 'Repair Only', 'Sort Only'])),
-        'status'] = 'Exclude'
-
-# fsd_lanes
-rps.loc[(rps['odepottype']=='Full Service') & 
-        rps['ddepottype'].isin(['Manufacturing', 'DO NOT USE']),
-        'status'] = 'Exclude'
-
-# srt_lanes
-rps.loc[(rps['odepottype']=='Sort Only') & 
-        rps['ddepottype'].isin(['Manufacturing', 'DO NOT USE', 'Sort Only']),
-        'status'] = 'Exclude'
-
-# sto_lanes
-rps.loc[(rps['odepottype']=='Storage') & 
-        rps['ddepottype'].isin(['Manufacturing', 'DO NOT USE', 
-                                'Distributor Sort', 'Renter Sort', 'Storage']),
-        'status'] = 'Exclude'
-
-# rep_lanes
-rps.loc[(rps['odepottype']=='Repair Only') & 
-        rps['ddepottype'].isin(['Manufacturing', 'DO NOT USE', 'Distributor Sort', 'Renter Sort']),
-        'status'] = 'Exclude'
-
-# dnu_lanes
-rps.loc[rps['odepottype']=='DO NOT USE', 'status'] = 'Exclude'
-
-# drs_lanes
-rps.loc[rps['odepottype'].isin(['Distributor Sort', 'Renter Sort']) & 
-        (rps['ddepottype'] != "Full Service"),
-        'status'] = 'Exclude'
+rps['status'] = apply_transfer_rules(transfer_rules, rps['odepottype'], rps['ddepottype'])
 
 index_cols = ['facilityname', 'sourcename']
 rps.set_index(index_cols, inplace=True)
@@ -1276,16 +1453,13 @@ print('Executing : Renter Distributor Sort Preferred Depot (Alteryx worklfow 110
 cols = ['Ocode', 'Dcode']
 rps = excel_data['RenterDistSort Preferred Depot'][cols]
 
-# Join to facilities and customers to get the model IDs.
-cols = ['facilityname', 'loccode']
-fac = facilities[cols].copy()
-
-rps = rps.merge(fac, how='left', left_on='Ocode', right_on='loccode')
-rps = rps.merge(fac, how='left', left_on='Dcode', right_on='loccode', suffixes=('_O', '_D'))
+# Look up the facility model IDs.
+rps['facilityname_O'] = lookup_model_ids(loc_dim, rps['Ocode'], 'Depot')
+rps['facilityname_D'] = lookup_model_ids(loc_dim, rps['Dcode'], 'Depot')
 
 keep = ['facilityname_O', 'facilityname_D']
-o_d = rps[keep].rename(columns={'facilityname_O':'facilityname', 'facilityname_D':'sourcename'}).copy()
-d_o = rps[keep].rename(columns={'facilityname_O':'sourcename', 'facilityname_D':'facilityname'}).copy()
+o_d = rps[keep].rename(columns={'facilityname_O':'facilityname', 'facilityname_D':'sourcename'})
+d_o = rps[keep].rename(columns={'facilityname_O':'sourcename', 'facilityname_D':'facilityname'})
 rps = pd.concat([o_d, d_o]).drop_duplicates()
 rps['rentdistsortprefassig'] = 'Y'
 
@@ -1314,64 +1488,66 @@ data_to_upload  = {'customerfulfillmentpolicies':customerfulfillmentpolicies,
                    'warehousingpolicies':warehousingpolicies,
                    }
 
-def psql_insert_copy(table, conn, keys, data_iter):
-    """
-    Execute SQL statement inserting data
-
-    Parameters
-    ----------
-    table : pandas.io.sql.SQLTable
-    conn : sqlalchemy.engine.Engine or sqlalchemy.engine.Connection
-    keys : list of str
-        Column names
-    data_iter : Iterable that iterates the values to be inserted
-    """
-    # gets a DBAPI connection that can provide a cursor
-    dbapi_conn = conn.connection
-    with dbapi_conn.cursor() as cur:
-        s_buf = StringIO()
-        writer = csv.writer(s_buf)
-        writer.writerows(data_iter)
-        s_buf.seek(0)
-
-        columns = ', '.join('"{}"'.format(k) for k in keys)
-        if table.schema:
-            table_name = '{}.{}'.format(table.schema, table.name)
-        else:
-            table_name = table.name
-
-        sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(
-            table_name, columns)
-        cur.copy_expert(sql=sql, file=s_buf)
-        
-def replace_data_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAME, data_to_upload):
-    # Note: This syntax is compatible with SQLAlchemy 2.0.
-    print('Connecting to Cosmic Frog to upload data.')
-    
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")     # Ignore the Cosmic Frog API warning.
-    
-        ### Intializing API Connection
-        api = pioneer.Api(auth_legacy=False, un=USER_NAME, appkey=APP_KEY)
-
-        ### Create connection to the model database
-        connection_str = api.sql_connection_info(OUTPUT_DB_NAME)
-        connection_string = connection_str['connectionStrings']['url']
-        engine = sal.create_engine(connection_string)
-        conn = engine.connect()
-
-        for table_name, table in data_to_upload.items():
-            print(f'Deleting all rows from: {table_name}...')
-            with engine.connect() as conn:
-                conn.execute(sal.text(f'delete from {table_name}'))
-                conn.commit()
-            
-            print(f'Uploading data to table: {table_name}...')
-            if 'index' in table.columns:
-                del table['index']
-            table.to_sql(table_name, con=engine, if_exists='append', index=False, method=psql_insert_copy)
-            print('\tDone.')
-    
-replace_data_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAME, data_to_upload)
+# Report the inputs that changed since the previous run.
+if SNAPSHOT_INPUTS:
+    print('Comparing inputs with the previous run...')
+    change_summary = compare_snapshots(previous_snapshot, input_snapshot)
+    change_summary.to_csv(os.path.join(OUTPUT_LOCATION, 'input_change_summary.csv'), index=False)
+    changed_inputs = change_summary.loc[change_summary['changed'], 'input'].tolist()
+    print(f"\t{len(changed_inputs)} of {len(change_summary)} inputs changed: {', '.join(changed_inputs)}\n")
+
+# The tables as computed, for the scalar fast path.
+computed_tables = data_to_upload
+
+# Only upload the tables whose contents changed since the previous run. The other tables in the
+# output model are still the same as after the previous run.
+if UPLOAD_CHANGED_TABLES_ONLY and SCENARIO is None:
+    upload_tables = tables_to_update(previous_snapshot, input_snapshot, data_to_upload)
+    print(f'Uploading the {len(upload_tables)} of {len(data_to_upload)} tables that changed since the previous run.')
+    data_to_upload = {name: table for name, table in data_to_upload.items() if name in upload_tables}
+
+# Fingerprints of the tables last uploaded to each model, for delta uploads.
+upload_fingerprints = read_upload_fingerprints(upload_fingerprints_path)
+
+if SCENARIO is None and UPLOAD_MODE == 'delta':
+    baselines = {db_name: upload_fingerprints.get(db_name, input_fingerprints if db_name == INPUT_DB_NAME else {})
+                 for db_name in OUTPUT_DB_NAMES}
+    uploaded = upload_changes_to_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAMES, data_to_upload, baselines,
+                                             VERIFY_UPLOADS)
+    upload_fingerprints.update(baselines)
+    record_upload(upload_fingerprints, OUTPUT_DB_NAMES, uploaded)
+elif SCENARIO is None:
+    replace_data_in_cosmic_frog(USER_NAME, APP_KEY, OUTPUT_DB_NAMES, data_to_upload, UPLOAD_WORKERS,
+                                UPLOAD_MODE == 'staged', REBUILD_INDEXES, VERIFY_UPLOADS, os.path.join('..', 'data'))
+    record_upload(upload_fingerprints, OUTPUT_DB_NAMES, None)
+elif SCENARIO['output_db_name'] is not None:
+    replace_data_in_cosmic_frog(USER_NAME, APP_KEY, SCENARIO['output_db_name'], data_to_upload,
+                                UPLOAD_WORKERS, UPLOAD_MODE == 'staged', REBUILD_INDEXES, VERIFY_UPLOADS,
+                                os.path.join('..', 'data'))
+    # The record of the scenario's output model is dropped by scenario_sweep.py, once every
+    # scenario is done.
+else:
+    save_scenario_tables(data_to_upload, SCENARIO)
+
+# The record is only kept once a delta upload has been made. Scenario runs leave it as it is.
+if SCENARIO is None and (upload_fingerprints or os.path.exists(upload_fingerprints_path)):
+    save_upload_fingerprints(upload_fingerprints, upload_fingerprints_path)
+
+# Save the inputs' snapshot and the scalar fast path data only once the output model has been
+# updated with them. Without them, the previous run's are removed: they no longer match the output
+# model.
+if SCENARIO is None:
+    if SCALAR_FAST_PATH and INPUT_DB_NAME in OUTPUT_DB_NAMES:
+        # The input model is also an output model: record the tables uploaded to it as they are now.
+        uploaded_columns = input_model_columns(input_snapshot, data_to_upload)
+        if uploaded_columns:
+            record_input_model(input_snapshot, uploaded_columns,
+                               model_checksums(USER_NAME, APP_KEY, INPUT_DB_NAME, uploaded_columns))
+    save_snapshot(input_snapshot, snapshot_path)
+    if SCALAR_FAST_PATH:
+        save_fast_path_data(fast_path_path, computed_tables, scalar_inputs)
+    else:
+        remove_fast_path_data(fast_path_path)
 t1=time.time()
 print(f'DONE! The program took {round((t1-t0)/60)} minutes to complete.')
+peak_memory_ok = check_peak_memory(start_mb, raw_table_mb, MAX_PEAK_MEMORY_MULTIPLE)
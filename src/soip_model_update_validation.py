@@ -24,6 +24,9 @@ if ROOT not in sys.path:
 
 from user_inputs import USER_NAME, APP_KEY, INPUT_DB_NAME, OUTPUT_DB_NAME
 
+# Import the primary keys of the Cosmic Frog tables.
+from cosmic_frog_upload import primary_keys
+
 databases = [INPUT_DB_NAME, OUTPUT_DB_NAME]
 tables_we_want  = ['customerfulfillmentpolicies',
                    'customers',
@@ -99,29 +102,6 @@ for database in databases:
 
 #%% DATA COMPARISON
 
-primary_keys = {'customerfulfillmentpolicies':['customername', 'productname', 'sourcename'],
-                'customers':['customername'],
-                'facilities':['facilityname'],
-                'groups':['groupname', 'grouptype', 'membername'],
-                'inventoryconstraints':['facilityname','facilitynamegroupbehavior','productname',
-                                        'productnamegroupbehavior','periodname',
-                                        'periodnamegroupbehavior','constrainttype',
-                                        'constraintvalueuom', #'constraintvalue',
-                                        'consideredinventory'],
-                'inventorypolicies':['facilityname', 'productname'],
-                'periods':['periodname'],   # NOTE: The model update code doesn't change the Periods table. This is for testing.
-                'productionconstraints':['facilityname','facilitynamegroupbehavior','productname',
-                                         'productnamegroupbehavior','periodname',
-                                         'periodnamegroupbehavior','bomname','bomnamegroupbehavior',
-                                         'processname','processnamegroupbehavior','constrainttype',
-                                         'constraintvalueuom', #'constraintvalue',
-                                         ],
-                'productionpolicies':['facilityname', 'productname', 'bomname', 'processname'],
-                'replenishmentpolicies':['facilityname', 'productname', 'sourcename'],
-                'transportationpolicies':['originname', 'destinationname', 'productname', 'modename'],
-                'warehousingpolicies':['facilityname', 'productname'],
-                   }
-
 # Create a dictionary of tuples containing the dataframes we want to compare.
 paired_tables = dict()
 for table_name in tables_we_want:
@@ -232,4 +232,9 @@ group by case
 			when mtms.TMS_CarrierSCAC in ('AWAW', 'AWSL', 'AWTO', 'CLBC', 'CLPY', 'CPQP', 'GARP', 'GDKP', 'HJBD', 'HJCS', 'JBDD', 'JBTA', 'JDCS', 'JITX', 'PLMQ', 'PPIR', 'SYDW', 'UDLC', 'WPSL') then 'Dedicated' 
 			else 'Other' 
 		end, c.Code, c.[NAV Location Type], b.Code, b.[NAV Location Type], mtms.RL_O_Creation_Date, mtms.RL_O_Delivery_Date, mtms.RL_PL_Date_To, mtms.RL_PL_Date_From, mtms.RL_T_Date_From, mtms.RL_T_Date_To, mtms.TMS_TransActualShip, mtms.TMS_ActualDelivery, mtms.TNumber
-"""
\ No newline at end of file
+"""
+# Same as trans_costs_sql_raw, but only for shipments delivered on or after __START_DATE__
+# ('YYYY-MM-DD'). Used to add new shipments to the lane statistics store (lane_statistics.py).
+trans_costs_incremental_sql_raw = trans_costs_sql_raw.replace(
+    "where DateDiff(month, Cast(mtms.RL_T_Date_To as date), Cast(GetDate() as date)) <= 3 ",
+    "where Cast(mtms.RL_T_Date_To as date) >= '__START_DATE__' ")
@@ -0,0 +1,213 @@
+# =============================================================================
+# The purpose of this script is to let some of the relational transformation stages run on either
+# pandas (the default) or an embedded, in-process DuckDB database.
+#
+# The stages are:
+#     '020' : Closest depot ranking (Lane Attributes, Alteryx workflow 020).
+#     '060' : Average cost per load and top carrier of each lane (Transportation Rates Historical,
+#             Alteryx workflow 060).
+#     '090' : Multi-source option flags (Flag Multi-Source Options, Alteryx workflow 090).
+#
+# Each stage has a pandas function and a DuckDB function with the same arguments and the same
+# result. The DuckDB functions run SQL directly over the pandas DataFrames (DuckDB reads them in
+# place, without copying them into a database) and use all CPU cores.
+#
+# The backend of each stage is chosen with STAGE_BACKENDS in user_inputs.py. DuckDB is optional:
+# if it is not installed (pip install duckdb), the pandas functions are used. The two backends can
+# be compared with benchmark_stage_backends.py.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+from depot_ranking import rank_nearest_depots
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKENDS = ['pandas', 'duckdb']
+
+
+def closest_depot_ranks_duckdb(df, group_col, depot_col, depottype_col, eligible, k=1):
+# =============================================================================
+#     DuckDB version of depot_ranking.rank_nearest_depots(), with the same arguments and result:
+#     the rank (1 = closest) of each row of df within its group, and NaN for rows that are not
+#     eligible or not in the k nearest.
+# =============================================================================
+    lanes = pd.DataFrame({'row': np.arange(len(df)),
+                          'grp': df[group_col].astype(object).to_numpy(),
+                          'depot': df[depot_col].astype(object).to_numpy(),
+                          'depottype': df[depottype_col].astype(object).to_numpy(),
+                          'distance': df['distance'].astype(float).to_numpy(),
+                          'eligible': np.asarray(eligible, dtype=bool)})
+
+    # Like rank_nearest_depots(): only the first row of a repeated lane is ranked, empty distances
+    # are ranked last, and distance ties are broken on depot type, then depot name.
+    sql = f"""
+        select row, rank
+        from (select row,
+                     row_number() over (partition by grp
+                                        order by coalesce(distance, 'inf'::double),
+                                                 depottype nulls first, depot nulls first) as rank
+              from (select min(row) as row, grp, depot,
+                           first(depottype order by row) as depottype,
+                           first(distance order by row) as distance
+                    from lanes
+                    where eligible and grp is not null
+                    group by grp, depot))
+        where rank <= {int(k)}
+        """
+    ranked = duckdb.sql(sql).df()
+
+    ranks = np.full(len(df), np.nan)
+    ranks[ranked['row'].to_numpy(int)] = ranked['rank'].to_numpy(float)
+    return ranks
+
+
+def cost_per_load_pandas(shp_hist):
+# =============================================================================
+#     Returns the average cost per load of each lane (movetype, Lane_ID) over all carriers, with
+#     the lane's top carrier (SCAC, Carrier_Type with the most loads, ties going to the first
+#     SCAC).
+#
+#     shp_hist has one row per lane and carrier, with the Total_Loads and Ttl_LH_Cost columns.
+# =============================================================================
+    groupby_cols = ['movetype', 'Lane_ID']
+    shp_cst_per_load_avg = shp_hist.groupby(groupby_cols)[['Total_Loads', 'Ttl_LH_Cost']].sum().reset_index()
+
+    groupby_cols = ['movetype', 'Lane_ID', 'SCAC', 'Carrier_Type']
+    shp_top_carrier = shp_hist.groupby(groupby_cols)[['Total_Loads']].sum().reset_index()
+    shp_top_carrier = shp_top_carrier.sort_values(['Total_Loads', 'SCAC'], ascending=[False, True]).groupby(['movetype', 'Lane_ID']).first().reset_index()
+
+    merge_cols = ['movetype', 'Lane_ID']
+    shp_hist_final = shp_cst_per_load_avg.merge(shp_top_carrier, how='inner', on=merge_cols,
+                                                suffixes=('', '_carrier_max'))
+    shp_hist_final['CostPerLoadAvg'] = shp_hist_final['Ttl_LH_Cost']/shp_hist_final['Total_Loads']
+
+    cols_to_keep = ['movetype','Lane_ID','SCAC','Carrier_Type','CostPerLoadAvg']
+    return shp_hist_final[cols_to_keep]
+
+
+def cost_per_load_duckdb(shp_hist):
+# =============================================================================
+#     DuckDB version of cost_per_load_pandas(), with the same argument and result.
+# =============================================================================
+    # Sums use compensated (Kahan) summation, like pandas' groupby sums.
+    sql = """
+        with lanes as (
+            select movetype, Lane_ID,
+                   fsum(Total_Loads::double) as Total_Loads,
+                   fsum(Ttl_LH_Cost::double) as Ttl_LH_Cost
+            from shp_hist
+            where movetype is not null and Lane_ID is not null
+            group by movetype, Lane_ID),
+        carriers as (
+            select movetype, Lane_ID, SCAC, Carrier_Type,
+                   fsum(Total_Loads::double) as Total_Loads
+            from shp_hist
+            where movetype is not null and Lane_ID is not null and SCAC is not null
+                  and Carrier_Type is not null
+            group by movetype, Lane_ID, SCAC, Carrier_Type),
+        top_carrier as (
+            select movetype, Lane_ID, SCAC, Carrier_Type
+            from carriers
+            qualify row_number() over (partition by movetype, Lane_ID
+                                       order by Total_Loads desc, SCAC, Carrier_Type) = 1)
+        select l.movetype, l.Lane_ID, t.SCAC, t.Carrier_Type,
+               l.Ttl_LH_Cost / l.Total_Loads as CostPerLoadAvg
+        from lanes l
+        join top_carrier t on l.movetype = t.movetype and l.Lane_ID = t.Lane_ID
+        order by l.movetype, l.Lane_ID
+        """
+    shp_hist = shp_hist.reset_index(drop=True)
+    return duckdb.sql(sql).df()
+
+
+def multi_source_flags_pandas(policies, origin_col, destination_col, msl, movetype):
+# =============================================================================
+#     Returns the multi_source_option flag of each policy lane (origin_col -> destination_col).
+#
+#     For issues, the customers (destinations) in the MultiSource List are flagged: 'Y' on their
+#     lanes that are in the list, and 'N' on their other lanes. For returns, the return locations
+#     (origins) are flagged the same way. Other lanes get None.
+#
+#     Returns a DataFrame with origin_col, destination_col and multi_source_option.
+# =============================================================================
+    member_col, msl_col = ((destination_col, 'DModelID') if movetype == 'Issue'
+                           else (origin_col, 'OModelID'))
+
+    df = policies[[origin_col, destination_col]]
+
+    members = msl.loc[msl['MoveType']==movetype, msl_col].drop_duplicates().to_frame('member')
+    df = df.merge(members, how='left', left_on=member_col, right_on='member')
+    cols = ['OModelID', 'DModelID']
+    df = df.merge(msl[cols], how='left', left_on=[origin_col, destination_col], right_on=cols)
+
+    cond_N = df['member'].notna() & df['OModelID'].isna()
+    cond_Y = df['member'].notna() & df['OModelID'].notna()
+
+    df['multi_source_option'] = np.select([cond_N, cond_Y], ['N', 'Y'], default=None)
+    return df[[origin_col, destination_col, 'multi_source_option']]
+
+
+def multi_source_flags_duckdb(policies, origin_col, destination_col, msl, movetype):
+# =============================================================================
+#     DuckDB version of multi_source_flags_pandas(), with the same arguments and result.
+# =============================================================================
+    member_col, msl_col = ((destination_col, 'DModelID') if movetype == 'Issue'
+                           else (origin_col, 'OModelID'))
+
+    lanes = pd.DataFrame({'row': np.arange(len(policies)),
+                          'o': policies[origin_col].astype(object).to_numpy(),
+                          'd': policies[destination_col].astype(object).to_numpy(),
+                          'member': policies[member_col].astype(object).to_numpy()})
+    msl = pd.DataFrame({'movetype': msl['MoveType'].astype(object).to_numpy(),
+                        'o': msl['OModelID'].astype(object).to_numpy(),
+                        'd': msl['DModelID'].astype(object).to_numpy(),
+                        'member': msl[msl_col].astype(object).to_numpy()})
+
+    sql = f"""
+        select l.row,
+               case when m.member is null then null
+                    when s.o is null then 'N'
+                    else 'Y' end as multi_source_option
+        from lanes l
+        left join (select distinct member from msl where movetype = '{movetype}') m
+               on l.member = m.member
+        left join (select distinct o, d from msl) s
+               on l.o = s.o and l.d = s.d
+        order by l.row
+        """
+    flags = duckdb.sql(sql).df()
+
+    df = policies[[origin_col, destination_col]].reset_index(drop=True)
+    df['multi_source_option'] = flags['multi_source_option'].astype(object).where(
+        flags['multi_source_option'].notna(), None).to_numpy()
+    return df
+
+
+STAGES = {'020': {'pandas': rank_nearest_depots, 'duckdb': closest_depot_ranks_duckdb},
+          '060': {'pandas': cost_per_load_pandas, 'duckdb': cost_per_load_duckdb},
+          '090': {'pandas': multi_source_flags_pandas, 'duckdb': multi_source_flags_duckdb},
+          }
+
+
+def stage_function(stage, stage_backends):
+# =============================================================================
+#     Returns the function that runs stage ('020', '060' or '090') with the backend chosen in
+#     stage_backends (e.g. {'060': 'duckdb'}). Stages that are not in stage_backends use pandas.
+#
+#     Falls back to pandas, with a message, if DuckDB is chosen but not installed. Raises a
+#     ValueError for an unknown backend.
+# =============================================================================
+    backend = stage_backends.get(stage, 'pandas')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}' for stage {stage}. Use one of {BACKENDS}.")
+
+    if backend == 'duckdb' and duckdb is None:
+        print(f'\tDuckDB is not installed, running stage {stage} with pandas.')
+        backend = 'pandas'
+
+    return STAGES[stage][backend]
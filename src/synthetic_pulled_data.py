@@ -0,0 +1,321 @@
+# =============================================================================
+# The purpose of this script is to make a small synthetic pulled data file, shaped like the one
+# soip_model_update_process.py saves with '--pull-only' (the Excel sheets, the data warehouse
+# tables and the Cosmic Frog tables), so the whole update can be run without real data, e.g. by
+# check_peak_memory.py.
+#
+# The synthetic model has customers (I_), return locations (R_), depots (D_) and one manufacturing
+# facility (M_), named from 5-digit location codes like the real model. Every customer and return
+# location has a lane to every depot, and every depot a transfer lane to every other depot, with a
+# forecast, shipment history and load sizes for some of them. The values are random but follow the
+# rules the update relies on (e.g. each baseline lane is in the Depot Assignments sheet).
+#
+# Run it from the src folder:
+#     python synthetic_pulled_data.py <pulled data file> [number of customers, default 1000]
+# =============================================================================
+
+import sys
+
+import pandas as pd
+import numpy as np
+
+from scenario_sweep import save_pulled_data
+from user_inputs import RepairCapacityNotes, MinInventoryNotes, DepotCapacityNotes, \
+    BeginningInvNotes, ReturnsProductionNotes, ProductionPolicyRepairBOMName
+
+PERIODS = [f'P{i:02d}' for i in range(1, 19)]
+PRODUCTS = ['RFU', 'MIX']
+DEPOT_TYPES = np.array(['Full Service', 'Full Service', 'Sort Only', 'Storage'], dtype=object)
+SCACS = pd.DataFrame({'TMS_CarrierSCAC': ['CPUX', 'DEDX', 'CC01', 'CC02', 'CC03'],
+                      'TMS_CarrierName': ['Pickup', 'Dedicated', 'Carrier 1', 'Carrier 2', 'Carrier 3'],
+                      'Carrier_Type': ['CPU', 'Dedicated', None, None, None]})
+
+
+def synthetic_locations(n, prefix, first_code, rng):
+# =============================================================================
+#     Returns n locations (model ID, loccode and location attributes) whose model IDs start with
+#     prefix, e.g. 'I_'.
+# =============================================================================
+    loccodes = np.array([f'{first_code + i:05d}' for i in range(n)], dtype=object)
+    country = np.where(rng.random(n) < 0.9, 'USA', 'CAN').astype(object)
+    return pd.DataFrame({'modelid': prefix + loccodes,
+                         'loccode': loccodes,
+                         'country': country,
+                         'georegion': np.array(['East', 'Central', 'West'], dtype=object)[rng.integers(0, 3, n)],
+                         'pecoregion': np.array(['R1', 'R2', 'R3', 'R4'], dtype=object)[rng.integers(0, 4, n)],
+                         'pecosubregion': np.array(['S1', 'S2', 'S3'], dtype=object)[rng.integers(0, 3, n)],
+                         'zone': np.array(['Z1', 'Z2', 'Z3', 'Z4', 'Z5'], dtype=object)[rng.integers(0, 5, n)],
+                         'latitude': np.where(country=='USA', rng.uniform(26, 48, n), rng.uniform(43, 53, n)),
+                         'longitude': rng.uniform(-122, -70, n)})
+
+
+def all_to_all(origins, destinations):
+# =============================================================================
+#     Returns every (origin, destination) pair of two arrays of model IDs, as two arrays.
+# =============================================================================
+    return np.repeat(origins, len(destinations)), np.tile(destinations, len(origins))
+
+
+def synthetic_excel_data(cus, ret, dep, mfg, baseline_issues, baseline_returns, rng):
+# =============================================================================
+#     Returns the Excel sheets (sheet name -> DataFrame) for the synthetic locations.
+# =============================================================================
+    n = len(dep)
+    depot_assumptions = pd.DataFrame({
+        'ModelID': dep['modelid'], 'LocCode': dep['loccode'], 'Loc Description': 'Depot ' + dep['loccode'],
+        'Type': DEPOT_TYPES[np.arange(n) % len(DEPOT_TYPES)],
+        'Closed': np.where(rng.random(n) < 0.1, 'YES', 'NO'),
+        'Paint Upd': rng.uniform(0, 2, n), 'Heat Treat': np.where(rng.random(n) < 0.5, 'Y', None),
+        'Fixed Upd': rng.uniform(0, 1e6, n), 'Minimum Inv': rng.integers(0, 1000, n),
+        'Storage': rng.integers(1000, 50000, n), 'Yard Space': rng.integers(0, 10000, n),
+        'Temp Storage': rng.integers(0, 5000, n), 'DmgRate': rng.uniform(0, 0.3, n),
+        'BegInv_RFU': rng.integers(0, 20000, n), 'BegInv_WIP': rng.integers(0, 5000, n),
+        'BegInv_MIX': rng.integers(0, 20000, n), 'Repair / Day': rng.integers(0, 2000, n),
+        'Repair Upd': rng.uniform(1, 5, n), 'Handling In Upd': rng.uniform(0, 1, n),
+        'Handling Out Upd': rng.uniform(0, 1, n), 'Sort Upd': rng.uniform(0, 0.5, n)})
+
+    npd = cus.sample(frac=0.2, random_state=0)
+    renter_assumptions = pd.DataFrame({'Loc Code': npd['loccode'], 'ModelID': npd['modelid'],
+                                       'Loc Desc': 'Renter ' + npd['loccode'],
+                                       'NPD %': rng.uniform(0, 0.2, len(npd))})
+
+    listed_issues = baseline_issues.sample(frac=0.05, random_state=0)
+    listed_returns = baseline_returns.sample(frac=0.05, random_state=0)
+    multi_source = pd.DataFrame({
+        'MoveType': ['Issue']*len(listed_issues) + ['Return']*len(listed_returns),
+        'CustomerCode': np.concatenate([listed_issues['customername'].str[2:], listed_returns['sourcename'].str[2:]]),
+        'DepotCode': np.concatenate([listed_issues['sourcename'].str[2:], listed_returns['facilityname'].str[2:]]),
+        'OK to Include SOIP': np.where(rng.random(len(listed_issues) + len(listed_returns)) < 0.8, 'YES', 'NO')})
+
+    preferred = dep.sample(n=min(6, n), random_state=0)['loccode'].to_numpy()
+    rds = pd.DataFrame({'Ocode': preferred[:len(preferred)//2], 'Dcode': preferred[len(preferred)//2:]})
+
+    assignments = pd.DataFrame({
+        'MoveType': ['Issue']*len(baseline_issues) + ['Return']*len(baseline_returns),
+        'Oname': np.concatenate([baseline_issues['customername'], baseline_returns['sourcename']]),
+        'RevisedDName': np.concatenate([baseline_issues['sourcename'], baseline_returns['facilityname']])})
+    assignments['Loc Code'] = assignments['Oname'].str[2:]
+
+    lanes = pd.concat([baseline_issues.rename(columns={'sourcename': 'o', 'customername': 'd'}),
+                       baseline_returns.rename(columns={'sourcename': 'o', 'facilityname': 'd'})])
+    rfq = lanes.sample(frac=0.3, random_state=0)
+    rfq_rates = pd.DataFrame({'Lane Name': rfq['o'].str[2:] + '-' + rfq['d'].str[2:],
+                              'Final Rate Award': rng.uniform(200, 3000, len(rfq))})
+
+    return {'Depot Assumptions': depot_assumptions,
+            'Renter Assumptions': renter_assumptions,
+            'MultiSource List': multi_source,
+            'RenterDistSort Preferred Depot': rds,
+            'Depot Assignments': assignments,
+            'SCAC Types': SCACS.copy(),
+            'Trans RFQ Rates': rfq_rates}
+
+
+def synthetic_data_warehouse_data(cus, ret, dep, issue_lanes, return_lanes, transfer_lanes, rng):
+# =============================================================================
+#     Returns the data warehouse tables (query name -> DataFrame) for the synthetic locations and
+#     the lanes with shipments.
+# =============================================================================
+    locations = pd.concat([cus.assign(t='Renter'), ret.assign(t='Distributor'), dep.assign(t='Depot')])
+    corp = rng.integers(0, 200, len(locations))
+    tbl_tab_location = pd.DataFrame({'Code': locations['loccode'].to_numpy(),
+                                     'Corporate Code': [f'C{i:04d}' for i in corp],
+                                     'Corporate Name': [f'Corporation {i}' for i in corp],
+                                     'RL Location Type': locations['t'].to_numpy()})
+
+    served = pd.concat([cus.sample(frac=0.5, random_state=1).assign(movetype='Issue'),
+                        ret.sample(frac=0.5, random_state=1).assign(movetype='Return')])
+    nbr_of_depots = pd.DataFrame({'movetype': served['movetype'].to_numpy(),
+                                  'customer': served['loccode'].to_numpy(),
+                                  'number_of_depots': rng.integers(1, 4, len(served))})
+
+    # Shipment history: Issues from a depot to a customer, Returns from a return location to a
+    # depot, and Transfers between depots (with no Depot or Customer).
+    lanes = pd.concat([
+        pd.DataFrame({'movetype': 'Issue', 'o': issue_lanes['sourcename'].str[2:],
+                      'd': issue_lanes['customername'].str[2:]}).assign(Depot=lambda df: df['o'], Customer=lambda df: df['d']),
+        pd.DataFrame({'movetype': 'Return', 'o': return_lanes['sourcename'].str[2:],
+                      'd': return_lanes['facilityname'].str[2:]}).assign(Depot=lambda df: df['d'], Customer=lambda df: df['o']),
+        pd.DataFrame({'movetype': 'Transfer', 'o': transfer_lanes['sourcename'].str[2:],
+                      'd': transfer_lanes['facilityname'].str[2:], 'Depot': '', 'Customer': ''})],
+        ignore_index=True)
+    lanes['Lane_ID'] = lanes['o'] + '-' + lanes['d']
+
+    n = len(lanes)
+    loads = rng.integers(0, 30, (n, 3))
+    load_counts = lanes.drop(columns=['o', 'd']).assign(
+        origin_Name='Location ' + lanes['o'], Destination_Name='Location ' + lanes['d'],
+        CPU_Loads=loads[:, 0] * (rng.random(n) < 0.2), Dedicated_Loads=loads[:, 1] * (rng.random(n) < 0.2),
+        Other_Loads=loads[:, 2])
+    load_counts['Split_Carrier_Type_Flag'] = np.where(
+        (load_counts[['CPU_Loads', 'Dedicated_Loads', 'Other_Loads']] > 0).sum(axis=1) > 1, 'Split', 'Single')
+
+    # Shipment costs, per lane, carrier and delivery date in the last three months.
+    costs = lanes.loc[np.repeat(np.arange(n), 3)].reset_index(drop=True)
+    scac = rng.integers(0, len(SCACS), len(costs))
+    costs['SCAC'] = SCACS['TMS_CarrierSCAC'].to_numpy()[scac]
+    costs['Carrier_Type'] = SCACS['Carrier_Type'].fillna('Contract Carrier').to_numpy()[scac]
+    costs['Total_Loads'] = rng.integers(1, 40, len(costs))
+    costs['Ttl_LH_Cost'] = costs['Total_Loads'] * rng.uniform(50, 3000, len(costs))
+    costs['RL_T_Date_To'] = pd.Timestamp.today().normalize() - pd.to_timedelta(rng.integers(0, 90, len(costs)), unit='D')
+    costs.drop(columns=['o', 'd'], inplace=True)
+
+    sized = pd.concat([cus.sample(frac=0.7, random_state=2).assign(movetype='Issue'),
+                       ret.sample(frac=0.7, random_state=2).assign(movetype='Return')])
+    load_size = pd.DataFrame({'movetype': sized['movetype'].to_numpy(),
+                              'customer_Loc_Code': sized['loccode'].to_numpy(),
+                              'Load_Count': rng.integers(1, 100, len(sized)),
+                              'Average_Cube': rng.uniform(300, 600, len(sized))})
+
+    return {'tbl_tab_Location': tbl_tab_location,
+            'nbr_of_depots': nbr_of_depots,
+            'transport_rates_hist_load_counts': load_counts,
+            'transport_rates_hist_costs': costs,
+            'transport_load_size': load_size}
+
+
+def synthetic_cosmic_frog_data(cus, ret, dep, mfg, issue_lanes, return_lanes, transfer_lanes, rng):
+# =============================================================================
+#     Returns the Cosmic Frog tables (table name -> DataFrame) for the synthetic locations and
+#     lanes.
+# =============================================================================
+    attributes = ['country', 'georegion', 'pecoregion', 'pecosubregion', 'zone', 'latitude', 'longitude']
+
+    customers = cus.rename(columns={'modelid': 'customername'})[['customername', 'loccode'] + attributes]
+    customers = customers.assign(status='Include', insoip='Y', avgloadsz=np.nan, corpcode=None,
+                                 corpname=None, soipquantity=0.0, issueqty=0.0)
+
+    fac = pd.concat([ret.assign(depottype=None), dep.assign(depottype=DEPOT_TYPES[np.arange(len(dep)) % len(DEPOT_TYPES)]),
+                     mfg.assign(depottype='Manufacturing')], ignore_index=True)
+    facilities = fac.rename(columns={'modelid': 'facilityname'})[['facilityname', 'loccode', 'depottype'] + attributes]
+    facilities = facilities.assign(status='Include', insoipmodel='Y', closed='NO', heat_treatment_rqmt='N',
+                                   fixedstartupcost=0.0, fixedclosingcost=0.0, fixedoperatingcost=0.0,
+                                   corpcode=None, corpname=None, returnqty=0.0, avgloadsz=np.nan)
+
+    n_periods = len(PERIODS)
+    demand = cus.sample(frac=0.8, random_state=3)['modelid'].to_numpy()
+    customerdemand = pd.DataFrame({'customername': np.repeat(demand, n_periods),
+                                   'productname': 'RFU',
+                                   'periodname': np.tile(PERIODS, len(demand)),
+                                   'quantity': rng.integers(0, 500, len(demand)*n_periods).astype(float)})
+
+    # Lane distances, with some missing (filled in from the coordinates by the update).
+    def lane_columns(lanes):
+        n = len(lanes)
+        return lanes.assign(productname='RFU', soipplan='N', soip_depot_id=None, status='Exclude',
+                            distance=np.where(rng.random(n) < 0.05, np.nan, rng.uniform(5, 2500, n)),
+                            greenfieldcandidate=np.where(rng.random(n) < 0.7, 'Y', 'N'), cpudedicated=None,
+                            depotrank=np.nan, closestdepot='N', addtomodel='N', multi_source_option=None,
+                            mileageband=None, monthlypalletband=None, nbrdepotsband=None)
+
+    cfp = lane_columns(issue_lanes)
+    cfp['depottype'] = facilities.set_index('facilityname')['depottype'].reindex(cfp['sourcename']).to_numpy()
+    cfp['notes'] = 'NewAllToAll_Issues'
+    cfp['unitcost'] = 0.0
+    npd = pd.DataFrame({'customername': cus['modelid'], 'sourcename': mfg['modelid'].iloc[0],
+                        'depottype': 'Manufacturing', 'notes': 'NPD'})
+    customerfulfillmentpolicies = pd.concat([cfp, lane_columns(npd).assign(unitcost=0.0)], ignore_index=True)
+
+    rps = lane_columns(pd.concat([return_lanes, transfer_lanes], ignore_index=True))
+    rps['notes'] = np.where(rps['sourcename'].str.startswith('R_'), 'NewAllToAll_Returns', 'Transfers')
+    depottype = facilities.set_index('facilityname')['depottype']
+    rps['odepottype'] = depottype.reindex(rps['sourcename']).to_numpy()
+    rps['ddepottype'] = depottype.reindex(rps['facilityname']).to_numpy()
+    rps['rentdistsortprefassig'] = 'N'
+    replenishmentpolicies = rps
+
+    lanes = pd.concat([issue_lanes.rename(columns={'sourcename': 'originname', 'customername': 'destinationname'}),
+                       return_lanes.rename(columns={'sourcename': 'originname', 'facilityname': 'destinationname'}),
+                       transfer_lanes.rename(columns={'sourcename': 'originname', 'facilityname': 'destinationname'})],
+                      ignore_index=True)
+    n = len(lanes)
+    transportationpolicies = lanes.assign(productname='RFU', modename='TL', ocountry=None, dcountry=None,
+                                          oloccode=None, dloccode=None, histrate=np.nan,
+                                          marketrate=rng.uniform(300, 4000, n), rateused=None, fixedcost=np.nan,
+                                          scac=None, scaccarriertype=None, cpu=None, unitcost=np.nan,
+                                          dutyrate=np.nan, averageshipmentsize=np.nan)
+
+    depots = dep['modelid'].to_numpy()
+    returners = ret['modelid'].to_numpy()
+    inventoryconstraints = pd.DataFrame({
+        'facilityname': np.tile(depots, 2),
+        'notes': np.repeat([MinInventoryNotes, DepotCapacityNotes], len(depots)),
+        'constrainttype': np.repeat(['Min', 'Max'], len(depots)),
+        'productname': 'ALL', 'periodname': 'ALL', 'constraintvalue': 0.0})
+    inventorypolicies = pd.DataFrame({'facilityname': np.repeat(depots, len(PRODUCTS)),
+                                      'productname': np.tile(PRODUCTS, len(depots)),
+                                      'notes': BeginningInvNotes, 'initialinventory': 0.0})
+    periods = pd.DataFrame({'periodname': PERIODS, 'workingdays': rng.integers(19, 23, n_periods)})
+    productionconstraints = pd.DataFrame({
+        'facilityname': np.concatenate([np.repeat(depots, n_periods), np.repeat(returners, n_periods)]),
+        'periodname': np.tile(PERIODS, len(depots) + len(returners)),
+        'notes': [RepairCapacityNotes]*(len(depots)*n_periods) + [ReturnsProductionNotes]*(len(returners)*n_periods),
+        'productname': 'RFU', 'constraintvalue': rng.integers(0, 800, (len(depots) + len(returners))*n_periods).astype(float)})
+    productionpolicies = pd.DataFrame({'facilityname': depots, 'productname': 'RFU',
+                                       'bomname': ProductionPolicyRepairBOMName, 'processname': 'Repair',
+                                       'unitcost': 0.0})
+    groups = pd.DataFrame({'membername': np.concatenate([returners[:10], cus['modelid'].to_numpy()[:10], depots]),
+                           'groupname': ['SplitSource_Distributor_KeepSingleSource']*min(10, len(returners)) +
+                                        ['SplitSource_Renter_KeepSingleSource']*min(10, len(cus)) +
+                                        ['AllDepots']*len(depots),
+                           'grouptype': ['Facilities']*min(10, len(returners)) + ['Customers']*min(10, len(cus)) +
+                                        ['Facilities']*len(depots)})
+    warehousingpolicies = pd.DataFrame({'facilityname': depots, 'productname': 'RFU',
+                                        'inboundhandlingcost': 0.0, 'outboundhandlingcost': 0.0})
+
+    return {'customerdemand': customerdemand,
+            'customerfulfillmentpolicies': customerfulfillmentpolicies,
+            'customers': customers,
+            'facilities': facilities,
+            'groups': groups,
+            'inventoryconstraints': inventoryconstraints,
+            'inventorypolicies': inventorypolicies,
+            'periods': periods,
+            'productionconstraints': productionconstraints,
+            'productionpolicies': productionpolicies,
+            'replenishmentpolicies': replenishmentpolicies,
+            'transportationpolicies': transportationpolicies,
+            'warehousingpolicies': warehousingpolicies}
+
+
+def synthetic_pulled_data(n_customers=1000, seed=0):
+# =============================================================================
+#     Returns synthetic excel_data, data_warehouse_data and cosmic_frog_data for n_customers
+#     customers, n_customers/4 return locations and n_customers/40 depots (at least 10).
+# =============================================================================
+    rng = np.random.default_rng(seed)
+    cus = synthetic_locations(n_customers, 'I_', 10000, rng)
+    ret = synthetic_locations(max(1, n_customers//4), 'R_', 40000, rng)
+    dep = synthetic_locations(max(10, n_customers//40), 'D_', 70000, rng)
+    mfg = synthetic_locations(1, 'M_', 90000, rng)
+
+    # Issue and return lanes from every customer / return location to every depot, and transfer
+    # lanes between every pair of depots.
+    depots = dep['modelid'].to_numpy()
+    c, d = all_to_all(cus['modelid'].to_numpy(), depots)
+    issue_lanes = pd.DataFrame({'customername': c, 'sourcename': d})
+    r, d = all_to_all(ret['modelid'].to_numpy(), depots)
+    return_lanes = pd.DataFrame({'sourcename': r, 'facilityname': d})
+    o, d = all_to_all(depots, depots)
+    transfer_lanes = pd.DataFrame({'sourcename': o, 'facilityname': d})[o != d].reset_index(drop=True)
+
+    # One baseline depot per customer and return location.
+    baseline_issues = issue_lanes.groupby('customername').sample(n=1, random_state=seed)
+    baseline_returns = return_lanes.groupby('sourcename').sample(n=1, random_state=seed)
+
+    excel_data = synthetic_excel_data(cus, ret, dep, mfg, baseline_issues, baseline_returns, rng)
+    data_warehouse_data = synthetic_data_warehouse_data(
+        cus, ret, dep, issue_lanes.sample(frac=0.05, random_state=seed),
+        return_lanes.sample(frac=0.05, random_state=seed), transfer_lanes.sample(frac=0.2, random_state=seed), rng)
+    cosmic_frog_data = synthetic_cosmic_frog_data(cus, ret, dep, mfg, issue_lanes, return_lanes,
+                                                  transfer_lanes, rng)
+    return excel_data, data_warehouse_data, cosmic_frog_data
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('Usage: python synthetic_pulled_data.py <pulled data file> [number of customers]')
+
+    n_customers = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    save_pulled_data(sys.argv[1], *synthetic_pulled_data(n_customers))
+    print(f'Saved synthetic pulled data for {n_customers:,} customers to {sys.argv[1]}')
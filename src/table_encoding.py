@@ -0,0 +1,69 @@
+# =============================================================================
+# The purpose of this script is to reduce the memory footprint of the Cosmic Frog tables while the
+# model update runs.
+#
+# Names like customername, facilityname, sourcename and periodname repeat across millions of cells
+# and are stored by pandas as one Python string object per cell. Here those columns are converted
+# to pandas categoricals that all share ONE vocabulary (a single CategoricalDtype built from every
+# table). Because the dtype is shared, merges between two encoded columns are integer joins on the
+# category codes instead of string hash joins. Integer columns are downcast to the smallest
+# integer type that holds their values.
+# =============================================================================
+
+import pandas as pd
+
+# Columns that hold repeated names and labels. These are encoded against the shared vocabulary
+# wherever they appear in a table.
+ENCODED_COLUMNS = ['customername', 'facilityname', 'sourcename', 'originname', 'destinationname',
+                   'membername', 'periodname', 'productname', 'notes', 'depottype', 'odepottype',
+                   'ddepottype']
+
+
+def build_shared_vocabulary(data_dict, columns=ENCODED_COLUMNS, extra_values=()):
+# =============================================================================
+#     Collects the distinct values of the encoded columns across every table in data_dict, plus
+#     any extra_values, and returns them as one CategoricalDtype.
+#
+#     The categories are sorted so that sorting an encoded column gives the same order as sorting
+#     the original strings.
+#
+#     extra_values should contain any labels that the update process assigns into an encoded
+#     column with .loc (i.e. values that are not in the pulled data yet). Pandas does not allow
+#     setting a value that is not already a category.
+# =============================================================================
+    values = set(extra_values)
+    for df in data_dict.values():
+        for col in columns:
+            if col in df.columns:
+                values.update(df[col].dropna().unique())
+
+    return pd.CategoricalDtype(sorted(values))
+
+
+def compact_tables(data_dict, columns=ENCODED_COLUMNS, extra_values=()):
+# =============================================================================
+#     Encodes the repeated string columns of every table in data_dict against one shared
+#     vocabulary, and downcasts integer columns. The tables are changed in place.
+#
+#     Float columns are left as float64. Writing float32 values back to Cosmic Frog would change
+#     the uploaded text (e.g. 0.1 becomes 0.10000000149011612).
+#
+#     Returns the shared CategoricalDtype.
+# =============================================================================
+    vocabulary = build_shared_vocabulary(data_dict, columns, extra_values)
+
+    for df in data_dict.values():
+        for col in df.columns:
+            if col in columns:
+                df[col] = df[col].astype(vocabulary)
+            elif pd.api.types.is_integer_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    return vocabulary
+
+
+def table_memory_mb(data_dict):
+# =============================================================================
+#     Returns the total deep memory usage of all tables in data_dict, in megabytes.
+# =============================================================================
+    return sum(df.memory_usage(deep=True).sum() for df in data_dict.values()) / 2**20
@@ -0,0 +1,92 @@
+# =============================================================================
+# The purpose of this script is to hold the depot-to-depot transfer rules used by the Transfer
+# Matrix Update (Alteryx workflow 100) as one compatibility matrix.
+#
+# The matrix has one row per origin depot type (odepottype) and one column per destination depot
+# type (ddepottype). Each cell says if a transfer lane between the two types is 'Include' or
+# 'Exclude'. Depot types that are not in the matrix (or are empty) use the 'Other' row / column.
+#
+# By default the rules below are used. They can be changed without code by adding a
+# 'Transfer Rules' tab to the SOIP Optimization Assumptions workbook, laid out like the matrix:
+# an 'Origin Depot Type' column, then one column per destination depot type.
+# =============================================================================
+
+import pandas as pd
+import numpy as np
+
+OTHER = 'Other'
+
+# Destination depot types each origin depot type can NOT transfer to. Origin types that are not
+# listed can transfer to every depot type.
+DEFAULT_EXCLUDED_DESTINATIONS = {
+    'Manufacturing'    : ['Manufacturing', 'DO NOT USE', 'Distributor Sort', 'Renter Sort',
+                          'Repair Only', 'Sort Only'],
+    'Full Service'     : ['Manufacturing', 'DO NOT USE'],
+    'Sort Only'        : ['Manufacturing', 'DO NOT USE', 'Sort Only'],
+    'Storage'          : ['Manufacturing', 'DO NOT USE', 'Distributor Sort', 'Renter Sort', 'Storage'],
+    'Repair Only'      : ['Manufacturing', 'DO NOT USE', 'Distributor Sort', 'Renter Sort'],
+    'DO NOT USE'       : ['Manufacturing', 'Full Service', 'Sort Only', 'Storage', 'Repair Only',
+                          'DO NOT USE', 'Distributor Sort', 'Renter Sort', OTHER],
+    'Distributor Sort' : ['Manufacturing', 'Sort Only', 'Storage', 'Repair Only', 'DO NOT USE',
+                          'Distributor Sort', 'Renter Sort', OTHER],
+    'Renter Sort'      : ['Manufacturing', 'Sort Only', 'Storage', 'Repair Only', 'DO NOT USE',
+                          'Distributor Sort', 'Renter Sort', OTHER],
+    }
+
+DEPOT_TYPES = ['Manufacturing', 'Full Service', 'Sort Only', 'Storage', 'Repair Only',
+               'DO NOT USE', 'Distributor Sort', 'Renter Sort', OTHER]
+
+
+def default_transfer_rules():
+# =============================================================================
+#     Returns the default transfer rules as a matrix (DataFrame of 'Include' / 'Exclude', indexed
+#     by origin depot type, with one column per destination depot type).
+# =============================================================================
+    rules = pd.DataFrame('Include', index=pd.Index(DEPOT_TYPES, name='Origin Depot Type'),
+                         columns=DEPOT_TYPES)
+    for odepottype, excluded in DEFAULT_EXCLUDED_DESTINATIONS.items():
+        rules.loc[odepottype, excluded] = 'Exclude'
+    return rules
+
+
+def read_transfer_rules(df):
+# =============================================================================
+#     Converts the 'Transfer Rules' Excel tab to the transfer rules matrix.
+#
+#     An 'Other' row and column are added (all 'Include') if the tab does not have them, so depot
+#     types missing from the tab keep all of their lanes. Raises a ValueError if a cell is not
+#     'Include' or 'Exclude'.
+# =============================================================================
+    rules = df.set_index('Origin Depot Type')
+    rules.index = rules.index.astype(str).str.strip()
+    rules.columns = rules.columns.astype(str).str.strip()
+    rules = rules.apply(lambda col: col.astype(str).str.strip().str.title())
+
+    if OTHER not in rules.index:
+        rules.loc[OTHER] = 'Include'
+    if OTHER not in rules.columns:
+        rules[OTHER] = 'Include'
+
+    bad = ~rules.isin(['Include', 'Exclude'])
+    if bad.to_numpy().any():
+        raise ValueError(f"'Transfer Rules' values must be 'Include' or 'Exclude'.\n{rules[bad.any(axis=1)]}")
+
+    return rules
+
+
+def apply_transfer_rules(rules, odepottypes, ddepottypes):
+# =============================================================================
+#     Returns the status ('Include' or 'Exclude') of each transfer lane, given its origin and
+#     destination depot types.
+#
+#     Both depot types are converted to integer positions in the matrix once, and the status of
+#     every lane is then read from the matrix in a single lookup.
+# =============================================================================
+    include = (rules.to_numpy() == 'Include')
+
+    o = rules.index.get_indexer(np.asarray(odepottypes, dtype=object))
+    d = rules.columns.get_indexer(np.asarray(ddepottypes, dtype=object))
+    o[o < 0] = rules.index.get_loc(OTHER)
+    d[d < 0] = rules.columns.get_loc(OTHER)
+
+    return np.where(include[o, d], 'Include', 'Exclude')
@@ -7,6 +7,7 @@ USER_NAME = 'graham.billey'     # Cosmic Frog Account Data
 APP_KEY = 'op_NWQ3YjQ0NjktNTBjOC00M2JkLWE4NWEtNjM1NDBmODA5ODEw'     # Cosmic Frog Account Data
 INPUT_DB_NAME = 'PECO_CurrentSOIP_Opt_2023-10'  # Opt Model Name
 OUTPUT_DB_NAME = 'PECO_CurrentSOIP_Opt_2023-10-final' # Opt Model Name
+ADDITIONAL_OUTPUT_DB_NAMES = []   # Other Opt Models to upload the same update to, e.g. a what-if copy.
 
 # SOIP Excel File Information
 SOIP_DEPOT_ASSIGNMENTS_FILENAME = 'SOIP - Depot Assignments - October.xlsx'
@@ -30,3 +31,85 @@ Avg_Load_Size_Transfers = 560
 Fuel_Surcharge = 0.55
 Duty_Rate_US_to_Canada = 5
 Duty_Rate_Canada_to_US = 5.6
+
+# Performance options.
+COMPACT_TABLES = True   # Store repeated names (customername, facilityname, etc.) as categoricals.
+
+# Closest depot ranking (Alteryx workflow 020).
+NEAREST_DEPOT_COUNT = 3   # Nearest open depots ranked per customer / return location. Ranks are
+                          # written to the 'depotrank' column if the policy tables have one.
+
+# Missing lane distances (Alteryx workflow 020).
+DISTANCE_CACHE_FILENAME = 'Lane Distances.csv'   # Great-circle lane distances, kept in the data folder.
+                                                 # Set to None to compute them on every run.
+ROAD_CIRCUITY_FACTOR = 1.2   # Road miles per straight-line mile, for lanes with no distance. 1 = straight line.
+
+# Lane candidate pruning. NewAllToAll lanes that are not in the SOIP plan are dropped unless they
+# are within the radius, or one of the nearest depots of their customer / return location. Set
+# both to None to keep every lane. MultiSource List and RenterDistSort lanes are always kept.
+LANE_PRUNING_RADIUS = None           # Miles, e.g. 1000 (lanes further away are never added to the model).
+LANE_PRUNING_NEAREST_DEPOTS = None   # Number of nearest open depots kept, e.g. 10. Keep it at least
+                                     # NEAREST_DEPOT_COUNT, so the closest depots do not change.
+
+# Historical lane costs (Alteryx workflow 060).
+LANE_STATS_FILENAME = 'Lane Statistics.csv'   # Monthly lane cost store, kept in the data folder. Set to
+                                              # None to pull every shipment in the window on each run.
+LANE_STATS_MONTHS_BACK = 3        # Months before the current month included in the cost per load.
+LANE_STATS_MONTH_WEIGHTS = None   # Optional weight per month, most recent first (e.g. [1, 1, 0.5, 0.5]).
+
+# Backend of the relational stages: 'pandas', or 'duckdb' to run the stage as SQL in an embedded
+# DuckDB database (needs the duckdb package; falls back to pandas if it is not installed).
+# Stages: '020' closest depot ranking, '060' cost per load, '090' multi-source flags.
+STAGE_BACKENDS = {'020': 'pandas', '060': 'pandas', '090': 'pandas'}
+
+# Input change report. If UPLOAD_CHANGED_TABLES_ONLY is True, each run saves a snapshot of its
+# inputs (row hashes) and of the tables it computed in the data folder, and writes a summary of the
+# inputs that changed since the previous run to the validation folder. Every table is still
+# recomputed in full, but only the Cosmic Frog tables whose contents changed are uploaded. Every
+# table is uploaded if there is no snapshot yet, or if OUTPUT_DB_NAME changed.
+UPLOAD_CHANGED_TABLES_ONLY = False
+INPUT_SNAPSHOT_FILENAME = 'Input Snapshot.pkl'
+
+# Scalar fast path. If SCALAR_FAST_PATH is True, each run keeps the tables it uploaded, and the
+# inputs of the stages that use the scalar parameters, in the data folder. If a later run in the
+# same month only has different scalar parameters (NewPalletCost, Fuel_Surcharge, Duty_Rate_*,
+# Avg_Load_Size_*), the same Excel files and an unchanged Cosmic Frog input model, it pulls no data
+# and runs no other stage: it only sets the columns those parameters are used for again, and
+# updates them in Cosmic Frog.
+SCALAR_FAST_PATH = False
+SCALAR_FAST_PATH_FILENAME = 'Scalar Fast Path.pkl'
+
+# Data pulled with "python soip_model_update_process.py --pull-only", for check_peak_memory.py and
+# benchmark_uploads.py.
+PULLED_DATA_FILENAME = 'Pulled Data.pkl'
+
+# Upload mode. 'replace' deletes and reloads every uploaded table. 'staged' loads every table into
+# a staging table first, then swaps them all in at once, so a failed upload leaves the model as it
+# was (each model is swapped on its own: with ADDITIONAL_OUTPUT_DB_NAMES, the models swapped before
+# a failure keep the new tables). 'delta' only sends the rows that are new or changed since the previous upload to each output
+# model, and deletes the rows that are gone; a table is replaced in full the first time, or if the
+# model was changed since.
+UPLOAD_MODE = 'replace'   # 'replace', 'staged' or 'delta'
+UPLOAD_FINGERPRINTS_FILENAME = 'Upload Fingerprints.pkl'
+
+# Number of tables to upload to Cosmic Frog at the same time, each over its own connection.
+UPLOAD_WORKERS = 4
+# Drop the uploaded tables' secondary indexes for the load and rebuild them after it ('replace' and
+# 'staged' upload modes). In 'replace' mode, their definitions are kept in a 'Dropped Indexes -
+# [Model].csv' file in the data folder until they are rebuilt, so an upload that is stopped before
+# that has them rebuilt by the next one. In 'staged' mode, they are dropped and rebuilt in the swap's
+# transaction.
+REBUILD_INDEXES = False
+# Check each uploaded table against a checksum of the table sent, computed by Postgres, before the
+# upload is committed (without downloading the table). A table that does not match is not changed.
+# Hashing every row on both sides makes large uploads noticeably slower.
+VERIFY_UPLOADS = False
+
+# Scenario sweep (run src/scenario_sweep.py). Runs the update once per row of the scenario table in
+# the data folder, each with its own parameter values (e.g. NewPalletCost), pulling the data once.
+SCENARIO_FILENAME = 'Scenarios.xlsx'
+SCENARIO_WORKERS = None   # Number of scenarios run at the same time. Each one loads its own copy of the
+                          # data. None: as many as fit in the available memory (up to the number of CPUs).
+
+# Memory check. Warn if the run's peak memory is above this multiple of the pulled tables' size.
+MAX_PEAK_MEMORY_MULTIPLE = 6